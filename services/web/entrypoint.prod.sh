@@ -20,4 +20,7 @@ then
     python manage.py make_shell_context
 fi
 
+# build the js and css bundles once, before the workers fork
+python manage.py assets build
+
 exec "$@"
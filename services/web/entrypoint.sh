@@ -17,4 +17,8 @@ echo "Database created."
 
 python manage.py seed_db
 
+python manage.py assets build
+
+echo "Static assets built."
+
 exec "$@"
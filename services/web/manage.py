@@ -1,4 +1,5 @@
 import click
+import time
 from flask.cli import FlaskGroup
 
 from project import app, db
@@ -11,11 +12,206 @@ cli = FlaskGroup(app)
 
 @cli.command("create_db")
 def create_db():
-    db.drop_all()
-    db.create_all()
+    # replicas follow the primary, only its tables are recreated
+    db.drop_all(bind=None)
+    db.create_all(bind=None)
     db.session.commit()
 
 
+@cli.command("migrate_db")
+@click.option("--to", "target_version", default=None, type=int, help="Stop after this schema version, defaults to the latest.")
+@click.option("--dry-run", is_flag=True, help="List the pending migrations without applying them.")
+def migrate_db(target_version, dry_run):
+    """Apply pending schema migrations, only ever adding to the schema."""
+    from project.schemamigrations import pending_migrations, migrate
+    migrations = pending_migrations(db.engine, target_version)
+    if not migrations:
+        click.echo('schema is up to date')
+        return
+    for migration in migrations:
+        click.echo('%s %s: %s' % ('pending' if dry_run else 'applying', migration.version, migration.name))
+        for column in migration.columns:
+            click.echo('    column %s.%s' % (column.table, column.name))
+        for column in migration.widened:
+            click.echo('    widen %s.%s' % (column.table, column.name))
+        for index in migration.indexes:
+            click.echo('    %s on %s (%s)' % (index.name, index.table, ', '.join(index.columns)))
+    if not dry_run:
+        migrate(db.engine, target_version)
+
+
+@cli.command("benchmark_query_plans")
+@click.option("--rows", default="1000,10000,100000", help="Comma separated document counts to seed.")
+@click.option("--database-url", required=True, help="Scratch postgres database, dropped and reseeded for every row count.")
+@click.option("--repeat", default=20, help="Runs of each query, the median is reported.")
+@click.option("--compare/--no-compare", default=True, help="Also measure before the index pack is applied.")
+@click.option("--plans", is_flag=True, help="Print the full plan of every query.")
+def benchmark_query_plans(rows, database_url, repeat, compare, plans):
+    """Show how the list and permission queries read their rows as the tables grow, before and after the index pack."""
+    from sqlalchemy import create_engine
+    from project.queryplans import benchmark_query_plans as run_benchmark
+    # every table of the scratch database is dropped, never point this at the app's own
+    if database_url == app.config['SQLALCHEMY_DATABASE_URI']:
+        raise click.BadParameter('refusing to reseed the application database', param_hint='--database-url')
+    engine = create_engine(database_url)
+    click.echo('rows      phase   query               access      median_ms')
+    for result in run_benchmark(engine, [int(row_count) for row_count in rows.split(',')], repeat, compare):
+        click.echo('%-8d  %-6s  %-18s  %-10s  %9.3f' % (result['rows'], result['phase'], result['query'], result['access'], result['ms']))
+        if plans:
+            click.echo('    %s' % result['plan'])
+
+
+@cli.command("db_pool_stats")
+def db_pool_stats():
+    """Pool size, checked out connections, overflow and checkout waits of every running worker."""
+    from project.dbpool import read_pool_stats, server_connections
+    click.echo('pool_size %s, max_overflow %s, timeout %ss, recycle %ss, statement_timeout %sms' % (
+        app.config['DATABASE_POOL_SIZE'],
+        app.config['DATABASE_MAX_OVERFLOW'],
+        app.config['DATABASE_POOL_TIMEOUT'],
+        app.config['DATABASE_POOL_RECYCLE'],
+        app.config['DATABASE_STATEMENT_TIMEOUT_MS']
+    ))
+    click.echo('pid       age_s  size  checked_out  overflow  checkouts  avg_wait_ms  max_wait_ms  timeouts')
+    for stats in read_pool_stats(app.config['DATABASE_POOL_STATS_DIR']):
+        checkouts = stats.get('checkouts', 0)
+        click.echo('%-8s  %5.0f  %4s  %11s  %8s  %9s  %11.2f  %11.2f  %8s' % (
+            stats['pid'],
+            time.time() - stats['written_on'],
+            stats.get('size', '-'),
+            stats.get('checked_out', '-'),
+            stats.get('overflow', '-'),
+            checkouts,
+            stats.get('wait_seconds', 0.0) * 1000 / checkouts if checkouts else 0.0,
+            stats.get('max_wait_seconds', 0.0) * 1000,
+            stats.get('timeouts', 0)
+        ))
+    # what the server sees, across every worker and command
+    connections = server_connections(db.engine)
+    if connections is not None:
+        click.echo('server connections: %s' % ', '.join('%s %s' % (state, count) for state, count in sorted(connections.items())))
+
+
+@cli.command("replica_routing")
+def replica_routing():
+    """Show where each kind of read is routed, e.g. with two local databases standing in for primary and replica."""
+    from flask import g, session
+    from sqlalchemy import text
+    from project.dbrouting import PIN_SESSION_KEY, replica_reads
+
+    def routed_database():
+        # the database a read of the current request goes to
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return db.session.execute(text('SELECT current_database()')).scalar()
+        return repr(db.session.get_bind().url)
+
+    scenarios = (
+        ('ordinary view', False, False, False),
+        ('read-only view', True, False, False),
+        ('read-only view after a write in the request', True, True, False),
+        ('read-only view of a user who just committed', True, False, True),
+    )
+    click.echo('replicas: %s' % (', '.join(app.config['SQLALCHEMY_BINDS'] or {}) or 'none'))
+    for name, read_only, wrote, pinned in scenarios:
+        with app.test_request_context('/'):
+            if wrote:
+                g.db_wrote = True
+            if pinned:
+                session[PIN_SESSION_KEY] = time.time() + app.config['DATABASE_REPLICA_PIN_SECONDS']
+            if read_only:
+                with replica_reads():
+                    database = routed_database()
+            else:
+                database = routed_database()
+            db.session.remove()
+        click.echo('%-45s  %s' % (name, database))
+
+
+@cli.command("check_edit_page_queries")
+@click.option("--document-id", default=None, type=int, help="Document to open, defaults to the first retained one.")
+@click.option("--max-queries", default=2, help="Fail when an edit page issues more queries than this.")
+def check_edit_page_queries(document_id, max_queries):
+    """Count the queries of a GET of both document edit pages, after identity loading, and fail above --max-queries."""
+    from flask_login import login_user
+    from flask_principal import Identity, identity_changed
+    from sqlalchemy import event
+    from werkzeug.exceptions import HTTPException
+    from project.models import Retention
+
+    retention_query = Retention.query.order_by(Retention.document_id)
+    if document_id is not None:
+        retention_query = retention_query.filter(Retention.document_id == document_id)
+    retention = retention_query.first()
+    if retention is None:
+        raise click.ClickException('no retained document to open')
+    # runs with the configured permission mode and identity cache, the same as tests/test_documentedit.py
+    over_budget = False
+    for endpoint, user_id in (('sponsor_bp.documentedit_sponsor', retention.sponsor_id), ('editor_bp.documentedit_editor', retention.editor_id)):
+        user = User.query.get(user_id) if user_id is not None else None
+        if user is None:
+            click.echo('%-30s  skipped, document has no such user' % endpoint)
+            continue
+        statements = []
+        def count_statement(connection, cursor, statement, parameters, context, executemany):
+            statements.append(' '.join(statement.split()))
+        with app.test_request_context('/'):
+            # the identity is loaded before counting, so only the page's own queries are counted
+            login_user(user)
+            identity_changed.send(app, identity=Identity(user.id, user.user_type))
+            event.listen(db.engine, 'before_cursor_execute', count_statement)
+            try:
+                app.view_functions[endpoint](document_id=str(retention.document_id))
+            except HTTPException as error:
+                raise click.ClickException('%s answered %s for user %s' % (endpoint, error.code, user.id))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count_statement)
+                db.session.remove()
+        click.echo('%-30s  %d queries' % (endpoint, len(statements)))
+        for statement in statements:
+            click.echo('    %s' % statement[:150])
+        over_budget = over_budget or len(statements) > max_queries
+    if over_budget:
+        raise click.ClickException('an edit page issued more than %d queries' % max_queries)
+
+
+@cli.command("reindex_search")
+@click.option("--batch-size", default=1000, help="Documents refreshed per transaction.")
+def reindex_search(batch_size):
+    """Rebuild the search text of every document, e.g. after migrate_db added the search column."""
+    from project.models import Document
+    from project.search import ensure_search_index, index_documents
+    ensure_search_index(db.engine)
+    last_id = db.session.query(db.func.max(Document.id)).scalar() or 0
+    # id ranges in short transactions, so writers are never blocked for the whole rebuild
+    for first_id in range(1, last_id + 1, batch_size):
+        index_documents(first_id, first_id + batch_size - 1)
+        db.session.commit()
+        click.echo('indexed documents %d to %d' % (first_id, min(first_id + batch_size - 1, last_id)))
+
+
+@cli.command("benchmark_search")
+@click.option("--user-id", required=True, type=int, help="Sponsor or editor whose documents are searched.")
+@click.option("--queries", default="report,contract,summary of the meeting", help="Comma separated search queries.")
+@click.option("--repeat", default=50, help="Runs of each query.")
+def benchmark_search(user_id, queries, repeat):
+    """p50 and p95 milliseconds of the first result page of each query, read-only against the configured database."""
+    from project.search import search_documents
+    from project.static.src.evaluation.autodoctiming import percentile
+    user = User.query.get(user_id)
+    if user is None or user.user_type not in ('sponsor', 'editor'):
+        raise click.BadParameter('not a sponsor or editor', param_hint='--user-id')
+    click.echo('query                           results       p50_ms       p95_ms')
+    for query in queries.split(','):
+        timings = []
+        for run in range(repeat):
+            start = time.perf_counter()
+            page = search_documents(user.id, user.user_type, query, page_size=app.config['SEARCH_PAGE_SIZE'])
+            timings.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+        timings.sort()
+        click.echo('%-30s  %7d  %11.2f  %11.2f' % (query[:30], len(page.items), percentile(timings, 0.5), percentile(timings, 0.95)))
+
+
 # previous command line control
 @cli.command("seed_db")
 def seed_db():
@@ -41,6 +237,395 @@ def seed_db():
     db.session.commit()
 
 
+@cli.command("model_stats")
+@click.option("--warmup/--no-warmup", default=True, help="Run a warmup generate after loading.")
+def model_stats(warmup):
+    """Load the autodoc model and report load time and resident memory."""
+    from project.static.src.models import modelregistry
+    # load (and optionally warm up) the configured model
+    handle = modelregistry.get_configured_handle(app.config)
+    if warmup:
+        modelregistry.warmup(handle)
+    # report what the registry measured
+    stats = modelregistry.registry_stats()
+    click.echo('pid %s, rss %.0fMB' % (stats['pid'], stats['rss_mb']))
+    for model_name, model_stats in stats['models'].items():
+        click.echo('%s: load %.2fs, warmup %s, rss %.0fMB -> %.0fMB' % (
+            model_name,
+            model_stats['load_seconds'],
+            '%.2fs' % model_stats['warmup_seconds'] if model_stats['warmup_seconds'] is not None else 'skipped',
+            model_stats['rss_before_mb'],
+            model_stats['rss_after_mb'],
+        ))
+
+
+@cli.command("autodoc_worker")
+@click.option("--once", is_flag=True, help="Drain the runnable jobs once and exit.")
+@click.option("--poll", default=2.0, help="Seconds to wait between polls when the queue is empty.")
+@click.option("--batch", default=20, help="Jobs claimed per poll.")
+def autodoc_worker(once, poll, batch):
+    """Run queued autodoc jobs in a separate worker process."""
+    from project.static.src.evaluation.autodocqueue import drain_jobs
+    while True:
+        # run pending, retryable and orphaned jobs
+        job_count = drain_jobs(app, limit=batch)
+        if job_count:
+            click.echo('ran %s autodoc jobs' % job_count)
+        if once and not job_count:
+            break
+        if not job_count:
+            time.sleep(poll)
+
+
+# prompts shared by the generation benchmarks
+BENCHMARK_PROMPTS = [
+    'The quarterly report shows that revenue grew in every region',
+    'Our new onboarding process helps editors review documents faster',
+    'This agreement describes the terms under which the sponsor',
+    'The committee met on Tuesday to discuss the annual budget',
+    'Machine generated summaries can save reviewers a lot of time',
+    'Please find attached the revised draft of the proposal',
+    'The research team collected samples from twelve locations',
+    'Customer feedback has been overwhelmingly positive since launch',
+]
+
+
+@cli.command("benchmark_batching")
+@click.option("--documents", default=16, help="Concurrent documents per run.")
+@click.option("--batch-sizes", default="1,2,4,8", help="Comma separated max batch sizes.")
+@click.option("--windows", default="0.02,0.05", help="Comma separated batching windows in seconds.")
+@click.option("--profile", default="quality", help="Beam search decoding profile to batch.")
+def benchmark_batching(documents, batch_sizes, windows, profile):
+    """Report autodoc throughput (docs/sec) against batch size and window on CPU."""
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    # keep the benchmark on CPU even on a box with a GPU
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    from project.static.src.models.modelregistry import get_configured_handle, warmup
+    from project.static.src.evaluation.autodocbatcher import GenerationBatcher
+    from project.static.src.evaluation.autodocwriter import profile_generate_kwargs
+
+    handle = warmup(get_configured_handle(app.config))
+    generate_kwargs = profile_generate_kwargs(app.config['AUTODOC_DECODING_PROFILES'][profile])
+    prompts = [handle.encode(BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)]) for i in range(documents)]
+
+    click.echo('batch_size  window_s  seconds  docs/sec  batches')
+    for window in [float(w) for w in windows.split(',')]:
+        for batch_size in [int(b) for b in batch_sizes.split(',')]:
+            # fresh batcher per setting so statistics are per run
+            batcher = GenerationBatcher(handle, window, batch_size, **generate_kwargs)
+            start = time.perf_counter()
+            # submit every document at once, as concurrent sponsors would
+            with ThreadPoolExecutor(max_workers=documents) as pool:
+                list(pool.map(batcher.generate, prompts))
+            seconds = time.perf_counter() - start
+            click.echo('%10d  %8.3f  %7.2f  %8.2f  %7d' % (batch_size, window, seconds, documents / seconds, batcher.batches_run))
+
+
+@cli.command("autodoc_cache_stats")
+def autodoc_cache_stats():
+    """Report the persistent autodoc cache size and this process's cache counters."""
+    from project.static.data.processeddata.autodocsmodels import AutodocCacheEntry
+    from project.static.src.evaluation.autodoccache import cache_stats
+    click.echo('table entries: %s' % AutodocCacheEntry.query.count())
+    for name, value in sorted(cache_stats().items()):
+        click.echo('%s: %s' % (name, value))
+
+
+@cli.command("backfill_autodocs")
+@click.option("--outdated", is_flag=True, help="Also regenerate documents whose latest autodoc came from another model or version.")
+@click.option("--workers", default=2, help="Generation processes, each loads its own model.")
+@click.option("--chunk-size", default=20, help="Documents per worker task and per commit.")
+@click.option("--profile", default=None, help="Decoding profile, defaults to AUTODOC_DECODING_PROFILE.")
+@click.option("--checkpoint", default="backfill_autodocs.json", help="Progress file, an interrupted run resumes from it.")
+@click.option("--limit", default=0, help="Stop after this many documents, 0 for all.")
+def backfill_autodocs(outdated, workers, chunk_size, profile, checkpoint, limit):
+    """Generate autodocs in bulk for documents without one, resuming from the checkpoint."""
+    import functools
+    import itertools
+    import multiprocessing
+    import os
+    from project.static.src.models.modelregistry import model_identity
+    from project.static.src.evaluation.autodocwriter import autodocadd
+    from project.static.src.evaluation import autodocbackfill
+
+    profile = profile or app.config['AUTODOC_DECODING_PROFILE']
+    # a checkpoint only applies to a run selecting and generating the same way
+    run_key = '%s:%s:%s' % (model_identity(app.config), profile, 'outdated' if outdated else 'missing')
+    after_document_id, failed_document_ids = autodocbackfill.read_checkpoint(checkpoint, run_key)
+    query = autodocbackfill.backfill_query(outdated)
+    # documents that failed before the checkpoint and still need an autodoc are retried first
+    failed_document_ids = set(autodocbackfill.still_selected(query, failed_document_ids))
+    if after_document_id:
+        click.echo('resuming after document %s, retrying %s failed documents' % (after_document_id, len(failed_document_ids)))
+
+    chunks = itertools.chain(
+        autodocbackfill.retry_chunks(query, failed_document_ids, chunk_size),
+        autodocbackfill.document_chunks(query, after_document_id, chunk_size)
+    )
+    if limit:
+        chunks = itertools.islice(chunks, (limit + chunk_size - 1) // chunk_size)
+
+    # spawn, so every worker imports the ML stack fresh instead of inheriting a forked session
+    context = multiprocessing.get_context('spawn')
+    generate_chunk = functools.partial(autodocbackfill.generate_chunk, profile_name=profile)
+    # documents_done only counts committed autodocs, failures are retried and never counted as done
+    documents_done = 0
+    documents_failed = 0
+    last_document_id = after_document_id
+    start = time.perf_counter()
+    with context.Pool(workers) as pool:
+        while True:
+            # read and tokenize the next chunks here, the database session belongs to this thread
+            batch = list(itertools.islice(chunks, workers))
+            if not batch:
+                break
+            # chunks come back in order, so the checkpoint always follows committed work
+            for chunk, results in zip(batch, pool.imap(generate_chunk, batch)):
+                for document_id, result, error in results:
+                    if error is not None:
+                        documents_failed += 1
+                        failed_document_ids.add(document_id)
+                        click.echo('document %s failed: %s' % (document_id, error))
+                        continue
+                    autodocadd(document_id, result)
+                    failed_document_ids.discard(document_id)
+                    documents_done += 1
+                db.session.commit()
+                # retried chunks lie before the checkpoint, only new documents move it on
+                last_document_id = max(last_document_id, chunk[-1][0])
+                autodocbackfill.write_checkpoint(checkpoint, run_key, last_document_id, documents_done, failed_document_ids)
+                seconds = time.perf_counter() - start
+                click.echo('%s documents, %s failed, %.2f docs/sec, last document %s' % (
+                    documents_done, documents_failed, documents_done / seconds, last_document_id))
+
+    # a finished run starts from scratch next time, which selects the documents that failed again
+    # a run stopped by --limit keeps its checkpoint, and the failed ids in it are retried on resume
+    if not limit and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    seconds = time.perf_counter() - start
+    click.echo('backfilled %s documents (%s failed) in %.1fs, %.2f docs/sec' % (
+        documents_done, documents_failed, seconds, documents_done / seconds if seconds else 0.0))
+
+
+@cli.command("autodoc_timings")
+@click.option("--hours", default=24, help="Report timings recorded in the last this many hours.")
+@click.option("--profile", default=None, help="Only generations with this decoding profile.")
+def autodoc_timings(hours, profile):
+    """Report p50/p95/p99 seconds per generation stage from the autodoctimings table."""
+    from project.static.src.evaluation.autodoctiming import stage_percentiles
+    click.echo('stage            count     p50_s     p95_s     p99_s     max_s')
+    for row in stage_percentiles(hours, profile):
+        click.echo('%-15s  %5d  %8.3f  %8.3f  %8.3f  %8.3f' % (row['stage'], row['count'], row['p50'], row['p95'], row['p99'], row['max']))
+
+
+def benchmark_backend(backend, model_name, onnx_path, new_tokens):
+    """Load one backend in a fresh process and measure load time, memory and tokens/sec."""
+    from project.static.src.models import modelregistry
+    handle = modelregistry.get_handle(model_name, backend, {'onnx_path': onnx_path})
+    modelregistry.warmup(handle)
+    prompts = [handle.encode(prompt) for prompt in BENCHMARK_PROMPTS]
+    # greedy decoding, so every backend does the same amount of work per token
+    start = time.perf_counter()
+    generated_tokens = 0
+    for token_ids in prompts:
+        output = handle.generate([token_ids], max_length=len(token_ids) + new_tokens, num_beams=1)
+        generated_tokens += len(output[0]) - len(token_ids)
+    seconds = time.perf_counter() - start
+    return {
+        'load_seconds': handle.load_seconds,
+        'rss_mb': handle.rss_after_mb - handle.rss_before_mb,
+        'tokens_per_second': generated_tokens / seconds,
+    }
+
+
+@cli.command("benchmark_backends")
+@click.option("--backends", default="tensorflow,pytorch,onnx,stub", help="Comma separated backends.")
+@click.option("--new-tokens", default=32, help="Tokens generated per prompt.")
+def benchmark_backends(backends, new_tokens):
+    """Compare load time, memory and tokens/sec of each inference backend on the same prompts."""
+    import multiprocessing
+    # one fresh process per backend so memory and import costs do not leak between runs
+    context = multiprocessing.get_context('spawn')
+    click.echo('backend     load_s  model_rss_mb  tokens/sec')
+    for backend in backends.split(','):
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(benchmark_backend, (backend, app.config['AUTODOC_MODEL_NAME'], app.config['AUTODOC_ONNX_PATH'], new_tokens))
+            except Exception as error:
+                click.echo('%-10s  failed: %r' % (backend, error))
+                continue
+        click.echo('%-10s  %6.2f  %12.0f  %10.1f' % (backend, result['load_seconds'], result['rss_mb'], result['tokens_per_second']))
+
+
+@cli.command("export_onnx")
+def export_onnx():
+    """Export the configured GPT2 head model to AUTODOC_ONNX_PATH for the onnx backend."""
+    import os
+    from project.static.src.models.backends import export_onnx as export_onnx_graph
+    os.makedirs(os.path.dirname(app.config['AUTODOC_ONNX_PATH']), exist_ok=True)
+    click.echo('exported %s' % export_onnx_graph(app.config['AUTODOC_MODEL_NAME'], app.config['AUTODOC_ONNX_PATH']))
+
+
+@cli.command("export_model")
+@click.option("--version", required=True, help="Artifact version, pin it with AUTODOC_MODEL_VERSION.")
+@click.option("--backend", default="tensorflow", type=click.Choice(["tensorflow", "pytorch"]), help="Framework whose weight layout is exported.")
+def export_model(version, backend):
+    """Export the configured GPT2 head model into the local model store as a checksummed artifact."""
+    from project.static.mlmodels.seedmlmodels.headmodel import export_artifact
+    target_dir = export_artifact(app.config['AUTODOC_MODEL_NAME'], version, app.config['AUTODOC_MODEL_STORE'], backend)
+    click.echo('exported %s' % target_dir)
+
+
+@cli.command("model_server")
+@click.option("--url", default=None, help="Address to listen on, defaults to AUTODOC_MODEL_SERVER_URL.")
+@click.option("--warmup/--no-warmup", default=True, help="Run a warmup generate before serving.")
+def model_server(url, warmup):
+    """Serve autodoc generation for web workers running with AUTODOC_INFERENCE_MODE=remote."""
+    from project.static.src.models.modelserver import serve
+    serve(app, url or app.config['AUTODOC_MODEL_SERVER_URL'], warmup)
+
+
+def benchmark_worker_rss(mode, prompt, profile_name):
+    """Generate one autodoc in a fresh process in the given inference mode and report its memory."""
+    from project.static.src.models.modelregistry import get_tokenizer, resident_memory_mb
+    from project.static.src.evaluation.autodocwriter import autodocgenerate
+    app.config['AUTODOC_INFERENCE_MODE'] = mode
+    # a cache hit would skip the model entirely
+    app.config['AUTODOC_CACHE_ENABLED'] = False
+    with app.app_context():
+        rss_before_mb = resident_memory_mb()
+        token_ids = get_tokenizer(app.config).encode(prompt)
+        start = time.perf_counter()
+        autodocgenerate([token_ids], profile_name)
+        return {
+            'rss_before_mb': rss_before_mb,
+            'rss_mb': resident_memory_mb(),
+            'seconds': time.perf_counter() - start,
+        }
+
+
+@cli.command("benchmark_worker_memory")
+@click.option("--workers", default=4, help="Simulated web worker processes per mode.")
+@click.option("--modes", default="local,remote", help="Comma separated inference modes.")
+@click.option("--profile", default="fast", help="Decoding profile each worker generates with.")
+def benchmark_worker_memory(workers, modes, profile):
+    """Report resident memory per web worker with in-process and model server generation."""
+    import multiprocessing
+    import os
+    import subprocess
+    import sys
+    from project.static.src.models.backends import BACKENDS
+    from project.static.src.models.modelclient import ModelServerClient, ModelServerError
+    context = multiprocessing.get_context('spawn')
+    url = app.config['AUTODOC_MODEL_SERVER_URL']
+
+    # local workers only share weights a pinned artifact maps in place, otherwise each holds its own copy
+    backend = app.config['AUTODOC_BACKEND']
+    if app.config['AUTODOC_MODEL_VERSION'] and BACKENDS[backend].shares_artifact_weights:
+        click.echo('backend %s: local workers share the mapped artifact weights, total_rss_mb counts them once per worker' % backend)
+    else:
+        click.echo('backend %s: every local worker holds a private copy of the weights' % backend)
+    click.echo('mode     workers  worker_rss_mb  total_rss_mb  first_gen_s')
+    for mode in modes.split(','):
+        server = None
+        server_rss_mb = 0
+        if mode == 'remote':
+            # start a model server for the run and wait until its model is loaded
+            server = subprocess.Popen([sys.executable, 'manage.py', 'model_server', '--url', url], cwd=os.path.dirname(os.path.abspath(__file__)))
+            client = ModelServerClient(url, timeout=5)
+            for attempt in range(300):
+                try:
+                    client.health()
+                    break
+                except ModelServerError:
+                    time.sleep(1)
+        try:
+            # one single-process pool per simulated worker, so no process serves two of them
+            pools = [context.Pool(1) for worker in range(workers)]
+            pending = [pool.apply_async(benchmark_worker_rss, (mode, BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)], profile)) for i, pool in enumerate(pools)]
+            results = [result.get() for result in pending]
+            for pool in pools:
+                pool.terminate()
+            if server is not None:
+                server_rss_mb = client.health()['rss_mb']
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        worker_rss_mb = sum(result['rss_mb'] for result in results) / len(results)
+        click.echo('%-7s  %7d  %13.0f  %12.0f  %11.2f' % (
+            mode, workers, worker_rss_mb, worker_rss_mb * workers + server_rss_mb,
+            max(result['seconds'] for result in results)))
+        if server is not None:
+            click.echo('         model server rss %.0fMB' % server_rss_mb)
+
+
+# run in a fresh interpreter by profile_startup, prints one line of json
+STARTUP_PROFILE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from project import app
+imported = time.perf_counter()
+response = app.test_client().get('/login')
+first_request = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'first_request_seconds': first_request - imported,
+    'status_code': response.status_code,
+    'ml_modules': sorted(name for name in ('tensorflow', 'torch', 'transformers', 'onnxruntime', 'numpy') if name in sys.modules),
+}))
+"""
+
+
+@cli.command("profile_startup")
+@click.option("--top", default=15, help="Number of slowest imports to list.")
+@click.option("--max-seconds", default=0.0, help="Fail if import plus first request takes longer than this.")
+@click.option("--fail-on-ml-import", is_flag=True, help="Fail if the ML stack is imported before any generation.")
+def profile_startup(top, max_seconds, fail_on_ml_import):
+    """Report per-module import time and time-to-first-request of a fresh app process."""
+    import json
+    import os
+    import subprocess
+    import sys
+    # a fresh interpreter, so nothing imported by this cli process hides the cost
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_PROFILE_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        click.echo(completed.stderr)
+        raise SystemExit(completed.returncode)
+
+    # -X importtime lines look like "import time:  self [us] | cumulative | module"
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative_us), int(self_us), module.rstrip()))
+    imports.sort(reverse=True)
+
+    click.echo('cumulative_ms  self_ms  module')
+    for cumulative_us, self_us, module in imports[:top]:
+        click.echo('%13.1f  %7.1f  %s' % (cumulative_us / 1000, self_us / 1000, module))
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    total_seconds = result['import_seconds'] + result['first_request_seconds']
+    click.echo('import %.3fs, first request %.3fs (status %s), total %.3fs' % (
+        result['import_seconds'], result['first_request_seconds'], result['status_code'], total_seconds))
+    click.echo('ml modules imported at startup: %s' % (', '.join(result['ml_modules']) or 'none'))
+
+    # non-zero exit so a regression fails a ci step
+    if fail_on_ml_import and result['ml_modules']:
+        raise SystemExit(1)
+    if max_seconds and total_seconds > max_seconds:
+        raise SystemExit(1)
+
+
 @cli.command("test_message")
 def test_message():
 	click.echo('hey this is a test message, thanks for reading!')
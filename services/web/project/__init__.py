@@ -12,14 +12,16 @@ from .assets import compile_static_assets
 from flask_principal import identity_loaded, Principal, Permission, UserNeed, RoleNeed
 # individual document access permission
 from .principalmanager import EditDocumentNeed
+# session which sends the reads of read-only views to a replica
+from .dbrouting import RoutingSQLAlchemy, init_replica_routing, replica_keys
 
 # for printing to console, importing from path
 import sys
 
 port = int(os.environ.get("PORT", 5000))
 
-# activate SQLAlchemy
-db = SQLAlchemy()
+# activate SQLAlchemy, with read-only views routed to a replica when one is configured
+db = RoutingSQLAlchemy()
 # set login manager name from flask_login
 login_manager = LoginManager()
 
@@ -90,11 +92,33 @@ def create_app():
         # import autodocs and revisions model class
         from project.static.data.processeddata import autodocsmodels
 
-        # Create Database Models
-        db.create_all()
+        # guard the connection pool across forks and publish its stats
+        from .dbpool import instrument_engine
+        instrument_engine(db.engine, app.config)
+        for replica_key in replica_keys(app):
+            instrument_engine(db.get_engine(app, bind=replica_key), app.config, publish_stats=False)
+        # users who just wrote read from the primary
+        init_replica_routing(app)
+
+        # Create Database Models, on the primary only
+        db.create_all(bind=None)
+        # sqlite keeps document search in its own fts5 table
+        from .search import ensure_search_index
+        ensure_search_index(db.engine)
 
         # Compile static assets
         compile_static_assets(assets)
+
+        # fail at boot, not on the first autodoc, when the configured backend cannot load here
+        if app.config['AUTODOC_INFERENCE_MODE'] == 'local':
+            from project.static.src.models.backends import check_backend
+            check_backend(app.config['AUTODOC_BACKEND'])
+
+        # load and warm up the autodoc model at worker boot, if configured
+        # with a model server the model lives there, not in the web worker
+        if app.config['AUTODOC_MODEL_WARMUP'] and app.config['AUTODOC_INFERENCE_MODE'] == 'local':
+            from project.static.src.models.modelregistry import get_configured_handle, warmup
+            warmup(get_configured_handle(app.config))
       
     return app
 
@@ -118,13 +142,12 @@ def on_identity_loaded(sender, identity):
     # ensure current_user has attribute identity "id"
     if hasattr(current_user, 'id'):
         # specifically, need to have current_user.id
-        # Query user type given user.id
-        # printing the fact that we are querying db
-        print('Querying Database for user_type!', file=sys.stderr)
-        current_user_type = User.query.filter(User.id==current_user.id)[0].user_type
-
-        print('Querying Database for user_status!', file=sys.stderr)
-        current_user_status = User.query.filter(User.id==current_user.id)[0].user_status
+        # user type, status and document ids come from the identity cache, queried only on a miss
+        cached = cached_identity(current_user.id)
+        if cached is None:
+            return
+        current_user_type = cached.user_type
+        current_user_status = cached.user_status
 
         # print userid to console
         print('Providing ID: ',current_user.id,' ...to Identity', file=sys.stderr)
@@ -158,42 +181,15 @@ def on_identity_loaded(sender, identity):
         if current_user_type == 'sponsor':
             # add sponsor_role, RoleNeed to needs
             needs.append(sponsor_role)
-            # query user's documents, filter documents by current sponsor user
-            # printing the fact that we are querying db
-            print('Querying Database for document_ids!', file=sys.stderr)
-            document_objects = db.session.query(Retention.sponsor_id,User.id,Retention.document_id,).join(Retention, User.id==Retention.sponsor_id).join(Document, Document.id==Retention.document_id).order_by(Retention.sponsor_id).filter(Retention.sponsor_id == current_user.id)
-            # get a count of the document objects
-            document_count = document_objects.count()
-            # blank list to fill with documentid's
-            document_id_list=[]
-            # loop through document objects to generate filled document_id_list
-            for counter in range(0,document_count):
-                # loop through document objects and append to list
-                document_id_list.append(document_objects[counter].document_id)
-                # provide the need mapping to the document for each document
-                identity.provides.add(EditDocumentNeed(str(document_objects[counter].document_id)))
-            # after for loop, show document id's appended to needs
-            print('appended document_ids to needs : ',document_id_list, file=sys.stderr)
         # if current_user_type is editor
         elif current_user_type == 'editor':
             # add editor_role, RoleNeed to needs
             needs.append(editor_role)
-            # query user's documents, filter documents by current sponsor user
-            # printing the fact that we are querying db
-            print('Querying Database for document_ids!', file=sys.stderr)
-            document_objects = db.session.query(Retention.editor_id,User.id,Retention.document_id,).join(Retention, User.id==Retention.editor_id).join(Document, Document.id==Retention.document_id).order_by(Retention.editor_id).filter(Retention.editor_id == current_user.id)
-            # get a count of the document objects
-            document_count = document_objects.count()
-            # blank list to fill with documentid's
-            document_id_list=[]
-            # loop through document objects to generate filled document_id_list
-            for counter in range(0,document_count):
-                # loop through document objects and append to list
-                document_id_list.append(document_objects[counter].document_id)
-                # provide the need mapping to the document for each document
-                identity.provides.add(EditDocumentNeed(str(document_objects[counter].document_id)))
-            # after for loop, show document id's appended to needs
-            print('appended document_ids to needs : ',document_id_list, file=sys.stderr)
+
+        # provide the need mapping to the document for each retained document
+        for document_id in cached.document_ids:
+            identity.provides.add(EditDocumentNeed(str(document_id)))
+        print('appended document_ids to needs : ',list(cached.document_ids), file=sys.stderr)
 
         # print everything appended to needs, documents and others
         print('appended to needs : ',needs, file=sys.stderr)
@@ -206,6 +202,8 @@ def on_identity_loaded(sender, identity):
 # create shell context processor
 from .models import db, Document, User, Retention
 from project.static.data.processeddata.autodocsmodels import Autodoc, Revision
+# cached roles, status and document needs of each user
+from .identitycache import cached_identity
 # python shell context processor
 @app.shell_context_processor
 def make_shell_context():
@@ -1,4 +1,5 @@
 import os
+import tempfile
 # import os tools
 from os import environ, path
 # from dotenv import load_dotenv
@@ -11,6 +12,23 @@ ASSETS_DEBUG = False
 # tell Flask to build our bundles of assets when Flask starts up
 ASSETS_AUTO_BUILD = True
 
+def database_engine_options(database_uri, pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping, statement_timeout_ms):
+    # pool and timeout settings for postgres, other databases keep the Flask-SQLAlchemy defaults
+    if not database_uri.startswith('postgres'):
+        return {}
+    # imported here, so reading the Config does not need sqlalchemy
+    from project.dbpool import TimedQueuePool
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pool_pre_ping,
+        # the server cancels any statement running longer than this, 0 for no limit
+        'connect_args': {'options': '-c statement_timeout=%d' % statement_timeout_ms},
+    }
+
 # environment specific configuration variables
 class Config(object):
 
@@ -30,3 +48,175 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
 
+    # Database Connection Pool
+    # gunicorn worker processes (gunicorn reads WEB_CONCURRENCY too) and threads per worker
+    WEB_WORKERS = int(environ.get('WEB_CONCURRENCY', 1))
+    WEB_THREADS = int(environ.get('WEB_THREADS', 1))
+    # connections postgres gives this app, shared by every worker, keep it under max_connections
+    DATABASE_MAX_CONNECTIONS = int(environ.get('DATABASE_MAX_CONNECTIONS', 80))
+    # connections kept open per worker: one per request thread plus one for the background autodoc queue
+    DATABASE_POOL_SIZE = int(environ.get('DATABASE_POOL_SIZE', max(1, min(WEB_THREADS + 1, DATABASE_MAX_CONNECTIONS // WEB_WORKERS))))
+    # extra connections per worker under bursts, within what is left of the worker's share
+    DATABASE_MAX_OVERFLOW = int(environ.get('DATABASE_MAX_OVERFLOW', max(0, min(DATABASE_POOL_SIZE, DATABASE_MAX_CONNECTIONS // WEB_WORKERS - DATABASE_POOL_SIZE))))
+    # seconds a request waits for a free connection before failing
+    DATABASE_POOL_TIMEOUT = float(environ.get('DATABASE_POOL_TIMEOUT', 10))
+    # reconnect connections older than this many seconds, and test each one on checkout so postgres restarts are survived
+    DATABASE_POOL_RECYCLE = int(environ.get('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = environ.get('DATABASE_POOL_PRE_PING', 'true').lower() == 'true'
+    # server-side statement_timeout of every connection, in milliseconds
+    DATABASE_STATEMENT_TIMEOUT_MS = int(environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 30000))
+    SQLALCHEMY_ENGINE_OPTIONS = database_engine_options(
+        SQLALCHEMY_DATABASE_URI,
+        DATABASE_POOL_SIZE,
+        DATABASE_MAX_OVERFLOW,
+        DATABASE_POOL_TIMEOUT,
+        DATABASE_POOL_RECYCLE,
+        DATABASE_POOL_PRE_PING,
+        DATABASE_STATEMENT_TIMEOUT_MS
+    )
+    # Read Replicas
+    # comma separated replica urls, the GET requests of read-only views read from one of them, empty for none
+    DATABASE_REPLICA_URLS = [url for url in environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    # each replica is a bind without tables, create_all never touches it
+    SQLALCHEMY_BINDS = {'replica%d' % index: url for index, url in enumerate(DATABASE_REPLICA_URLS)}
+    # after committing, a user reads from the primary for this many seconds, keep it above the replication lag
+    DATABASE_REPLICA_PIN_SECONDS = float(environ.get('DATABASE_REPLICA_PIN_SECONDS', 5))
+    # every worker writes its pool stats here for manage.py db_pool_stats, empty to turn off
+    DATABASE_POOL_STATS_DIR = environ.get('DATABASE_POOL_STATS_DIR', os.path.join(tempfile.gettempdir(), 'dbpool-stats'))
+    DATABASE_POOL_STATS_SECONDS = float(environ.get('DATABASE_POOL_STATS_SECONDS', 5))
+
+    # rows per page of the keyset paginated document and user lists
+    LIST_PAGE_SIZE = int(environ.get('LIST_PAGE_SIZE', 50))
+    # postgres text search configuration for stemming document search
+    SEARCH_TEXT_CONFIG = environ.get('SEARCH_TEXT_CONFIG', 'english')
+    # results per page of document search
+    SEARCH_PAGE_SIZE = int(environ.get('SEARCH_PAGE_SIZE', 20))
+
+    # Principal Identity Cache
+    # roles, status and document needs of each user, cached per worker process
+    IDENTITY_CACHE_SIZE = int(environ.get('IDENTITY_CACHE_SIZE', 1024))
+    # seconds a cached identity is trusted, also how long other workers can see a changed identity, 0 disables caching
+    IDENTITY_CACHE_SECONDS = float(environ.get('IDENTITY_CACHE_SECONDS', 30))
+    # also share cached identities between workers through the identitycache table,
+    # each in-memory hit then checks the shared row, so an invalidation reaches every worker on its next request
+    IDENTITY_CACHE_DB = environ.get('IDENTITY_CACHE_DB', 'false').lower() == 'true'
+    # how EditDocumentPermission is checked: 'lookup' queries retentions for the one document a route needs,
+    # 'needs' loads every retained document id onto the identity on each request
+    DOCUMENT_PERMISSION_MODE = environ.get('DOCUMENT_PERMISSION_MODE', 'lookup')
+
+    # Autodoc Model Registry
+    # model name handed to from_pretrained, loaded once per worker process
+    AUTODOC_MODEL_NAME = environ.get('AUTODOC_MODEL_NAME', 'gpt2')
+    # local model store, and the artifact version this deployment is pinned to
+    # when a version is set, models and tokenizers load from the store only, fully offline
+    # only the pytorch backend uses the memory-mapped weights in place, so its workers share one copy,
+    # tensorflow copies them into every worker's variables
+    # kept outside the static folder, which Flask serves to anyone
+    AUTODOC_MODEL_STORE = environ.get('AUTODOC_MODEL_STORE', os.path.join(os.path.dirname(basedir), 'models', 'store'))
+    AUTODOC_MODEL_VERSION = environ.get('AUTODOC_MODEL_VERSION')
+    # inference backend: 'tensorflow', 'pytorch', 'onnx' or 'stub' (deterministic, no download, for tests)
+    # pytorch and onnx need requirements-backends.txt, checked when the app starts
+    AUTODOC_BACKEND = environ.get('AUTODOC_BACKEND', 'tensorflow')
+    # graph written by manage.py export_onnx, used by the 'onnx' backend
+    AUTODOC_ONNX_PATH = environ.get('AUTODOC_ONNX_PATH', os.path.join(os.path.dirname(basedir), 'models', 'onnx', 'gpt2.onnx'))
+    # run one short generate when each worker boots so the first request skips graph building
+    AUTODOC_MODEL_WARMUP = environ.get('AUTODOC_MODEL_WARMUP', 'false').lower() == 'true'
+
+    # Autodoc Model Server
+    # 'local' generates inside each web worker, 'remote' hands generation to manage.py model_server,
+    # which owns the only copy of the model, web workers then load just the tokenizer
+    AUTODOC_INFERENCE_MODE = environ.get('AUTODOC_INFERENCE_MODE', 'local')
+    # loopback http address, or unix:///path/to/socket
+    AUTODOC_MODEL_SERVER_URL = environ.get('AUTODOC_MODEL_SERVER_URL', 'http://127.0.0.1:5001')
+    # socket timeout of one call, longer than the slowest profile deadline plus its fallback
+    AUTODOC_MODEL_SERVER_TIMEOUT = float(environ.get('AUTODOC_MODEL_SERVER_TIMEOUT', 60))
+    # seconds a passed health check is trusted before the server is checked again
+    AUTODOC_MODEL_SERVER_HEALTH_SECONDS = float(environ.get('AUTODOC_MODEL_SERVER_HEALTH_SECONDS', 10))
+
+    # Autodoc Job Queue
+    # 'thread' runs jobs on an in-process pool, 'inline' runs them in the request (tests),
+    # 'external' leaves them for manage.py autodoc_worker
+    AUTODOC_QUEUE_MODE = environ.get('AUTODOC_QUEUE_MODE', 'thread')
+    AUTODOC_QUEUE_WORKERS = int(environ.get('AUTODOC_QUEUE_WORKERS', 1))
+    # failed jobs are retried until they have been attempted this many times
+    AUTODOC_JOB_MAX_ATTEMPTS = int(environ.get('AUTODOC_JOB_MAX_ATTEMPTS', 3))
+    AUTODOC_JOB_RETRY_SECONDS = float(environ.get('AUTODOC_JOB_RETRY_SECONDS', 5))
+    # running jobs not updated for this long are assumed orphaned by a dead worker
+    AUTODOC_JOB_STALE_SECONDS = int(environ.get('AUTODOC_JOB_STALE_SECONDS', 900))
+
+    # Autodoc Micro-Batching
+    # collect concurrent generations for a short window and run them as one batch,
+    # only useful with AUTODOC_QUEUE_WORKERS > 1 or several worker threads
+    AUTODOC_BATCH_ENABLED = environ.get('AUTODOC_BATCH_ENABLED', 'false').lower() == 'true'
+    AUTODOC_BATCH_WINDOW_SECONDS = float(environ.get('AUTODOC_BATCH_WINDOW_SECONDS', 0.03))
+    AUTODOC_BATCH_MAX_SIZE = int(environ.get('AUTODOC_BATCH_MAX_SIZE', 8))
+
+    # Autodoc Generation Cache
+    # reuse generated text for identical prompts, model and decoding parameters
+    AUTODOC_CACHE_ENABLED = environ.get('AUTODOC_CACHE_ENABLED', 'true').lower() == 'true'
+    # entries kept in the per-process LRU tier
+    AUTODOC_CACHE_SIZE = int(environ.get('AUTODOC_CACHE_SIZE', 1024))
+    # also keep entries in the autodoccache table so they survive restarts
+    AUTODOC_CACHE_DB = environ.get('AUTODOC_CACHE_DB', 'true').lower() == 'true'
+
+    # Autodoc Prompt Window
+    # long bodies are cut down to a token budget so generation cost does not grow with the document,
+    # 'tail' keeps the last tokens, 'lead_tail' keeps the lead sentence plus the tail
+    AUTODOC_PROMPT_MAX_TOKENS = int(environ.get('AUTODOC_PROMPT_MAX_TOKENS', 256))
+    AUTODOC_PROMPT_WINDOW = environ.get('AUTODOC_PROMPT_WINDOW', 'lead_tail')
+    # longest lead sentence kept by 'lead_tail', a longer first sentence is dropped
+    AUTODOC_PROMPT_LEAD_MAX_TOKENS = int(environ.get('AUTODOC_PROMPT_LEAD_MAX_TOKENS', 64))
+    # positions the model can attend to, prompt plus max_new_tokens never exceeds it
+    AUTODOC_MODEL_CONTEXT_TOKENS = int(environ.get('AUTODOC_MODEL_CONTEXT_TOKENS', 1024))
+
+    # Autodoc Decoding Profiles
+    # max_new_tokens is reserved on top of the prompt window, whatever the document size
+    # 'greedy' and 'sample' profiles decode token by token and keep the partial output at the deadline,
+    # 'beam' profiles run model.generate and switch to their fallback profile when the deadline passes
+    AUTODOC_DECODING_PROFILES = {
+        'fast': {
+            'strategy': 'greedy',
+            'max_new_tokens': 64,
+            'no_repeat_ngram_size': 4,
+            'deadline_seconds': 5.0,
+            'fallback': None,
+        },
+        'balanced': {
+            'strategy': 'beam',
+            'max_new_tokens': 64,
+            'num_beams': 2,
+            'no_repeat_ngram_size': 4,
+            'early_stopping': True,
+            'deadline_seconds': 10.0,
+            'fallback': 'fast',
+        },
+        'quality': {
+            'strategy': 'beam',
+            'max_new_tokens': 64,
+            'num_beams': 5,
+            'no_repeat_ngram_size': 4,
+            'early_stopping': True,
+            'deadline_seconds': 30.0,
+            'fallback': 'fast',
+        },
+    }
+    # sequences kept from one beam search, saved as sibling autodocs to pick from, 1 keeps only the best
+    AUTODOC_CANDIDATES = int(environ.get('AUTODOC_CANDIDATES', 1))
+    # profile used when a call does not name one
+    AUTODOC_DECODING_PROFILE = environ.get('AUTODOC_DECODING_PROFILE', 'quality')
+    # threads running deadline-bound beam searches, on backends which cannot stop at the deadline
+    # a missed search keeps its thread until it finishes and later beam requests go straight to the fallback
+    AUTODOC_DEADLINE_THREADS = int(environ.get('AUTODOC_DEADLINE_THREADS', 2))
+    # token by token profile used by the autodoc stream endpoints
+    AUTODOC_STREAM_PROFILE = environ.get('AUTODOC_STREAM_PROFILE', 'fast')
+
+    # Autodoc Timings
+    # per-stage generation timings: 'db' (autodoctimings table), 'log' (json lines on stderr), 'both' or 'off'
+    AUTODOC_TIMINGS = environ.get('AUTODOC_TIMINGS', 'db')
+
+    # Autodoc Regeneration on Edits
+    # regenerate when at least this fraction of the body's tokens changed
+    AUTODOC_REGENERATE_THRESHOLD = float(environ.get('AUTODOC_REGENERATE_THRESHOLD', 0.2))
+    # saves of the same document within this many seconds share one regeneration
+    AUTODOC_REGENERATE_QUIET_SECONDS = float(environ.get('AUTODOC_REGENERATE_QUIET_SECONDS', 30))
+    AUTODOC_REGENERATE_PROFILE = environ.get('AUTODOC_REGENERATE_PROFILE', 'quality')
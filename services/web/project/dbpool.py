@@ -0,0 +1,143 @@
+"""Database connection pool instrumentation."""
+# a QueuePool which times how long checkouts wait, a pid guard so forked processes never share a connection,
+# and per-worker stats files for manage.py db_pool_stats
+import json
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool which also counts checkouts, how long they waited and how many timed out."""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.wait_stats = {
+            'checkouts': 0,
+            'wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'timeouts': 0,
+        }
+        self._wait_lock = threading.Lock()
+
+    def _do_get(self):
+        wait_start = time.perf_counter()
+        timed_out = False
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - wait_start
+            with self._wait_lock:
+                self.wait_stats['checkouts'] += 1
+                self.wait_stats['wait_seconds'] += waited
+                self.wait_stats['max_wait_seconds'] = max(self.wait_stats['max_wait_seconds'], waited)
+                if timed_out:
+                    self.wait_stats['timeouts'] += 1
+
+
+def pool_stats(engine):
+    """Size, checked out connections, overflow and checkout waits of engine's pool in this process."""
+    pool = engine.pool
+    stats = {
+        'pid': os.getpid(),
+        'written_on': time.time(),
+        'pool': pool.__class__.__name__,
+    }
+    if isinstance(pool, QueuePool):
+        stats['size'] = pool.size()
+        stats['checked_in'] = pool.checkedin()
+        stats['checked_out'] = pool.checkedout()
+        # QueuePool counts overflow from -size, only connections beyond the pool size are reported
+        stats['overflow'] = max(pool.overflow(), 0)
+    stats.update(getattr(pool, 'wait_stats', {}))
+    return stats
+
+
+def write_pool_stats(engine, stats_dir):
+    # write then rename, so a reader never sees a half written file
+    os.makedirs(stats_dir, exist_ok=True)
+    stats_path = os.path.join(stats_dir, '%d.json' % os.getpid())
+    with open(stats_path + '.tmp', 'w') as stats_file:
+        json.dump(pool_stats(engine), stats_file)
+    os.replace(stats_path + '.tmp', stats_path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_pool_stats(stats_dir):
+    """Latest pool stats written by each live process, stats of exited processes are removed."""
+    if not stats_dir or not os.path.isdir(stats_dir):
+        return []
+    workers = []
+    for file_name in sorted(os.listdir(stats_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        stats_path = os.path.join(stats_dir, file_name)
+        with open(stats_path) as stats_file:
+            stats = json.load(stats_file)
+        if not _process_alive(stats['pid']):
+            os.remove(stats_path)
+            continue
+        workers.append(stats)
+    return workers
+
+
+def server_connections(engine):
+    """Connections postgres holds for this database, by state, None on other databases."""
+    if engine.dialect.name != 'postgresql':
+        return None
+    with engine.connect() as connection:
+        return dict(connection.execute(text(
+            'SELECT coalesce(state, \'unknown\'), count(*) FROM pg_stat_activity WHERE datname = current_database() GROUP BY 1'
+        )).fetchall())
+
+
+def instrument_engine(engine, config, publish_stats=True):
+    """Guard engine's pool against use across forks and publish its stats for db_pool_stats."""
+
+    @event.listens_for(engine, 'connect')
+    def remember_pid(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        # a connection opened before a fork belongs to the parent, drop it without closing the parent's socket
+        if connection_record.info['pid'] != os.getpid():
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection record belongs to pid %s, attempting to check out in pid %s' % (connection_record.info['pid'], os.getpid())
+            )
+
+    stats_dir = config['DATABASE_POOL_STATS_DIR']
+    if not stats_dir or not publish_stats:
+        return
+    interval = config['DATABASE_POOL_STATS_SECONDS']
+    last_written = {'at': 0.0}
+
+    @event.listens_for(engine, 'checkout')
+    def publish_stats(dbapi_connection, connection_record, connection_proxy):
+        # written as connections are taken, so checked_out shows the pool under load
+        # at most once per interval, a stats write never fails the request
+        now = time.monotonic()
+        if now - last_written['at'] < interval:
+            return
+        last_written['at'] = now
+        try:
+            write_pool_stats(engine, stats_dir)
+        except OSError as error:
+            print('Could not write pool stats: ', repr(error), file=sys.stderr)
@@ -0,0 +1,107 @@
+"""Read replica routing."""
+# read-only views read from one of the DATABASE_REPLICA_URLS, everything else stays on the primary:
+# every flush, every read after a write in the same request, and every read of a user who committed
+# within the last DATABASE_REPLICA_PIN_SECONDS, so users always read their own writes
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+
+# binds named replica0, replica1, ... are the replicas
+REPLICA_BIND_PREFIX = 'replica'
+# until when, in the user's session cookie, the user reads from the primary
+PIN_SESSION_KEY = 'db_primary_until'
+
+
+def replica_keys(app):
+    """Bind keys of the configured replicas."""
+    return sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {}) if key.startswith(REPLICA_BIND_PREFIX))
+
+
+def route_key(app):
+    """Replica bind key reads of this request go to, or None for the primary."""
+    if not has_request_context() or not g.get('db_replica_reads'):
+        return None
+    # a request which wrote, or a user who just committed, reads its own writes from the primary
+    if g.get('db_wrote') or flask.session.get(PIN_SESSION_KEY, 0) > time.time():
+        return None
+    keys = replica_keys(app)
+    if not keys:
+        return None
+    # one replica per request, so every read of the request sees the same point in time
+    if 'db_replica_key' not in g:
+        g.db_replica_key = random.choice(keys)
+    return g.db_replica_key
+
+
+class RoutingSession(SignallingSession):
+    """SignallingSession which sends the reads of read-only views to a replica."""
+
+    def __init__(self, db, *args, **kwargs):
+        self._routing_db = db
+        super(RoutingSession, self).__init__(db, *args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None):
+        # writes always go to the primary
+        if not self._flushing:
+            replica_key = route_key(self.app)
+            if replica_key is not None:
+                return self._routing_db.get_engine(self.app, bind=replica_key)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with a RoutingSession."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(session, flush_context):
+    # later reads of this request go to the primary
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_commit(session):
+    if has_request_context() and g.get('db_wrote'):
+        g.db_committed = True
+
+
+@contextmanager
+def replica_reads():
+    """Let the reads in the block go to a replica, unless the request or the user has just written."""
+    g.db_replica_reads = g.get('db_replica_reads', 0) + 1
+    try:
+        yield
+    finally:
+        g.db_replica_reads -= 1
+
+
+def read_only_view(view):
+    """Decorator for views which only read, the queries of their GET requests go to a replica."""
+    @wraps(view)
+    def routed_view(*args, **kwargs):
+        if flask.request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+        with replica_reads():
+            return view(*args, **kwargs)
+    return routed_view
+
+
+def init_replica_routing(app):
+    """Pin users to the primary for DATABASE_REPLICA_PIN_SECONDS after every request which committed a write."""
+
+    @app.after_request
+    def pin_after_commit(response):
+        if g.get('db_committed') and replica_keys(app):
+            flask.session[PIN_SESSION_KEY] = time.time() + app.config['DATABASE_REPLICA_PIN_SECONDS']
+        return response
@@ -0,0 +1,98 @@
+"""Data access for the document edit pages."""
+# the document, its retention, its editor, its latest autodoc and its latest job status in one round trip,
+# through a baked query whose compiled statement is cached after the first use
+# in the 'lookup' permission mode the same query is the permission check
+from collections import namedtuple
+
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext import baked
+
+from . import db
+from .models import Document, User, Retention
+from .principalmanager import EditDocumentPermission
+from project.static.data.processeddata.autodocsmodels import Autodoc, Revision, AutodocJob
+
+
+# everything the edit pages show, autodoc is None until the first one is written
+# and job_status is the status of the document's latest autodoc job, None if it never had one
+DocumentEdit = namedtuple('DocumentEdit', ['document', 'retention', 'editor', 'autodoc', 'job_status'])
+
+# compiled statements of the baked queries, shared by every request of this process
+bakery = baked.bakery()
+
+# the retention's editor, users are also joined as sponsors elsewhere
+editor_user = db.aliased(User, name='editor_user')
+
+# latest revision of the document, looked up for the one row rather than grouping every revision
+newer_revision = db.aliased(Revision, name='newer_revision')
+latest_revision_id = select([db.func.max(newer_revision.id)]).\
+where(newer_revision.document_id == Document.id).\
+correlate(Document).\
+as_scalar()
+
+# status of the document's latest job, shown while its first autodoc is still being written
+latest_job_status = select([AutodocJob.job_status]).\
+where(AutodocJob.document_id == Document.id).\
+correlate(Document).\
+order_by(AutodocJob.id.desc()).\
+limit(1).\
+as_scalar()
+
+
+def _document_edit_query(session):
+    # built once, later calls reuse the cached statement with a new document_id
+    return session.query(Document, Retention, editor_user, Autodoc, latest_job_status).\
+    join(Retention, Retention.document_id == Document.id).\
+    outerjoin(editor_user, editor_user.id == Retention.editor_id).\
+    outerjoin(Revision, Revision.id == latest_revision_id).\
+    outerjoin(Autodoc, Autodoc.id == Revision.autodoc_id).\
+    filter(Document.id == bindparam('document_id'))
+
+document_edit_query = bakery(_document_edit_query)
+
+
+def _retained_by_sponsor(query):
+    return query.filter(Retention.sponsor_id == bindparam('user_id'))
+
+def _retained_by_editor(query):
+    return query.filter(Retention.editor_id == bindparam('user_id'))
+
+# extra criteria per user type, each baked into its own cached statement
+RETAINED_BY = {
+    'sponsor': _retained_by_sponsor,
+    'editor': _retained_by_editor,
+}
+
+
+def load_document_edit(document_id, user_type=None, user_id=None):
+    """DocumentEdit of document_id in one query, None if there is no such retained document.
+
+    With user_type and user_id, only a document that user sponsors (or edits) is found.
+    """
+    # document ids come from the url, anything but an integer is never found
+    if not str(document_id).isdigit():
+        return None
+    query = document_edit_query
+    parameters = {'document_id': int(document_id)}
+    if user_type is not None:
+        query = query.with_criteria(RETAINED_BY[user_type])
+        parameters['user_id'] = user_id
+    # baked queries take the request's Session itself, not the scoped_session proxy
+    row = query(db.session()).params(**parameters).first()
+    if row is None:
+        return None
+    return DocumentEdit(*row)
+
+
+def load_permitted_document_edit(document_id, user_type):
+    """DocumentEdit of document_id if the current user may edit it as user_type, else None."""
+    # 'needs' mode: the identity already carries the user's documents, checking costs no query
+    if current_app.config['DOCUMENT_PERMISSION_MODE'] == 'needs':
+        if not EditDocumentPermission(document_id).can():
+            return None
+        return load_document_edit(document_id)
+
+    # 'lookup' mode: the page's own query only finds documents this user retains
+    return load_document_edit(document_id, user_type, current_user.id)
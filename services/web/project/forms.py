@@ -1,6 +1,6 @@
 """Sign-up & log-in forms."""
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, SelectField
+from wtforms import StringField, PasswordField, SubmitField, SelectField, HiddenField
 import email_validator
 from wtforms.validators import (
     DataRequired,
@@ -91,4 +91,22 @@ class DocumentForm(FlaskForm):
         allow_blank=True, 
         get_label='name'
     )
-    submit = SubmitField('Submit')
\ No newline at end of file
+    submit = SubmitField('Submit')
+
+
+class DocumentSearchForm(FlaskForm):
+    """Search Documents Form, submitted as a GET query string."""
+    q = StringField(
+        'Search',
+        validators=[Optional(), Length(max=200)]
+    )
+    submit = SubmitField('Search')
+
+
+class AutodocPickForm(FlaskForm):
+    """Pick One Autodoc Candidate Form."""
+    autodoc_id = HiddenField(
+        'Autodoc',
+        validators=[DataRequired()]
+    )
+    submit = SubmitField('Use This Text')
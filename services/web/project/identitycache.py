@@ -0,0 +1,169 @@
+"""Cached principal identities."""
+# roles, status and retained document ids of each user, computed once instead of on every request
+# an in-memory LRU with a TTL sits in front of an optional table shared by every worker,
+# which when enabled also tells each worker whether its in-memory copy was invalidated elsewhere
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Document, User, Retention, IdentityCacheEntry
+from .dbrouting import replica_reads
+
+
+# what on_identity_loaded needs to build a user's Identity
+CachedIdentity = namedtuple('CachedIdentity', ['user_type', 'user_status', 'document_ids'])
+
+# in-memory tier, user_id -> (monotonic time cached, CachedIdentity, cached_on of the shared row it matches),
+# most recently used at the end
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+# hit/miss/eviction counters for this process
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'invalidations': 0,
+    'stale_memory': 0,
+}
+
+
+def load_identity(user_id):
+    """Query the user's type, status and retained document ids, at most two queries whatever the document count."""
+    user = db.session.query(User.user_type, User.user_status).filter(User.id == user_id).first()
+    if user is None:
+        return None
+
+    # sponsors see the documents they sponsor, editors the documents assigned to them
+    retention_column = Retention.sponsor_id if user.user_type == 'sponsor' else Retention.editor_id
+    document_ids = []
+    # in the 'lookup' permission mode each route checks its one document, nothing is loaded up front
+    if user.user_type in ('sponsor', 'editor') and current_app.config['DOCUMENT_PERMISSION_MODE'] == 'needs':
+        document_ids = [row.document_id for row in db.session.query(Retention.document_id).\
+        join(Document, Document.id == Retention.document_id).\
+        filter(retention_column == user_id).\
+        order_by(Retention.document_id)]
+
+    return CachedIdentity(user.user_type, user.user_status, tuple(document_ids))
+
+
+def _remember(user_id, identity, max_entries, shared_cached_on=None):
+    # insert into the LRU and evict the least recently used entries over max_entries
+    with _memory_lock:
+        _memory[user_id] = (time.monotonic(), identity, shared_cached_on)
+        _memory.move_to_end(user_id)
+        while len(_memory) > max_entries:
+            _memory.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def _store_shared(user_id, identity, cached_on):
+    # own connection and transaction, so the request's session is neither flushed nor committed
+    # and none of its commit hooks run for a cache write
+    table = IdentityCacheEntry.__table__
+    values = {
+        'user_type': identity.user_type,
+        'user_status': identity.user_status,
+        'document_ids': json.dumps(list(identity.document_ids)),
+        'cached_on': cached_on,
+    }
+    with db.engine.begin() as connection:
+        updated = connection.execute(table.update().where(table.c.user_id == user_id).values(**values)).rowcount
+        if not updated:
+            connection.execute(table.insert().values(user_id=user_id, **values))
+
+
+def cached_identity(user_id):
+    """CachedIdentity of user_id from the cache, loading and caching it on a miss."""
+    config = current_app.config
+    ttl_seconds = config['IDENTITY_CACHE_SECONDS']
+    # uncached identities are read on every request, a replica takes that load off the primary
+    # cached ones come from the primary, a replica's lag would otherwise be cached for ttl_seconds
+    if ttl_seconds <= 0:
+        with replica_reads():
+            return load_identity(user_id)
+
+    with _memory_lock:
+        entry = _memory.get(user_id)
+    if entry is not None and time.monotonic() - entry[0] >= ttl_seconds:
+        entry = None
+
+    # invalidate_identity on any worker deletes the shared row, and a reload replaces it with a new cached_on,
+    # so a memory copy is only used while the shared row it was built with is still there
+    if entry is not None and config['IDENTITY_CACHE_DB']:
+        shared_cached_on = db.session.query(IdentityCacheEntry.cached_on).\
+        filter(IdentityCacheEntry.user_id == user_id).\
+        scalar()
+        if shared_cached_on is None or shared_cached_on != entry[2]:
+            _stats['stale_memory'] += 1
+            entry = None
+
+    if entry is not None:
+        with _memory_lock:
+            if user_id in _memory:
+                _memory.move_to_end(user_id)
+        _stats['memory_hits'] += 1
+        return entry[1]
+
+    if config['IDENTITY_CACHE_DB']:
+        row = IdentityCacheEntry.query.get(user_id)
+        if row is not None and row.cached_on >= datetime.utcnow() - timedelta(seconds=ttl_seconds):
+            _stats['db_hits'] += 1
+            identity = CachedIdentity(row.user_type, row.user_status, tuple(json.loads(row.document_ids)))
+            # promote into the memory tier, valid for as long as this shared row is
+            _remember(user_id, identity, config['IDENTITY_CACHE_SIZE'], row.cached_on)
+            return identity
+
+    _stats['misses'] += 1
+    print('Identity cache miss for user: ', user_id, file=sys.stderr)
+    identity = load_identity(user_id)
+    if identity is None:
+        return None
+
+    shared_cached_on = None
+    if config['IDENTITY_CACHE_DB']:
+        cached_on = datetime.utcnow()
+        try:
+            _store_shared(user_id, identity, cached_on)
+            shared_cached_on = cached_on
+        except IntegrityError:
+            # the other worker's row is the shared one, the next lookup promotes it
+            print('Identity already cached for user: ', user_id, file=sys.stderr)
+    _remember(user_id, identity, config['IDENTITY_CACHE_SIZE'], shared_cached_on)
+
+    return identity
+
+
+def invalidate_identity(*user_ids):
+    """Drop the cached identities of user_ids, call after committing the change that made them stale."""
+    user_ids = [int(user_id) for user_id in user_ids if user_id is not None]
+    with _memory_lock:
+        for user_id in user_ids:
+            _memory.pop(user_id, None)
+            _stats['invalidations'] += 1
+
+    # with the shared tier, other workers see the row gone on their next lookup and drop their memory copies,
+    # without it they keep them for up to IDENTITY_CACHE_SECONDS
+    # the delete commits on its own connection, whatever the caller's session still holds stays uncommitted
+    if user_ids and current_app.config['IDENTITY_CACHE_DB']:
+        table = IdentityCacheEntry.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+    print('Invalidated cached identities of users: ', user_ids, file=sys.stderr)
+
+
+def identity_cache_stats():
+    """Hit, miss, eviction and invalidation counters plus the memory tier size for this process."""
+    stats = dict(_stats)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['memory_entries'] = len(_memory)
+    stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+    return stats
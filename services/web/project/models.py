@@ -7,6 +7,7 @@ from functools import wraps
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import relationship
 from sqlalchemy import Integer, ForeignKey, String, Column
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 # import autodocsmodels.py
@@ -19,6 +20,11 @@ class User(db.Model):
     """User account model."""
 
     __tablename__ = 'users'
+    """editor choices and the admin user lists, keyset paged on id"""
+    __table_args__ = (
+        db.Index('ix_users_type_id', 'user_type', 'id'),
+        db.Index('ix_users_status_id', 'user_status', 'id'),
+    )
 
     id = db.Column(
         db.Integer,
@@ -112,6 +118,10 @@ class Document(db.Model):
     """Describes table which includes documents."""
 
     __tablename__ = 'documents'
+    """full-text search of the documents a user retains"""
+    __table_args__ = (
+        db.Index('ix_documents_search', 'document_search', postgresql_using='gin'),
+    )
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -126,6 +136,18 @@ class Document(db.Model):
         unique=False,
         nullable=True
     )
+    """packed token ids of document_body, written whenever the body changes"""
+    document_token_ids = db.Column(
+        db.LargeBinary,
+        unique=False,
+        nullable=True
+    )
+    """weighted tsvector of the name, body and latest autodoc, written with them, only loaded when asked for"""
+    document_search = db.deferred(db.Column(
+        TSVECTOR().with_variant(db.Text, 'sqlite'),
+        unique=False,
+        nullable=True
+    ))
     created_on = db.Column(
         db.DateTime,
         index=False,
@@ -150,6 +172,12 @@ class Retention(db.Model):
     """Model for who retains which document"""
     """Associate database."""
     __tablename__ = 'retentions'
+    """per-document permission lookups, by sponsor or by editor"""
+    __table_args__ = (
+        db.Index('ix_retentions_sponsor_document', 'sponsor_id', 'document_id'),
+        db.Index('ix_retentions_editor_document', 'editor_id', 'document_id'),
+        db.Index('ix_retentions_document', 'document_id'),
+    )
 
     id = db.Column(
         db.Integer, 
@@ -188,4 +216,37 @@ class Retention(db.Model):
     document = db.relationship(
         'Document', 
         back_populates='users'
-        )
\ No newline at end of file
+        )
+
+
+"""Cached Identity - shared tier of the principal identity cache"""
+class IdentityCacheEntry(db.Model):
+    """Roles, status and document needs computed for one user"""
+    __tablename__ = 'identitycache'
+
+    user_id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    user_type = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=False
+    )
+    user_status = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=True
+    )
+    """json list of the document ids the user retains"""
+    document_ids = db.Column(
+        db.Text,
+        unique=False,
+        nullable=False
+    )
+    cached_on = db.Column(
+        db.DateTime,
+        index=False,
+        unique=False,
+        nullable=False
+    )
@@ -0,0 +1,35 @@
+"""Keyset (cursor) pagination for list views."""
+from collections import namedtuple
+
+# one page of rows, plus the cursor keys of the pages either side (None at either end)
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def keyset_page(query, key_column, after=None, before=None, page_size=50):
+    """Rows of query ordered by the unique key_column, page_size at a time, after or before a cursor key."""
+    # rows are read by their key, so a page costs the same however deep it is
+    if before is not None:
+        # walk backwards from the cursor, then put the page back in ascending order
+        rows = query.filter(key_column < before).order_by(key_column.desc()).limit(page_size + 1).all()
+        items = list(reversed(rows[:page_size]))
+        if not items:
+            return Page(items, None, None)
+        # there is always a next page, the cursor came from it
+        return Page(
+            items,
+            getattr(items[-1], key_column.key),
+            getattr(items[0], key_column.key) if len(rows) > page_size else None
+        )
+
+    if after is not None:
+        query = query.filter(key_column > after)
+    # one extra row tells whether there is a next page, without a count
+    rows = query.order_by(key_column).limit(page_size + 1).all()
+    items = rows[:page_size]
+    if not items:
+        return Page(items, None, None)
+    return Page(
+        items,
+        getattr(items[-1], key_column.key) if len(rows) > page_size else None,
+        getattr(items[0], key_column.key) if after is not None else None
+    )
@@ -1,5 +1,6 @@
 # Importing Flask Principal Stuff
 from flask_principal import identity_loaded, Principal, Permission, UserNeed, RoleNeed
+from flask import current_app
 
 from collections import namedtuple
 from functools import partial
@@ -10,6 +11,31 @@ DocumentNeed = namedtuple('document', ['method', 'value'])
 # partial function, freezing 'document' as the method
 EditDocumentNeed = partial(DocumentNeed, 'document')
 
+def user_retains_document(user_id, user_type, document_id):
+    """One indexed lookup on retentions: does user_id sponsor (or edit) document_id."""
+    # imported here, the app and its db are created after this module is loaded
+    from . import db
+    from .models import Retention
+
+    # sponsors own the documents they sponsor, editors the documents assigned to them
+    if user_type == 'sponsor':
+        retention_column = Retention.sponsor_id
+    elif user_type == 'editor':
+        retention_column = Retention.editor_id
+    else:
+        return False
+
+    # document ids come from the url, anything but an integer is never retained
+    if not str(document_id).isdigit():
+        return False
+
+    # only indexed columns are selected, so the lookup never reads the table itself
+    retained = db.session.query(Retention.document_id).\
+    filter(retention_column == user_id).\
+    filter(Retention.document_id == int(document_id)).\
+    exists()
+    return db.session.query(retained).scalar()
+
 class EditDocumentPermission(Permission):
     def __init__(self, document_id):
     	# format input of document_id as a string
@@ -17,5 +43,20 @@ class EditDocumentPermission(Permission):
         need = EditDocumentNeed(str(document_id))
         # give capability to call this method from other classes with, "super"
         super(EditDocumentPermission, self).__init__(need)
+        # kept for the lookup mode, which checks this one document only
+        self.document_id = document_id
+
+    def allows(self, identity):
+        # 'needs' mode: the identity was loaded with an EditDocumentNeed for every retained document
+        if current_app.config['DOCUMENT_PERMISSION_MODE'] == 'needs':
+            return super(EditDocumentPermission, self).allows(identity)
 
+        # 'lookup' mode: ask the retentions table about this document, only when a route checks it
+        if RoleNeed('sponsor') in identity.provides:
+            user_type = 'sponsor'
+        elif RoleNeed('editor') in identity.provides:
+            user_type = 'editor'
+        else:
+            return False
+        return user_retains_document(identity.id, user_type, self.document_id)
 
@@ -0,0 +1,150 @@
+"""Query plans of the hot list and permission queries as row counts grow."""
+# seeds a scratch database, never the app's own, and reports how each query reaches its rows
+# before and after the index pack of schemamigrations
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+
+from . import db
+from .models import Document, User, Retention
+from .schemamigrations import HOT_JOIN_INDEXES, migrate
+from project.static.data.processeddata.autodocsmodels import Autodoc, Revision
+
+
+# sponsors and editors the seeded documents are spread over
+SEED_USERS = 10
+# rows per insert statement while seeding
+SEED_CHUNK = 5000
+# rows per list page, as in LIST_PAGE_SIZE
+PAGE_SIZE = 50
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), SEED_CHUNK):
+        connection.execute(table.insert(), rows[start:start + SEED_CHUNK])
+
+
+def _refresh_statistics(engine):
+    # postgres also needs a vacuum for the visibility map, without it no scan is index-only
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('VACUUM ANALYZE'))
+    else:
+        with engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+
+
+def seed(engine, row_count):
+    """Recreate every table on engine with row_count documents, each retained and revised once, and no index pack."""
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # start from the schema of a database the migration has not reached yet
+        for index in HOT_JOIN_INDEXES:
+            connection.execute(text('DROP INDEX IF EXISTS %s' % index.name))
+        connection.execute(text('DROP TABLE IF EXISTS schema_migrations'))
+
+        # sponsors, then editors, then one pending signup per ten documents
+        users = [{
+            'id': user_id,
+            'name': 'User %d' % user_id,
+            'user_type': 'sponsor' if user_id <= SEED_USERS else 'editor',
+            'user_status': 'approved' if user_id <= 2 * SEED_USERS else 'pending',
+            'email': 'user%d@example.com' % user_id,
+            'password': 'unused',
+        } for user_id in range(1, 2 * SEED_USERS + row_count // 10 + 1)]
+        _insert(connection, User.__table__, users)
+
+        document_ids = range(1, row_count + 1)
+        _insert(connection, Document.__table__, [{'id': document_id, 'document_name': 'Document %d' % document_id, 'document_body': 'Body.'} for document_id in document_ids])
+        _insert(connection, Autodoc.__table__, [{'id': document_id, 'autodoc_body': 'Autodoc.'} for document_id in document_ids])
+        _insert(connection, Retention.__table__, [{
+            'id': document_id,
+            'sponsor_id': 1 + document_id % SEED_USERS,
+            'editor_id': 1 + SEED_USERS + document_id % SEED_USERS,
+            'document_id': document_id,
+        } for document_id in document_ids])
+        _insert(connection, Revision.__table__, [{'id': document_id, 'document_id': document_id, 'autodoc_id': document_id} for document_id in document_ids])
+    _refresh_statistics(engine)
+
+
+def hot_queries(row_count):
+    """(name, select) of the access paths behind the document lists, permission checks and latest revisions."""
+    retentions = Retention.__table__
+    revisions = Revision.__table__
+    users = User.__table__
+    # a document in the middle, and the sponsor and editor who retain it
+    document_id = row_count // 2
+    sponsor_id = 1 + document_id % SEED_USERS
+    editor_id = 1 + SEED_USERS + document_id % SEED_USERS
+    return [
+        ('permission_sponsor', select([select([retentions.c.document_id]).where(retentions.c.sponsor_id == sponsor_id).where(retentions.c.document_id == document_id).exists()])),
+        ('permission_editor', select([select([retentions.c.document_id]).where(retentions.c.editor_id == editor_id).where(retentions.c.document_id == document_id).exists()])),
+        ('sponsor_list_page', select([retentions.c.document_id]).where(retentions.c.sponsor_id == sponsor_id).where(retentions.c.document_id > document_id).order_by(retentions.c.document_id).limit(PAGE_SIZE)),
+        ('editor_list_page', select([retentions.c.document_id]).where(retentions.c.editor_id == editor_id).where(retentions.c.document_id > document_id).order_by(retentions.c.document_id).limit(PAGE_SIZE)),
+        ('latest_revision', select([func.max(revisions.c.id)]).where(revisions.c.document_id == document_id)),
+        ('pending_users_page', select([users.c.id]).where(users.c.user_status == 'pending').where(users.c.id > 0).order_by(users.c.id).limit(PAGE_SIZE)),
+    ]
+
+
+def explain(engine, sql):
+    """Plan lines of sql on engine's database."""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            return [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        return [row[0] for row in connection.execute(text('EXPLAIN ' + sql))]
+
+
+def plan_access(plan_lines):
+    """'index-only', 'index' or 'scan', the worst way any table in the plan is read."""
+    # sqlite reports SEARCH (index lookup) and SCAN (whole table or index) lines, postgres reports scan nodes
+    table_reads = [
+        line.strip() for line in plan_lines
+        if (line.strip().startswith(('SEARCH', 'SCAN')) or ' Scan' in line) and 'CONSTANT ROW' not in line
+    ]
+    if any(line.startswith('SCAN') or 'Seq Scan' in line for line in table_reads):
+        return 'scan'
+    if table_reads and all('COVERING INDEX' in line or 'Index Only Scan' in line for line in table_reads):
+        return 'index-only'
+    return 'index'
+
+
+def time_query(engine, sql, repeat):
+    """Median milliseconds of repeat runs of sql."""
+    seconds = []
+    with engine.connect() as connection:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            connection.execute(text(sql)).fetchall()
+            seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds) * 1000
+
+
+def measure(engine, row_count, phase, repeat):
+    """Access path, median ms and plan of every hot query."""
+    results = []
+    for name, query in hot_queries(row_count):
+        sql = str(query.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan_lines = explain(engine, sql)
+        results.append({
+            'rows': row_count,
+            'phase': phase,
+            'query': name,
+            'access': plan_access(plan_lines),
+            'ms': time_query(engine, sql, repeat),
+            'plan': ' | '.join(line.strip() for line in plan_lines),
+        })
+    return results
+
+
+def benchmark_query_plans(engine, row_counts, repeat=20, compare=True):
+    """Seed engine at each row count and measure the hot queries, before the index pack if compare, and after it."""
+    results = []
+    for row_count in row_counts:
+        seed(engine, row_count)
+        if compare:
+            results.extend(measure(engine, row_count, 'before', repeat))
+        migrate(engine)
+        results.extend(measure(engine, row_count, 'after', repeat))
+    return results
@@ -1,10 +1,11 @@
 """Logged-in page routes."""
 from flask import Blueprint, redirect, render_template, flash, request, session, url_for
 from flask import g, current_app, abort, request
+from flask import Response, stream_with_context
 from flask_login import current_user, login_required
 from flask_login import logout_user
 # import form stuff
-from .forms import DocumentForm
+from .forms import DocumentForm, AutodocPickForm, DocumentSearchForm
 from wtforms_sqlalchemy.orm import QuerySelectField
 
 # import models
@@ -20,10 +21,29 @@ from flask_principal import Identity, identity_changed, identity_loaded, Anonymo
 import sys
 # individual document access permission
 from .principalmanager import EditDocumentPermission
-
-# import autodocwriter to automatically write autodocs after new doc is created
-from project.static.src.features.doctokenization import gpt2tokenize
-from project.static.src.evaluation.autodocwriter import autodocwrite
+# cursor pagination for the list views
+from .pagination import keyset_page
+# drop cached identities when roles or retained documents change
+from .identitycache import invalidate_identity
+# read-only list views read from a replica, when one is configured
+from .dbrouting import read_only_view
+# document, retention, editor and latest autodoc of the edit pages in one query
+from .documentedit import load_permitted_document_edit
+# full-text search of the documents a user retains
+from .search import index_document, search_documents
+
+# import autodoc queue to write autodocs in the background after new doc is created
+from project.static.src.evaluation.autodocqueue import add_autodoc_job, dispatch, latest_job_statuses
+# tokenize documents once, when their body is written
+from project.static.src.features.doctokenization import tokenize_document
+# change-aware, debounced regeneration of autodocs on edits
+from project.static.src.evaluation.autodocedits import edit_document_body, schedule_regeneration
+# stream autodoc tokens to the browser as they are generated
+from project.static.src.evaluation.autodocstream import stream_autodoc
+# per-stage generation timings report
+from project.static.src.evaluation.autodoctiming import stage_percentiles
+# sibling candidates of one generate pass, and picking between them
+from project.static.src.evaluation.autodoccandidates import candidate_autodocs, pick_candidate
 
 
 # Blueprint Configuration
@@ -121,20 +141,14 @@ def newdocument_sponsor():
             document_name=form.document_name.data,
             document_body=form.document_body.data
             )
+        # store the token ids with the document so generation never re-tokenizes
+        tokenize_document(newdocument)
 
-        # add and commit new document
+        # add new document, flush returns its id without committing
         db.session.add(newdocument)
-        db.session.commit()
-
-        # after this document has just been added to the database, add retention
-        # query all documents in order, put into a python object
-        all_documents_ordered = Document.query.order_by(Document.id)
-        # query count of all documents, subtract 1 because python index starts at 0
-        document_index = Document.query.count() - 1
-        # last document object is document index, or count-1
-        last_document = all_documents_ordered[document_index]
-        # new document id for retentions database is indexed last documentid integer
-        newdocument_id = last_document.id
+        db.session.flush()
+        # new document id for the retentions database
+        newdocument_id = newdocument.id
 
 
         # Add Sponsor Retention ------------
@@ -151,14 +165,23 @@ def newdocument_sponsor():
             document_id=newdocument_id
             )
         
-        # add retention to session and commit to database
+        # add retention to session
         db.session.add(newretention)
+
+        # searchable from the moment it is committed
+        index_document(newdocument_id)
+
+        # the autodoc job is recorded in the same transaction
+        newjob = add_autodoc_job(newdocument_id)
+
+        # document, retention and job are committed together, or not at all
         db.session.commit()
 
-        # tokenize, then write new autodoc
-        input_ids = gpt2tokenize(newdocument_id)
-        # write thew new autodoc to database
-        autodocwrite(newdocument_id,input_ids)
+        # hand the committed job to the worker, the autodoc is written in the background
+        dispatch(newjob.id)
+
+        # the sponsor and the editor now retain another document
+        invalidate_identity(user_id, selected_editor_id)
 
 
          # message included in the route python function
@@ -173,39 +196,80 @@ def newdocument_sponsor():
 @login_required
 @sponsor_permission.require(http_exception=403)
 @approved_permission.require(http_exception=403)
+@read_only_view
 def documentlist_sponsor():
     """Logged-in Sponsor List of Documents."""
     # get the current user id
     user_id = current_user.id
-    
-    # Document objects list which includes editors for all objects
-    # this logic will only work if document_objects.count() = editor_objects.count()
-    # get document objects filtered by the current user
-    # attach autodocs based upon revision helper table
+
+    # latest revision of each document, looked up per listed row rather than grouping every revision
+    # earlier autodocs are kept but not listed
+    newer_revision = db.aliased(Revision)
+    latest_revision_id = db.session.query(db.func.max(newer_revision.id)).\
+    filter(newer_revision.document_id == Document.id).\
+    correlate(Document).\
+    as_scalar()
+    # documents of the current user with their editor and latest autodoc, one query per page
     document_objects=db.session.query(Retention.sponsor_id,User.id,Retention.editor_id,Retention.document_id,User.name,Document.document_name,Document.document_body,Autodoc.autodoc_body).\
     join(Retention, User.id==Retention.editor_id).\
     join(Document, Document.id==Retention.document_id).\
-    order_by(Retention.sponsor_id).\
     filter(Retention.sponsor_id == user_id).\
-    join(Revision,Revision.document_id==Document.id).\
-    join(Autodoc,Autodoc.id==Revision.autodoc_id)
-
-    # get a count of the document objects
-    document_count = document_objects.count()
-    
-    # blank list to append to for documents and editors
-    document_list=[]
-
-    # loop through document objects
-    for counter in range(0,document_count):
-        document_list.append(document_objects[counter])
+    outerjoin(Revision,Revision.id==latest_revision_id).\
+    outerjoin(Autodoc,Autodoc.id==Revision.autodoc_id)
+
+    # one page of documents, ordered by document id, from the after/before cursor
+    page = keyset_page(
+        document_objects,
+        Retention.document_id,
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=current_app.config['LIST_PAGE_SIZE']
+    )
 
     # show list of document names
-    documents = document_list
+    documents = page.items
+
+    # status of queued autodocs for documents which do not have one yet
+    job_statuses = latest_job_statuses([document.document_id for document in documents if document.autodoc_body is None])
 
     return render_template(
         'documentlist_sponsor.jinja2',
         documents=documents,
+        page=page,
+        job_statuses=job_statuses,
+    )
+
+
+@sponsor_bp.route('/sponsor/documents/search', methods=['GET'])
+@login_required
+@sponsor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+@read_only_view
+def documentsearch_sponsor():
+    """Logged-in Sponsor Search of Documents."""
+    # search box read from the query string, so every result page has its own link
+    form = DocumentSearchForm(request.args, meta={'csrf': False})
+    query = form.q.data or ''
+
+    # ranked matches among the documents this sponsor retains, a page at a time from the after cursor
+    try:
+        page = search_documents(
+            current_user.id,
+            'sponsor',
+            query,
+            after=request.args.get('after'),
+            page_size=current_app.config['SEARCH_PAGE_SIZE']
+        )
+    except ValueError:
+        # cursor that did not come from a result page
+        abort(400)
+
+    return render_template(
+        'documentsearch_sponsor.jinja2',
+        form=form,
+        query=query,
+        results=page.items,
+        page=page
     )
 
 
@@ -215,32 +279,27 @@ def documentlist_sponsor():
 @approved_permission.require(http_exception=403)
 def documentedit_sponsor(document_id):
 
-    # setup permission for individual document_id
-    permission = EditDocumentPermission(document_id)
+    # document, retention, editor, latest autodoc and job status in one query,
+    # which in the 'lookup' permission mode only finds documents this sponsor retains
+    document_edit = load_permitted_document_edit(document_id, 'sponsor')
 
     # run route function if permission condition satisfied
-    if permission.can():
+    if document_edit is not None:
 
         # new document form
         form = DocumentForm()
 
-        # Getting the Document Object
-        # query for the document_id in question to get the object
-        document = db.session.query(Document).filter_by(id = document_id)[0]
-
-        # Get Associated Autodoc
-        associated_autodoc = db.session.query(Document,Autodoc).join(Revision,Revision.document_id==Document.id).join(Autodoc,Autodoc.id==Revision.autodoc_id).filter(Revision.document_id == document_id)[0].Autodoc
+        document = document_edit.document
+        associated_autodoc = document_edit.autodoc
+        # status of the queued autodoc while it is still being written
+        job_status = document_edit.job_status if associated_autodoc is None else None
 
-        # Getting the Retention Object to Filter  for Editor ID
-        # join query to get and display current editor id via the retention object
-        retention_object = db.session.query(Retention).join(User, User.id == Retention.editor_id).filter(Retention.document_id == document_id)[0]
+        # the retention object holds the current editor id, and takes the newly selected one
+        retention_object = document_edit.retention
         # get current editor_id from retention object
         current_editor_id = retention_object.editor_id 
-        # Getting the Editor Object
-        # use this current editor object
-        current_editor_object = db.session.query(User).filter(User.id == current_editor_id)[0]
         # simplify variable name to pass to view
-        editor = current_editor_object
+        editor = document_edit.editor
 
         # display choices from list of editors
         form.editorchoice.query = User.query.filter(User.user_type == 'editor')
@@ -250,7 +309,8 @@ def documentedit_sponsor(document_id):
             # edit document parameters
             # index [0], which is the row in question for document name
             document.document_name = form.document_name.data
-            document.document_body = form.document_body.data
+            # re-tokenize a changed body and decide whether the autodoc is now stale
+            regenerate_autodoc = edit_document_body(document, form.document_body.data)
 
             # grab the selected_editor_id from the form
             selected_editor_id=int(form.editorchoice.data.id)
@@ -258,9 +318,20 @@ def documentedit_sponsor(document_id):
             # add new retention
             retention_object.editor_id = selected_editor_id
 
+            # name and body are searched, refresh them with the edit
+            index_document(document.id)
+
             # commit changes
             db.session.commit()
 
+            # a reassigned document moves from the old editor's needs to the new editor's
+            if selected_editor_id != current_editor_id:
+                invalidate_identity(current_editor_id, selected_editor_id)
+
+            # regenerate after the quiet period, rapid saves share one regeneration
+            if regenerate_autodoc:
+                schedule_regeneration(document.id)
+
             # redirect to document list after change
             return redirect(url_for('sponsor_bp.documentlist_sponsor'))
 
@@ -268,7 +339,10 @@ def documentedit_sponsor(document_id):
             'documentedit_sponsor.jinja2',
             form=form,
             document=document,
-            autodoc=associated_autodoc, # can access body with autodoc.Autodoc.autodoc_body
+            autodoc=associated_autodoc, # can access body with autodoc.autodoc_body
+            candidates=candidate_autodocs(associated_autodoc),
+            pick_form=AutodocPickForm(),
+            job_status=job_status,
             editor=editor
             )
 
@@ -278,6 +352,60 @@ def documentedit_sponsor(document_id):
 
 
 
+@sponsor_bp.route('/sponsor/documents/<document_id>/autodocpick', methods=['POST'])
+@login_required
+@sponsor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+def autodocpick_sponsor(document_id):
+    """Make one of the document's autodoc candidates its current autodoc."""
+
+    # setup permission for individual document_id
+    permission = EditDocumentPermission(document_id)
+
+    # run route function if permission condition satisfied
+    if permission.can():
+
+        form = AutodocPickForm()
+
+        # the picked candidate becomes the latest revision of the document
+        if form.validate_on_submit():
+            if pick_candidate(int(document_id), int(form.autodoc_id.data)) is None:
+                abort(404)
+
+        # back to the edit page, which now shows the picked text
+        return redirect(url_for('sponsor_bp.documentedit_sponsor', document_id=document_id))
+
+    # abort if permission not satisfied
+    abort(403)
+
+
+@sponsor_bp.route('/sponsor/documents/<document_id>/autodocstream', methods=['GET'])
+@login_required
+@sponsor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+def autodocstream_sponsor(document_id):
+    """Stream a new autodoc for the document as server-sent events."""
+
+    # setup permission for individual document_id
+    permission = EditDocumentPermission(document_id)
+
+    # run route function if permission condition satisfied
+    if permission.can():
+
+        # query for the document_id in question to get the object
+        document = db.session.query(Document).filter_by(id = document_id).first_or_404()
+
+        # tokens are pushed as they are decoded, the finished text is saved as a new autodoc
+        response = Response(stream_with_context(stream_autodoc(document)), mimetype='text/event-stream')
+        # keep proxies from buffering the stream
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    # abort if permission not satisfied
+    abort(403)
+
+
 # ---------- editor user routes ----------
 
 @editor_bp.route("/editor/logout")
@@ -318,39 +446,80 @@ def dashboard_editor():
 @login_required
 @editor_permission.require(http_exception=403)
 @approved_permission.require(http_exception=403)
+@read_only_view
 def documentlist_editor():
-    """Logged-in Sponsor List of Documents."""
+    """Logged-in Editor List of Documents."""
     # get the current user id
     user_id = current_user.id
-    
-    # Document objects and list, as well as Editor objects and list
-    # this logic will only work if document_objects.count() = editor_objects.count()
-    # get document objects filtered by the current user
+
+    # latest revision of each document, looked up per listed row rather than grouping every revision
+    # earlier autodocs are kept but not listed
+    newer_revision = db.aliased(Revision)
+    latest_revision_id = db.session.query(db.func.max(newer_revision.id)).\
+    filter(newer_revision.document_id == Document.id).\
+    correlate(Document).\
+    as_scalar()
+    # documents of the current user with their editor and latest autodoc, one query per page
     document_objects=db.session.query(Retention.sponsor_id,User.id,Retention.editor_id,Retention.document_id,User.name,Document.document_name,Document.document_body,Autodoc.autodoc_body).\
     join(Retention, User.id==Retention.editor_id).\
     join(Document, Document.id==Retention.document_id).\
-    order_by(Retention.sponsor_id).\
     filter(Retention.editor_id == user_id).\
-    join(Revision,Revision.document_id==Document.id).\
-    join(Autodoc,Autodoc.id==Revision.autodoc_id)
-
-    # get a count of the document objects
-    document_count = document_objects.count()
-    
-    # blank list to append to for documents and editors
-    document_list=[]
-
-    # loop through document objects
-    for counter in range(0,document_count):
-        document_list.append(document_objects[counter])
+    outerjoin(Revision,Revision.id==latest_revision_id).\
+    outerjoin(Autodoc,Autodoc.id==Revision.autodoc_id)
+
+    # one page of documents, ordered by document id, from the after/before cursor
+    page = keyset_page(
+        document_objects,
+        Retention.document_id,
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=current_app.config['LIST_PAGE_SIZE']
+    )
 
     # show list of document names
-    documents = document_list
+    documents = page.items
+
+    # status of queued autodocs for documents which do not have one yet
+    job_statuses = latest_job_statuses([document.document_id for document in documents if document.autodoc_body is None])
 
-    
     return render_template(
         'documentlist_editor.jinja2',
         documents=documents,
+        page=page,
+        job_statuses=job_statuses,
+    )
+
+
+@editor_bp.route('/editor/documents/search', methods=['GET'])
+@login_required
+@editor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+@read_only_view
+def documentsearch_editor():
+    """Logged-in Editor Search of Documents."""
+    # search box read from the query string, so every result page has its own link
+    form = DocumentSearchForm(request.args, meta={'csrf': False})
+    query = form.q.data or ''
+
+    # ranked matches among the documents this editor retains, a page at a time from the after cursor
+    try:
+        page = search_documents(
+            current_user.id,
+            'editor',
+            query,
+            after=request.args.get('after'),
+            page_size=current_app.config['SEARCH_PAGE_SIZE']
+        )
+    except ValueError:
+        # cursor that did not come from a result page
+        abort(400)
+
+    return render_template(
+        'documentsearch_editor.jinja2',
+        form=form,
+        query=query,
+        results=page.items,
+        page=page
     )
 
 
@@ -360,21 +529,20 @@ def documentlist_editor():
 @approved_permission.require(http_exception=403)
 def documentedit_editor(document_id):
 
-    # setup permission for individual document_id
-    permission = EditDocumentPermission(document_id)
+    # document, retention, editor, latest autodoc and job status in one query,
+    # which in the 'lookup' permission mode only finds documents this editor retains
+    document_edit = load_permitted_document_edit(document_id, 'editor')
 
     # run route function if permission condition satisfied
-    if permission.can():
+    if document_edit is not None:
 
         # new document form
         form = DocumentForm()
 
-        # Getting the Document Object
-        # query for the document_id in question to get the object
-        document = db.session.query(Document).filter_by(id = document_id)[0]
-
-        # find the associated autodoc
-        associated_autodoc = db.session.query(Document,Autodoc).join(Revision,Revision.document_id==Document.id).join(Autodoc,Autodoc.id==Revision.autodoc_id).filter(Revision.document_id == document_id)[0].Autodoc
+        document = document_edit.document
+        associated_autodoc = document_edit.autodoc
+        # status of the queued autodoc while it is still being written
+        job_status = document_edit.job_status if associated_autodoc is None else None
 
         
         if form.validate_on_submit():
@@ -382,11 +550,19 @@ def documentedit_editor(document_id):
             # edit document parameters
             # index [0], which is the row in question for document name
             document.document_name = form.document_name.data
-            document.document_body = form.document_body.data
+            # re-tokenize a changed body and decide whether the autodoc is now stale
+            regenerate_autodoc = edit_document_body(document, form.document_body.data)
+
+            # name and body are searched, refresh them with the edit
+            index_document(document.id)
 
             # commit changes
             db.session.commit()
 
+            # regenerate after the quiet period, rapid saves share one regeneration
+            if regenerate_autodoc:
+                schedule_regeneration(document.id)
+
             # redirect to document list after change
             return redirect(url_for('editor_bp.documentlist_editor'))
 
@@ -395,7 +571,10 @@ def documentedit_editor(document_id):
             'documentedit_editor.jinja2',
             form=form,
             document=document,
-            autodoc=associated_autodoc # can access body with autodoc.Autodoc.autodoc_body
+            autodoc=associated_autodoc, # can access body with autodoc.autodoc_body
+            candidates=candidate_autodocs(associated_autodoc),
+            pick_form=AutodocPickForm(),
+            job_status=job_status
             )
 
     # abort if permission not satisfied
@@ -403,6 +582,60 @@ def documentedit_editor(document_id):
     abort(403)
 
 
+@editor_bp.route('/editor/documents/<document_id>/autodocpick', methods=['POST'])
+@login_required
+@editor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+def autodocpick_editor(document_id):
+    """Make one of the document's autodoc candidates its current autodoc."""
+
+    # setup permission for individual document_id
+    permission = EditDocumentPermission(document_id)
+
+    # run route function if permission condition satisfied
+    if permission.can():
+
+        form = AutodocPickForm()
+
+        # the picked candidate becomes the latest revision of the document
+        if form.validate_on_submit():
+            if pick_candidate(int(document_id), int(form.autodoc_id.data)) is None:
+                abort(404)
+
+        # back to the edit page, which now shows the picked text
+        return redirect(url_for('editor_bp.documentedit_editor', document_id=document_id))
+
+    # abort if permission not satisfied
+    abort(403)
+
+
+@editor_bp.route('/editor/documents/<document_id>/autodocstream', methods=['GET'])
+@login_required
+@editor_permission.require(http_exception=403)
+@approved_permission.require(http_exception=403)
+def autodocstream_editor(document_id):
+    """Stream a new autodoc for the document as server-sent events."""
+
+    # setup permission for individual document_id
+    permission = EditDocumentPermission(document_id)
+
+    # run route function if permission condition satisfied
+    if permission.can():
+
+        # query for the document_id in question to get the object
+        document = db.session.query(Document).filter_by(id = document_id).first_or_404()
+
+        # tokens are pushed as they are decoded, the finished text is saved as a new autodoc
+        response = Response(stream_with_context(stream_autodoc(document)), mimetype='text/event-stream')
+        # keep proxies from buffering the stream
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    # abort if permission not satisfied
+    abort(403)
+
+
 # ---------- admin user routes ----------
 
 @admin_bp.route("/admin/logout")
@@ -436,65 +669,89 @@ def dashboard_admin():
 @admin_bp.route('/admin/signuprequests', methods=['GET','POST'])
 @login_required
 @admin_permission.require(http_exception=403)
+@read_only_view
 def signuprequests_admin():
 
-
     """Logged-in Admin List of Users."""
-    
-    # User objects list which includes list of all users which can be broken down into editors and sponsors
-    # get all users
-    user_objects=db.session.query(User.id,User.email,User.user_type,User.user_status,User.name,User.organization).\
-    order_by(User.id)
 
-    # get a count of the user objects
-    user_count = user_objects.count()
-    
-    # blank list to append to
-    user_list=[]
+    # User objects list which includes users which can be broken down into editors and sponsors
+    # only users still waiting for approval
+    user_objects=db.session.query(User.id,User.email,User.user_type,User.user_status,User.name,User.organization).\
+    filter(User.user_status == 'pending')
+
+    # one page of users, ordered by user id, from the after/before cursor
+    page = keyset_page(
+        user_objects,
+        User.id,
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=current_app.config['LIST_PAGE_SIZE']
+    )
 
-    # loop through user objects
-    for counter in range(0,user_count):
-        user_list.append(user_objects[counter])
-
-    # show list of document names
-    users = user_list
+    # show list of users
+    users = page.items
 
     """Logged-in User Dashboard."""
     return render_template(
         'signuprequests_admin.jinja2',
         title='Signup Requests Dashboard',
-        users=users
+        users=users,
+        page=page
     )
 
 @admin_bp.route('/admin/usersview', methods=['GET','POST'])
 @login_required
 @admin_permission.require(http_exception=403)
+@read_only_view
 def usersview_admin():
 
     """Logged-in Admin List of Users."""
-    
-    # User objects list which includes list of all users which can be broken down into editors and sponsors
-    # get all users
-    user_objects=db.session.query(User.id,User.email,User.user_type,User.user_status,User.name,User.organization).\
-    order_by(User.id)
 
-    # get a count of the user objects
-    user_count = user_objects.count()
-    
-    # blank list to append to
-    user_list=[]
-
-    # loop through user objects
-    for counter in range(0,user_count):
-        user_list.append(user_objects[counter])
+    # User objects list which includes users which can be broken down into editors and sponsors
+    # all users, a page at a time
+    user_objects=db.session.query(User.id,User.email,User.user_type,User.user_status,User.name,User.organization)
+
+    # one page of users, ordered by user id, from the after/before cursor
+    page = keyset_page(
+        user_objects,
+        User.id,
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=current_app.config['LIST_PAGE_SIZE']
+    )
 
-    # show list of document names
-    users = user_list
+    # show list of users
+    users = page.items
 
     """Logged-in User Dashboard."""
     return render_template(
         'usersview_admin.jinja2',
-        users=users
+        users=users,
+        page=page
+    )
+
+
+@admin_bp.route('/admin/autodoctimings', methods=['GET'])
+@login_required
+@admin_permission.require(http_exception=403)
+@read_only_view
+def autodoctimings_admin():
+
+    """Logged-in Admin Autodoc Generation Timings."""
+
+    # time window and optional decoding profile from the query string
+    since_hours = request.args.get('hours', 24, type=int)
+    profile = request.args.get('profile') or None
+
+    # p50/p95/p99 per pipeline stage, slowest first
+    stages = stage_percentiles(since_hours, profile)
+
+    return render_template(
+        'autodoctimings_admin.jinja2',
+        title='Autodoc Timings Dashboard',
+        stages=stages,
+        since_hours=since_hours,
+        profile=profile
     )
 
 
@@ -513,6 +770,8 @@ def userapprove_admin(user_id):
     user.user_status = 'approved'
     # commit to database
     db.session.commit()
+    # the user's roles change with their status
+    invalidate_identity(user.id)
 
     return redirect(url_for('admin_bp.usersview_admin'))    
 
@@ -530,6 +789,8 @@ def userreject_admin(user_id):
     user.user_status = 'rejected'
     # commit to database
     db.session.commit()
+    # the user's roles change with their status
+    invalidate_identity(user.id)
 
     return redirect(url_for('admin_bp.usersview_admin'))
 
@@ -0,0 +1,208 @@
+"""Versioned, non-destructive schema migrations."""
+# each migration only adds nullable columns and indexes, or widens column types, and is recorded in schema_migrations once applied,
+# so manage.py migrate_db can run on every deploy without touching existing rows
+# create_all never alters an existing table, every column added to an existing model needs a migration here
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+# index name, table and columns, in index order, and a postgres index method, which makes it postgres only
+IndexDefinition = namedtuple('IndexDefinition', ['name', 'table', 'columns', 'using'], defaults=[None])
+# nullable column added to a table, with its type on each dialect
+ColumnDefinition = namedtuple('ColumnDefinition', ['table', 'name', 'types'])
+# schema version, a short description, the indexes it adds, the columns added before them
+# and the columns widened to the types given, which never truncates a stored value
+Migration = namedtuple('Migration', ['version', 'name', 'indexes', 'columns', 'widened'], defaults=[(), ()])
+
+# packed token ids stored with each document body
+DOCUMENT_TOKEN_COLUMNS = (
+    ColumnDefinition('documents', 'document_token_ids', {'postgresql': 'bytea', 'sqlite': 'BLOB'}),
+)
+
+# decoding profile of each job, and the profile and fallback each autodoc was generated with
+PROFILE_COLUMNS = (
+    ColumnDefinition('autodocs', 'autodoc_profile', {'postgresql': 'VARCHAR(40)', 'sqlite': 'VARCHAR(40)'}),
+    ColumnDefinition('autodocs', 'autodoc_fallback', {'postgresql': 'VARCHAR(40)', 'sqlite': 'VARCHAR(40)'}),
+    ColumnDefinition('autodocjobs', 'job_profile', {'postgresql': 'VARCHAR(40)', 'sqlite': 'VARCHAR(40)'}),
+)
+
+# quiet period before a regeneration job runs
+REGENERATION_COLUMNS = (
+    ColumnDefinition('autodocjobs', 'run_after', {'postgresql': 'TIMESTAMP', 'sqlite': 'DATETIME'}),
+)
+
+# prompt window each autodoc was generated from
+PROMPT_WINDOW_COLUMNS = (
+    ColumnDefinition('autodocs', 'autodoc_prompt_window', {'postgresql': 'VARCHAR(20)', 'sqlite': 'VARCHAR(20)'}),
+    ColumnDefinition('autodocs', 'autodoc_prompt_lead_tokens', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}),
+    ColumnDefinition('autodocs', 'autodoc_prompt_tail_start', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}),
+    ColumnDefinition('autodocs', 'autodoc_prompt_document_tokens', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}),
+)
+# stored autodocs hold the prompt window as well as the generated tokens, more than the 1000 characters of a document body
+AUTODOC_BODY_COLUMNS = (
+    ColumnDefinition('autodocs', 'autodoc_body', {'postgresql': 'TEXT'}),
+    ColumnDefinition('autodoccache', 'autodoc_body', {'postgresql': 'TEXT'}),
+)
+
+# sibling beam search candidates, under the index name create_all gives autodoc_candidate_group
+CANDIDATE_COLUMNS = (
+    ColumnDefinition('autodocs', 'autodoc_candidate_group', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}),
+    ColumnDefinition('autodocs', 'autodoc_rank', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}),
+    ColumnDefinition('autodocs', 'autodoc_score', {'postgresql': 'DOUBLE PRECISION', 'sqlite': 'FLOAT'}),
+)
+CANDIDATE_INDEXES = (
+    IndexDefinition('ix_autodocs_autodoc_candidate_group', 'autodocs', ('autodoc_candidate_group',)),
+)
+
+# model and version each autodoc was generated by, selected on by backfill_autodocs --outdated
+MODEL_COLUMNS = (
+    ColumnDefinition('autodocs', 'autodoc_model', {'postgresql': 'VARCHAR(120)', 'sqlite': 'VARCHAR(120)'}),
+)
+MODEL_INDEXES = (
+    IndexDefinition('ix_autodocs_autodoc_model', 'autodocs', ('autodoc_model',)),
+)
+
+# hot join and filter columns of the list, permission and revision queries
+# the models declare the same indexes, so create_all on a new database matches a migrated one
+HOT_JOIN_INDEXES = (
+    # sponsor and editor document lists, keyset paged on document_id, and the permission lookup
+    IndexDefinition('ix_retentions_sponsor_document', 'retentions', ('sponsor_id', 'document_id')),
+    IndexDefinition('ix_retentions_editor_document', 'retentions', ('editor_id', 'document_id')),
+    # retention of one document, on the edit pages
+    IndexDefinition('ix_retentions_document', 'retentions', ('document_id',)),
+    # latest revision of a document is max(id) for its document_id
+    IndexDefinition('ix_revisions_document_revision', 'revisions', ('document_id', 'id')),
+    IndexDefinition('ix_revisions_autodoc', 'revisions', ('autodoc_id',)),
+    # editor choices, and the admin user lists keyset paged on id
+    IndexDefinition('ix_users_type_id', 'users', ('user_type', 'id')),
+    IndexDefinition('ix_users_status_id', 'users', ('user_status', 'id')),
+)
+
+# full-text search, the tsvector is postgres only, sqlite searches its own fts5 table
+SEARCH_COLUMNS = (
+    ColumnDefinition('documents', 'document_search', {'postgresql': 'tsvector', 'sqlite': 'TEXT'}),
+)
+SEARCH_INDEXES = (
+    IndexDefinition('ix_documents_search', 'documents', ('document_search',), 'gin'),
+)
+
+# every migration in version order, append new ones at the end and never edit an applied one
+MIGRATIONS = (
+    Migration(1, 'document token ids', (), DOCUMENT_TOKEN_COLUMNS),
+    Migration(2, 'decoding profiles', (), PROFILE_COLUMNS),
+    Migration(3, 'debounced regeneration', (), REGENERATION_COLUMNS),
+    Migration(4, 'prompt windows', (), PROMPT_WINDOW_COLUMNS, AUTODOC_BODY_COLUMNS),
+    Migration(5, 'autodoc candidates', CANDIDATE_INDEXES, CANDIDATE_COLUMNS),
+    Migration(6, 'autodoc model', MODEL_INDEXES, MODEL_COLUMNS),
+    Migration(7, 'hot join indexes', HOT_JOIN_INDEXES),
+    Migration(8, 'document search', SEARCH_INDEXES, SEARCH_COLUMNS),
+)
+
+CREATE_VERSION_TABLE = '''CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_on TIMESTAMP NOT NULL
+)'''
+
+
+def applied_versions(engine):
+    """Versions already recorded in schema_migrations, creating the table on first use."""
+    with engine.begin() as connection:
+        connection.execute(text(CREATE_VERSION_TABLE))
+        return set(row[0] for row in connection.execute(text('SELECT version FROM schema_migrations')))
+
+
+def pending_migrations(engine, target_version=None):
+    """Migrations not applied yet, up to and including target_version."""
+    applied = applied_versions(engine)
+    return [
+        migration for migration in MIGRATIONS
+        if migration.version not in applied and (target_version is None or migration.version <= target_version)
+    ]
+
+
+def create_index_sql(index, dialect_name):
+    # postgres builds the index without locking writes, sqlite has no concurrent builds
+    concurrently = ' CONCURRENTLY' if dialect_name == 'postgresql' else ''
+    using = ' USING %s' % index.using if index.using else ''
+    return 'CREATE INDEX%s IF NOT EXISTS %s ON %s%s (%s)' % (concurrently, index.name, index.table, using, ', '.join(index.columns))
+
+
+def _add_column(connection, column, dialect_name):
+    # a nullable column without a default is added without rewriting the table
+    if dialect_name == 'postgresql':
+        connection.execute(text('ALTER TABLE %s ADD COLUMN IF NOT EXISTS %s %s' % (column.table, column.name, column.types[dialect_name])))
+        return
+    # sqlite has no IF NOT EXISTS for columns
+    existing = [row[1] for row in connection.execute(text('PRAGMA table_info(%s)' % column.table))]
+    if column.name not in existing:
+        connection.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (column.table, column.name, column.types[dialect_name])))
+
+
+def _widen_column(connection, column, dialect_name):
+    # varchar to text needs no table rewrite on postgres, sqlite never enforces a varchar length
+    if dialect_name in column.types:
+        connection.execute(text('ALTER TABLE %s ALTER COLUMN %s TYPE %s' % (column.table, column.name, column.types[dialect_name])))
+
+
+def _drop_invalid_index(connection, index):
+    # an interrupted concurrent build leaves an invalid index, which IF NOT EXISTS would keep forever
+    invalid = connection.execute(text(
+        'SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name AND NOT i.indisvalid'
+    ), {'name': index.name}).first()
+    if invalid is not None:
+        print('Dropping invalid index ', index.name, ' left by an interrupted build', file=sys.stderr)
+        connection.execute(text('DROP INDEX CONCURRENTLY IF EXISTS %s' % index.name))
+
+
+def apply_migration(engine, migration):
+    """Add the migration's columns and indexes, widen its columns, refresh planner statistics and record its version."""
+    dialect_name = engine.dialect.name
+    # concurrent index builds cannot run inside a transaction
+    connection = engine.connect()
+    if dialect_name == 'postgresql':
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        # index builds on large tables may take longer than the app's statement_timeout
+        connection.execute(text('SET statement_timeout = 0'))
+    try:
+        for column in migration.columns:
+            print('Adding column ', column.name, ' to ', column.table, file=sys.stderr)
+            _add_column(connection, column, dialect_name)
+        for column in migration.widened:
+            print('Widening column ', column.name, ' of ', column.table, file=sys.stderr)
+            _widen_column(connection, column, dialect_name)
+        for index in migration.indexes:
+            # index methods like gin only exist on postgres
+            if index.using and dialect_name != 'postgresql':
+                continue
+            if dialect_name == 'postgresql':
+                _drop_invalid_index(connection, index)
+            print('Creating index ', index.name, ' on ', index.table, index.columns, file=sys.stderr)
+            connection.execute(text(create_index_sql(index, dialect_name)))
+        # new indexes are only picked once the planner has statistics for them
+        for table in sorted(set(index.table for index in migration.indexes)):
+            connection.execute(text('ANALYZE %s' % table))
+    finally:
+        # back to the connection's own statement_timeout before it returns to the pool
+        if dialect_name == 'postgresql':
+            connection.execute(text('RESET statement_timeout'))
+        connection.close()
+
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO schema_migrations (version, name, applied_on) VALUES (:version, :name, :applied_on)'), {
+            'version': migration.version,
+            'name': migration.name,
+            'applied_on': datetime.utcnow(),
+        })
+
+
+def migrate(engine, target_version=None):
+    """Apply every pending migration in version order, returns the migrations applied."""
+    migrations = pending_migrations(engine, target_version)
+    for migration in migrations:
+        print('Applying schema migration ', migration.version, ': ', migration.name, file=sys.stderr)
+        apply_migration(engine, migration)
+    return migrations
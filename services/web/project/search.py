@@ -0,0 +1,125 @@
+"""Full-text search over documents and their autodocs."""
+# postgres keeps a weighted tsvector on each document (name, body, latest autodoc) under a GIN index,
+# sqlite keeps the same text in an FTS5 table keyed by document id
+# both are refreshed in the transaction that writes the document or its autodoc
+import re
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import db
+from .models import Retention
+from .pagination import Page
+
+
+# one ranked search result
+SearchResult = namedtuple('SearchResult', ['document_id', 'document_name', 'rank'])
+
+# body of the document's latest autodoc, the one its pages show
+LATEST_AUTODOC_BODY = '''(
+    SELECT autodocs.autodoc_body FROM revisions JOIN autodocs ON autodocs.id = revisions.autodoc_id
+    WHERE revisions.document_id = documents.id ORDER BY revisions.id DESC LIMIT 1
+)'''
+
+# names weigh most, then bodies, then the generated text
+POSTGRES_INDEX = '''UPDATE documents SET document_search =
+    setweight(to_tsvector(CAST(:config AS regconfig), coalesce(documents.document_name, '')), 'A') ||
+    setweight(to_tsvector(CAST(:config AS regconfig), coalesce(documents.document_body, '')), 'B') ||
+    setweight(to_tsvector(CAST(:config AS regconfig), coalesce(%s, '')), 'C')
+WHERE documents.id >= :first_id AND documents.id <= :last_id''' % LATEST_AUTODOC_BODY
+
+SQLITE_CREATE = '''CREATE VIRTUAL TABLE IF NOT EXISTS document_search_fts
+USING fts5(document_name, document_body, autodoc_body)'''
+
+SQLITE_DELETE = 'DELETE FROM document_search_fts WHERE rowid >= :first_id AND rowid <= :last_id'
+
+SQLITE_INDEX = '''INSERT INTO document_search_fts (rowid, document_name, document_body, autodoc_body)
+SELECT documents.id, coalesce(documents.document_name, ''), coalesce(documents.document_body, ''), coalesce(%s, '')
+FROM documents WHERE documents.id >= :first_id AND documents.id <= :last_id''' % LATEST_AUTODOC_BODY
+
+# matching documents the user retains, with a rank where higher is better
+POSTGRES_MATCHES = '''SELECT documents.id AS document_id, documents.document_name AS document_name,
+    ts_rank_cd(documents.document_search, search_query) AS rank
+FROM retentions JOIN documents ON documents.id = retentions.document_id,
+    plainto_tsquery(CAST(:config AS regconfig), :query) search_query
+WHERE retentions.%s = :user_id AND documents.document_search @@ search_query'''
+
+SQLITE_MATCHES = '''SELECT documents.id AS document_id, documents.document_name AS document_name,
+    -bm25(document_search_fts, 10.0, 4.0, 1.0) AS rank
+FROM document_search_fts JOIN documents ON documents.id = document_search_fts.rowid
+JOIN retentions ON retentions.document_id = documents.id
+WHERE document_search_fts MATCH :query AND retentions.%s = :user_id'''
+
+# best first, ties by newest document, continuing below the (rank, document_id) cursor
+RANKED_PAGE = '''SELECT document_id, document_name, rank FROM (%s) matches
+WHERE :after_rank IS NULL OR rank < :after_rank OR (rank = :after_rank AND document_id < :after_id)
+ORDER BY rank DESC, document_id DESC
+LIMIT :limit'''
+
+
+def ensure_search_index(engine):
+    """Create the FTS5 table on sqlite, postgres keeps its tsvector on the documents table."""
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            connection.execute(text(SQLITE_CREATE))
+
+
+def index_documents(first_id, last_id):
+    """Refresh the search text of documents first_id to last_id in the current transaction."""
+    # pending changes to the documents and their revisions have to be in the database first
+    db.session.flush()
+    parameters = {'first_id': first_id, 'last_id': last_id}
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        db.session.execute(text(POSTGRES_INDEX), dict(parameters, config=current_app.config['SEARCH_TEXT_CONFIG']))
+    elif dialect_name == 'sqlite':
+        db.session.execute(text(SQLITE_DELETE), parameters)
+        db.session.execute(text(SQLITE_INDEX), parameters)
+
+
+def index_document(document_id):
+    """Refresh the search text of one document, after its name, body or latest autodoc changed."""
+    index_documents(document_id, document_id)
+
+
+def _fts5_query(query):
+    # every word as a quoted phrase, so punctuation in the search box is never fts5 syntax
+    return ' '.join('"%s"' % word for word in re.findall(r'\w+', query))
+
+
+def parse_cursor(cursor):
+    """(rank, document_id) of an after cursor, (None, None) for the first page."""
+    if not cursor:
+        return None, None
+    rank, document_id = cursor.split(':')
+    return float(rank), int(document_id)
+
+
+def search_documents(user_id, user_type, query, after=None, page_size=50):
+    """Page of the documents user_id retains matching query, best first, continuing after a cursor."""
+    retention_column = Retention.sponsor_id if user_type == 'sponsor' else Retention.editor_id
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        matches = POSTGRES_MATCHES % retention_column.key
+        query_parameter = query
+    else:
+        matches = SQLITE_MATCHES % retention_column.key
+        query_parameter = _fts5_query(query)
+    if not query_parameter.strip():
+        return Page([], None, None)
+
+    after_rank, after_id = parse_cursor(after)
+    # one extra row tells whether there is a next page, without a count
+    rows = db.session.execute(text(RANKED_PAGE % matches), {
+        'config': current_app.config['SEARCH_TEXT_CONFIG'],
+        'query': query_parameter,
+        'user_id': user_id,
+        'after_rank': after_rank,
+        'after_id': after_id,
+        'limit': page_size + 1,
+    }).fetchall()
+    items = [SearchResult(*row) for row in rows[:page_size]]
+    # repr keeps every digit of the rank, so the cursor matches the row exactly
+    next_cursor = '%r:%d' % (items[-1].rank, items[-1].document_id) if len(rows) > page_size else None
+    return Page(items, next_cursor, None)
@@ -17,8 +17,9 @@ class Autodoc(db.Model):
         db.Integer,
         primary_key=True
     )
+    """prompt window and generated tokens, longer than the document body it was generated from"""
     autodoc_body = db.Column(
-        db.String(1000),
+        db.Text,
         unique=False,
         nullable=True
     )
@@ -28,6 +29,68 @@ class Autodoc(db.Model):
         unique=False,
         nullable=True
     )
+    """model name and pinned version that generated this autodoc, e.g. 'gpt2@hub'"""
+    autodoc_model = db.Column(
+        db.String(120),
+        index=True,
+        unique=False,
+        nullable=True
+    )
+    """decoding profile requested for this autodoc"""
+    autodoc_profile = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=True
+    )
+    """fallback used when the profile missed its deadline, e.g. 'fast' or 'fast:partial'"""
+    autodoc_fallback = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=True
+    )
+    """prompt window the text was generated from, 'full', 'tail' or 'lead_tail'"""
+    autodoc_prompt_window = db.Column(
+        db.String(20),
+        unique=False,
+        nullable=True
+    )
+    """document tokens kept from the start of the body"""
+    autodoc_prompt_lead_tokens = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+    """first document token of the tail"""
+    autodoc_prompt_tail_start = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+    """document length in tokens when the autodoc was generated"""
+    autodoc_prompt_document_tokens = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+    """id of the best autodoc of the same generate pass, shared by all its candidates"""
+    autodoc_candidate_group = db.Column(
+        db.Integer,
+        index=True,
+        unique=False,
+        nullable=True
+    )
+    """position among the candidates, 0 is the best"""
+    autodoc_rank = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+    """mean log-probability of the generated tokens"""
+    autodoc_score = db.Column(
+        db.Float,
+        unique=False,
+        nullable=True
+    )
 
     """backreferences Document class on revisions table"""
     documents = relationship(
@@ -42,6 +105,11 @@ class Revision(db.Model):
     """Model for who retains which document"""
     """Associate database."""
     __tablename__ = 'revisions'
+    """latest revision of a document, and the documents of an autodoc"""
+    __table_args__ = (
+        db.Index('ix_revisions_document_revision', 'document_id', 'id'),
+        db.Index('ix_revisions_autodoc', 'autodoc_id'),
+    )
 
     id = db.Column(
         db.Integer, 
@@ -74,4 +142,189 @@ class Revision(db.Model):
     autodoc = db.relationship(
         'Autodoc', 
         back_populates='documents'
-        )
\ No newline at end of file
+        )
+
+
+"""Autodoc Job Object - Queued Autodoc Generation"""
+class AutodocJob(db.Model):
+    """Model for queued autodoc generation jobs"""
+    """Describes table which includes one row per generation job."""
+    __tablename__ = 'autodocjobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    document_id = db.Column(
+        db.Integer,
+        db.ForeignKey('documents.id'),
+        unique=False,
+        nullable=False
+    )
+
+    """decoding profile to generate with, Config default when empty"""
+    job_profile = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=True
+    )
+
+    """pending, running, failed or done"""
+    job_status = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=False
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=False,
+        default=0
+    )
+
+    last_error = db.Column(
+        db.String(1000),
+        unique=False,
+        nullable=True
+    )
+
+    created_on = db.Column(
+        db.DateTime,
+        index=False,
+        unique=False,
+        nullable=True
+    )
+
+    """pending jobs are not started before this time, pushed back by further edits"""
+    run_after = db.Column(
+        db.DateTime,
+        index=False,
+        unique=False,
+        nullable=True
+    )
+
+    updated_on = db.Column(
+        db.DateTime,
+        index=False,
+        unique=False,
+        nullable=True
+    )
+
+
+
+"""Autodoc Cache Object - Generated Text Keyed by Prompt and Decoding Parameters"""
+class AutodocCacheEntry(db.Model):
+    """Model for the persistent tier of the autodoc generation cache"""
+    __tablename__ = 'autodoccache'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    """sha256 of prompt token ids, model id and decoding parameters"""
+    cache_key = db.Column(
+        db.String(64),
+        index=True,
+        unique=True,
+        nullable=False
+    )
+
+    """prompt window and generated tokens, longer than the document body it was generated from"""
+    autodoc_body = db.Column(
+        db.Text,
+        unique=False,
+        nullable=True
+    )
+
+    created_on = db.Column(
+        db.DateTime,
+        index=False,
+        unique=False,
+        nullable=True
+    )
+
+
+"""Autodoc Timing Object - Per-Stage Generation Timings"""
+class AutodocTiming(db.Model):
+    """Model for the duration of one stage of one autodoc generation"""
+    """Describes table which includes one row per stage, grouped by timing_run."""
+    __tablename__ = 'autodoctimings'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    """shared by every stage of the same generation"""
+    timing_run = db.Column(
+        db.String(32),
+        index=True,
+        unique=False,
+        nullable=False
+    )
+
+    document_id = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+
+    """pipeline stage, e.g. 'tokenize', 'generate', 'save' or 'total'"""
+    stage = db.Column(
+        db.String(40),
+        index=True,
+        unique=False,
+        nullable=False
+    )
+
+    seconds = db.Column(
+        db.Float,
+        unique=False,
+        nullable=False
+    )
+
+    autodoc_model = db.Column(
+        db.String(120),
+        unique=False,
+        nullable=True
+    )
+
+    autodoc_profile = db.Column(
+        db.String(40),
+        unique=False,
+        nullable=True
+    )
+
+    """tokens in the prompt window the model saw"""
+    prompt_tokens = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+
+    """tokens generated after the prompt, best candidate only"""
+    new_tokens = db.Column(
+        db.Integer,
+        unique=False,
+        nullable=True
+    )
+
+    succeeded = db.Column(
+        db.Boolean,
+        unique=False,
+        nullable=False,
+        default=True
+    )
+
+    created_on = db.Column(
+        db.DateTime,
+        index=True,
+        unique=False,
+        nullable=False
+    )
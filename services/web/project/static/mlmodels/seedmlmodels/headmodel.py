@@ -0,0 +1,186 @@
+# local, versioned store of exported head models
+# each artifact is a directory <store>/<model_name>/<version>/ holding config and tokenizer files,
+# one .npy file per weight tensor and a manifest.json with the sha256 of every file
+# weights are opened with numpy memory mapping, pytorch models use the mapping in place,
+# so processes loading the same artifact share the page cache, tensorflow models copy it into their variables
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+
+# written after an artifact's checksums pass, holds the sha256 of the manifest it verified
+VERIFIED_MARKER = '.verified'
+
+# artifacts already verified by this process
+_verified = set()
+_verified_lock = threading.Lock()
+
+
+def artifact_dir(store_dir, model_name, version):
+	"""Directory of one pinned artifact in the store."""
+	return os.path.join(store_dir, model_name, version)
+
+
+def file_sha256(path):
+	sha = hashlib.sha256()
+	with open(path, 'rb') as artifact_file:
+		for chunk in iter(lambda: artifact_file.read(1024 * 1024), b''):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+
+def _named_weights(model, backend):
+	# (name, numpy array) for every weight, in a stable order for the architecture
+	if backend == 'tensorflow':
+		# tensorflow variable names carry a per-instance prefix, so weights are matched by position
+		return [(variable.name, variable.numpy()) for variable in model.weights]
+	return [(name, tensor.detach().cpu().numpy()) for name, tensor in model.state_dict().items()]
+
+
+def export_artifact(model_name, version, store_dir, backend='tensorflow'):
+	"""Export model_name's tokenizer, config and weights into the store as version."""
+	import numpy as np
+
+	from project.static.src.models.backends import BACKENDS
+	target_dir = artifact_dir(store_dir, model_name, version)
+	if os.path.exists(os.path.join(target_dir, 'manifest.json')):
+		raise ValueError('artifact %s/%s already exists, versions are immutable' % (model_name, version))
+	os.makedirs(os.path.join(target_dir, 'weights'), exist_ok=True)
+
+	# load through the regular backend, from the hub cache
+	handle = BACKENDS[backend](model_name)
+	handle.load()
+	handle.tokenizer.save_pretrained(target_dir)
+	handle.model.config.save_pretrained(target_dir)
+
+	weights = []
+	for index, (name, value) in enumerate(_named_weights(handle.model, backend)):
+		weight_file = os.path.join('weights', '%04d.npy' % index)
+		np.save(os.path.join(target_dir, weight_file), value)
+		weights.append({'name': name, 'file': weight_file, 'shape': list(value.shape), 'dtype': str(value.dtype)})
+
+	# checksum every file except the manifest and the verified marker
+	files = {}
+	for root, dirs, filenames in os.walk(target_dir):
+		for filename in filenames:
+			if filename in ('manifest.json', VERIFIED_MARKER):
+				continue
+			relative_path = os.path.relpath(os.path.join(root, filename), target_dir)
+			files[relative_path] = file_sha256(os.path.join(root, filename))
+
+	manifest = {
+		'model_name': model_name,
+		'version': version,
+		'backend': backend,
+		'created_on': datetime.utcnow().isoformat(),
+		'files': files,
+		'weights': weights,
+	}
+	with open(os.path.join(target_dir, 'manifest.json'), 'w') as manifest_file:
+		json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+	return target_dir
+
+
+def read_manifest(target_dir):
+	with open(os.path.join(target_dir, 'manifest.json')) as manifest_file:
+		return json.load(manifest_file)
+
+
+def verify_artifact(target_dir):
+	"""Check every file against the manifest, once per artifact; raises ValueError on a mismatch."""
+	with _verified_lock:
+		if target_dir in _verified:
+			return
+		manifest_sha = file_sha256(os.path.join(target_dir, 'manifest.json'))
+
+		# another process already verified this exact manifest
+		marker_path = os.path.join(target_dir, VERIFIED_MARKER)
+		if os.path.exists(marker_path):
+			with open(marker_path) as marker_file:
+				if marker_file.read().strip() == manifest_sha:
+					_verified.add(target_dir)
+					return
+
+		print('Verifying model artifact ', target_dir, file=sys.stderr)
+		for relative_path, expected_sha in read_manifest(target_dir)['files'].items():
+			if file_sha256(os.path.join(target_dir, relative_path)) != expected_sha:
+				raise ValueError('checksum mismatch for %s in %s' % (relative_path, target_dir))
+
+		# the marker is best effort, a read-only store just verifies once per process
+		try:
+			with open(marker_path, 'w') as marker_file:
+				marker_file.write(manifest_sha)
+		except OSError:
+			pass
+		_verified.add(target_dir)
+
+
+def mapped_weights(target_dir, backend):
+	"""Weights of an artifact as read-only memory-mapped numpy arrays, in manifest order."""
+	import numpy as np
+
+	verify_artifact(target_dir)
+	manifest = read_manifest(target_dir)
+	# weight names and order follow the framework the artifact was exported from
+	if manifest['backend'] != backend:
+		raise ValueError('artifact %s was exported for %s, not %s' % (target_dir, manifest['backend'], backend))
+	return [
+		(weight['name'], np.load(os.path.join(target_dir, weight['file']), mmap_mode='r'))
+		for weight in manifest['weights']
+	]
+
+
+def load_tokenizer(target_dir):
+	"""GPT2 tokenizer from an artifact, no network access."""
+	from transformers import GPT2Tokenizer
+
+	verify_artifact(target_dir)
+	return GPT2Tokenizer.from_pretrained(target_dir)
+
+
+def load_tf_model(target_dir, pad_token_id):
+	"""TFGPT2LMHeadModel built from an artifact's config and weights.
+
+	Tensorflow variables own their memory, so the mapped weights are copied into them once,
+	and every process holds its own copy of the model.
+	"""
+	from transformers import GPT2Config, TFGPT2LMHeadModel
+
+	config = GPT2Config.from_pretrained(target_dir, pad_token_id=pad_token_id)
+	model = TFGPT2LMHeadModel(config)
+	# one call on the dummy inputs creates the variables
+	model(model.dummy_inputs)
+
+	weights = mapped_weights(target_dir, 'tensorflow')
+	if len(weights) != len(model.weights):
+		raise ValueError('artifact %s has %s weights, model expects %s' % (target_dir, len(weights), len(model.weights)))
+	for variable, (name, value) in zip(model.weights, weights):
+		if tuple(variable.shape) != value.shape:
+			raise ValueError('weight %s has shape %s, model expects %s' % (name, value.shape, tuple(variable.shape)))
+		variable.assign(value)
+	print('Copied the weights of ', target_dir, ' into this process, the pytorch backend shares them between workers', file=sys.stderr)
+	return model
+
+
+def load_torch_model(target_dir, pad_token_id):
+	"""GPT2LMHeadModel whose parameters point straight at the memory-mapped weights."""
+	import torch
+	from transformers import GPT2Config, GPT2LMHeadModel
+
+	config = GPT2Config.from_pretrained(target_dir, pad_token_id=pad_token_id)
+	model = GPT2LMHeadModel(config)
+	model.eval()
+
+	tensors = dict(model.state_dict(keep_vars=True))
+	for name, value in mapped_weights(target_dir, 'pytorch'):
+		if name not in tensors:
+			raise ValueError('artifact %s has unexpected weight %s' % (target_dir, name))
+		# from_numpy shares the mapping, no private copy, the weights are never written to
+		tensors[name].data = torch.from_numpy(value)
+	# the output layer shares the input embedding again, instead of holding a second mapping
+	model.tie_weights()
+	return model
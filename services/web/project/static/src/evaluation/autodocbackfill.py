@@ -0,0 +1,117 @@
+# bulk autodoc generation for manage.py backfill_autodocs
+# documents without an autodoc, or whose latest autodoc came from another model, are generated
+# on a process pool in id order, committed chunk by chunk, with a checkpoint file to resume from
+# which also lists the documents that failed, so a resumed run retries them first
+import json
+import os
+import sys
+
+from flask import current_app
+from sqlalchemy import exists
+
+# import the database
+from project import db
+from project.models import Document
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import Autodoc, Revision
+# current model and version, compared with what generated each autodoc
+from project.static.src.models.modelregistry import model_identity
+# stored token ids of each document
+from project.static.src.features.doctokenization import gpt2tokenize
+
+
+def backfill_query(outdated=False):
+	"""Documents needing an autodoc, in id order: no revision, or with outdated a latest autodoc from another model."""
+	missing = ~exists().where(Revision.document_id == Document.id)
+	if not outdated:
+		return Document.query.filter(missing).order_by(Document.id)
+
+	# only the latest revision of each document counts
+	latest_revisions = db.session.query(Revision.document_id, db.func.max(Revision.id).label('revision_id')).\
+	group_by(Revision.document_id).\
+	subquery()
+	return Document.query.\
+	outerjoin(latest_revisions, latest_revisions.c.document_id == Document.id).\
+	outerjoin(Revision, Revision.id == latest_revisions.c.revision_id).\
+	outerjoin(Autodoc, Autodoc.id == Revision.autodoc_id).\
+	filter(db.or_(
+		Autodoc.id.is_(None),
+		Autodoc.autodoc_model.is_(None),
+		Autodoc.autodoc_model != model_identity(current_app.config)
+	)).\
+	order_by(Document.id)
+
+
+def read_checkpoint(checkpoint_path, run_key):
+	"""Last committed document id and the ids that failed up to it, of an interrupted run with the same run_key.
+
+	(0, []) when there is no such checkpoint.
+	"""
+	if not checkpoint_path or not os.path.exists(checkpoint_path):
+		return 0, []
+	with open(checkpoint_path) as checkpoint_file:
+		checkpoint = json.load(checkpoint_file)
+	# a checkpoint of a different model, profile or selection starts over
+	if checkpoint.get('run_key') != run_key:
+		print('Ignoring checkpoint of another backfill run ', checkpoint.get('run_key'), file=sys.stderr)
+		return 0, []
+	return checkpoint['last_document_id'], checkpoint.get('failed_document_ids', [])
+
+
+def write_checkpoint(checkpoint_path, run_key, last_document_id, documents_done, failed_document_ids):
+	# write then rename, so an interrupted write never leaves a broken checkpoint
+	temporary_path = checkpoint_path + '.tmp'
+	with open(temporary_path, 'w') as checkpoint_file:
+		json.dump({
+			'run_key': run_key,
+			'last_document_id': last_document_id,
+			'documents_done': documents_done,
+			'failed_document_ids': sorted(failed_document_ids),
+		}, checkpoint_file)
+	os.replace(temporary_path, checkpoint_path)
+
+
+def still_selected(query, document_ids):
+	"""The document_ids query still selects, failed documents given an autodoc since need no retry."""
+	if not document_ids:
+		return []
+	return [row.id for row in query.filter(Document.id.in_(list(document_ids))).with_entities(Document.id)]
+
+
+def generate_chunk(chunk, profile_name):
+	"""Pool worker: generate an AutodocResult for every (document_id, token_ids) in chunk."""
+	# each spawned worker builds its own app and loads its own model once
+	from project import app
+	from project.static.src.evaluation.autodocwriter import autodocgenerate
+	from project.static.src.evaluation.autodoctiming import timed_generation
+
+	results = []
+	with app.app_context():
+		for document_id, token_ids in chunk:
+			try:
+				# saving happens in the parent, so only generation is timed here
+				with timed_generation(document_id, profile_name):
+					results.append((document_id, autodocgenerate([token_ids], profile_name), None))
+			except Exception as error:
+				results.append((document_id, None, repr(error)))
+	return results
+
+
+def retry_chunks(query, document_ids, chunk_size):
+	# documents that failed in an earlier run, in id order, tokenized like document_chunks
+	document_ids = sorted(document_ids)
+	for start in range(0, len(document_ids), chunk_size):
+		documents = query.filter(Document.id.in_(document_ids[start:start + chunk_size])).all()
+		if documents:
+			yield [(document.id, gpt2tokenize(document)[0]) for document in documents]
+
+
+def document_chunks(query, after_document_id, chunk_size):
+	# keyset pagination on the document id, so committed chunks never shift the next page
+	while True:
+		documents = query.filter(Document.id > after_document_id).limit(chunk_size).all()
+		if not documents:
+			return
+		# legacy rows without stored token ids are tokenized here, and committed with the chunk
+		yield [(document.id, gpt2tokenize(document)[0]) for document in documents]
+		after_document_id = documents[-1].id
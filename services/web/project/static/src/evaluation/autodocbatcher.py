@@ -0,0 +1,144 @@
+# dynamic micro-batching in front of the shared head model
+# concurrent autodoc requests are collected for a short window, left-padded into one batch
+# and generated with a single model.generate call, or one call per prompt length on backends
+# which would shift the positions of padded prompts
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from project.static.src.evaluation.autodocdecoding import max_length_kwargs
+
+
+# batchers keyed by model name and decoding parameters, one per worker process
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+class GenerationBatcher(object):
+	"""Collect generate requests for up to window_seconds or max_batch_size items and run them together."""
+
+	def __init__(self, handle, window_seconds=0.03, max_batch_size=8, **generate_kwargs):
+		self.handle = handle
+		self.window_seconds = window_seconds
+		self.max_batch_size = max_batch_size
+		# decoding parameters shared by every request in a batch
+		self.generate_kwargs = generate_kwargs
+		self._requests = queue.Queue()
+		self._thread = None
+		self._thread_lock = threading.Lock()
+		# batch statistics
+		self.batches_run = 0
+		self.items_run = 0
+
+	def _ensure_thread(self):
+		# start the collector thread on first use, so forked workers each start their own
+		with self._thread_lock:
+			if self._thread is None or not self._thread.is_alive():
+				self._thread = threading.Thread(target=self._collect, name='autodoc-batcher', daemon=True)
+				self._thread.start()
+
+	def submit(self, token_ids, deadline=None):
+		"""Queue one prompt (a list of token ids) and return a Future resolving to its prompt plus generated token ids.
+
+		On backends which stop at a deadline, the batch stops at the latest deadline of its prompts.
+		"""
+		future = Future()
+		self._requests.put((list(token_ids), deadline, future))
+		self._ensure_thread()
+		return future
+
+	def generate(self, token_ids, timeout=None):
+		"""Queue one prompt and block until its output token ids are ready."""
+		return self.submit(token_ids).result(timeout=timeout)
+
+	def _collect(self):
+		while True:
+			# block for the first request, then keep collecting until the window closes or the batch is full
+			batch = [self._requests.get()]
+			window_closes = time.perf_counter() + self.window_seconds
+			while len(batch) < self.max_batch_size:
+				remaining = window_closes - time.perf_counter()
+				if remaining <= 0:
+					break
+				try:
+					batch.append(self._requests.get(timeout=remaining))
+				except queue.Empty:
+					break
+			self._run_batch(batch)
+
+	def _run_batch(self, batch):
+		# no prompt is cut short, a prompt without a deadline keeps the whole batch running
+		deadlines = [deadline for token_ids, deadline, future in batch]
+		deadline = None if None in deadlines else max(deadlines)
+		try:
+			outputs = self.generate_batch([token_ids for token_ids, deadline, future in batch], deadline)
+		except Exception as error:
+			print('Autodoc batch of ', len(batch), ' failed: ', repr(error), file=sys.stderr)
+			for token_ids, deadline, future in batch:
+				future.set_exception(error)
+			return
+		for (token_ids, deadline, future), output_ids in zip(batch, outputs):
+			future.set_result(output_ids)
+
+	def generate_batch(self, prompts, deadline=None):
+		"""Run prompts in as few generate calls as the backend allows, returns each output without padding, in prompt order."""
+		# a left-padded row only generates the same text as its prompt alone when the backend positions tokens
+		# from the attention mask, otherwise only prompts of the same length share a generate
+		if self.handle.left_padding_safe:
+			groups = [list(range(len(prompts)))]
+		else:
+			groups_by_length = {}
+			for index, token_ids in enumerate(prompts):
+				groups_by_length.setdefault(len(token_ids), []).append(index)
+			groups = list(groups_by_length.values())
+
+		outputs = [None] * len(prompts)
+		for group in groups:
+			for index, output_ids in zip(group, self._generate_padded([prompts[index] for index in group], deadline)):
+				outputs[index] = output_ids
+
+		self.batches_run += 1
+		self.items_run += len(prompts)
+		return outputs
+
+	def _generate_padded(self, prompts, deadline=None):
+		# left-pad prompts into one batch, run one generate and strip the padding again
+		pad_token_id = self.handle.tokenizer.eos_token_id
+		longest = max(len(token_ids) for token_ids in prompts)
+
+		# left padding keeps every prompt's last token aligned with the first generated position
+		input_ids = []
+		attention_mask = []
+		for token_ids in prompts:
+			padding = longest - len(token_ids)
+			input_ids.append([pad_token_id] * padding + token_ids)
+			attention_mask.append([0] * padding + [1] * len(token_ids))
+
+		# max_length counts the padded prompt, max_new_tokens are added to the longest prompt
+		generate_kwargs = max_length_kwargs(self.generate_kwargs, longest)
+		if 'max_length' in generate_kwargs:
+			generate_kwargs['max_length'] = max(generate_kwargs['max_length'], longest)
+
+		output = self.handle.generate(
+			input_ids,
+			# prompts of the same length need no mask
+			attention_mask=attention_mask if any(len(token_ids) < longest for token_ids in prompts) else None,
+			deadline=deadline,
+			**generate_kwargs
+		)
+
+		# each row starts with its own prompt again, the caller decodes and counts new tokens as without batching
+		return [output[row][longest - len(token_ids):] for row, token_ids in enumerate(prompts)]
+
+
+def get_batcher(handle, window_seconds, max_batch_size, **generate_kwargs):
+	"""Return the shared batcher for this model and set of decoding parameters."""
+	key = (handle.backend_name, handle.model_name, window_seconds, max_batch_size, tuple(sorted(generate_kwargs.items())))
+	with _batchers_lock:
+		batcher = _batchers.get(key)
+		if batcher is None:
+			batcher = GenerationBatcher(handle, window_seconds, max_batch_size, **generate_kwargs)
+			_batchers[key] = batcher
+	return batcher
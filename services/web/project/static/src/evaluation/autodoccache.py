@@ -0,0 +1,106 @@
+# content-addressed cache of generated autodocs
+# keyed by a hash of the prompt token ids, the model id and the decoding parameters
+# an in-memory LRU sits in front of an optional table that survives restarts
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+# import the database
+from project import db
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import AutodocCacheEntry
+
+
+# in-memory tier, most recently used entries at the end
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+# hit/miss/eviction counters for this process
+_stats = {
+	'memory_hits': 0,
+	'db_hits': 0,
+	'misses': 0,
+	'evictions': 0,
+	'stores': 0,
+}
+
+
+def cache_key(token_ids, model_name, generate_kwargs):
+	"""sha256 over the prompt token ids, model id and decoding parameters."""
+	key_source = json.dumps({
+		'token_ids': list(token_ids),
+		'model': model_name,
+		'params': generate_kwargs,
+	}, sort_keys=True, separators=(',', ':'))
+	return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+
+def _remember(key, autodoc_body, max_entries):
+	# insert into the LRU and evict the least recently used entries over max_entries
+	with _memory_lock:
+		_memory[key] = autodoc_body
+		_memory.move_to_end(key)
+		while len(_memory) > max_entries:
+			_memory.popitem(last=False)
+			_stats['evictions'] += 1
+
+
+def lookup(key, max_entries, use_db):
+	"""Return the cached autodoc body for key, or None on a miss."""
+	with _memory_lock:
+		if key in _memory:
+			_memory.move_to_end(key)
+			_stats['memory_hits'] += 1
+			print('Autodoc cache memory hit: ', key, file=sys.stderr)
+			return _memory[key]
+
+	if use_db:
+		entry = db.session.query(AutodocCacheEntry.autodoc_body).filter(AutodocCacheEntry.cache_key == key).first()
+		if entry is not None:
+			_stats['db_hits'] += 1
+			print('Autodoc cache table hit: ', key, file=sys.stderr)
+			# promote into the memory tier
+			_remember(key, entry.autodoc_body, max_entries)
+			return entry.autodoc_body
+
+	_stats['misses'] += 1
+	print('Autodoc cache miss: ', key, ' stats: ', cache_stats(), file=sys.stderr)
+	return None
+
+
+def store(key, autodoc_body, max_entries, use_db):
+	"""Store a freshly generated autodoc body under key."""
+	_remember(key, autodoc_body, max_entries)
+	_stats['stores'] += 1
+
+	if use_db:
+		# savepoint so a concurrent insert of the same key does not roll back the caller's work
+		try:
+			with db.session.begin_nested():
+				db.session.add(AutodocCacheEntry(
+					cache_key=key,
+					autodoc_body=autodoc_body,
+					created_on=datetime.utcnow()
+				))
+		except IntegrityError:
+			print('Autodoc cache key already stored: ', key, file=sys.stderr)
+
+
+def cache_stats():
+	"""Hit, miss and eviction counters plus tier sizes for this process."""
+	stats = dict(_stats)
+	lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+	stats['memory_entries'] = len(_memory)
+	stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+	return stats
+
+
+def clear_memory():
+	"""Drop the in-memory tier, the table tier is left alone."""
+	with _memory_lock:
+		_memory.clear()
@@ -0,0 +1,39 @@
+# sibling autodoc candidates from one generate pass
+# the document shows its latest revision, picking a candidate appends a revision pointing at it
+import sys
+
+# import the database
+from project import db
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import Autodoc, Revision
+# search text of each document includes its latest autodoc
+from project.search import index_document
+
+
+def candidate_autodocs(autodoc):
+	"""Every candidate generated together with autodoc, best first, empty if it was generated alone."""
+	if autodoc is None or autodoc.autodoc_candidate_group is None:
+		return []
+	return Autodoc.query.filter(
+		Autodoc.autodoc_candidate_group == autodoc.autodoc_candidate_group
+	).order_by(Autodoc.autodoc_rank).all()
+
+
+def pick_candidate(document_id, autodoc_id):
+	"""Make autodoc_id the document's current autodoc, returns None unless it was generated for the document."""
+	# only autodocs already linked to this document can be picked
+	revision = Revision.query.filter_by(document_id=document_id, autodoc_id=autodoc_id).first()
+	if revision is None:
+		return None
+
+	# the picked text becomes the latest revision, earlier revisions are kept
+	db.session.add(Revision(
+		document_id=document_id,
+		autodoc_id=autodoc_id
+		))
+	# the picked text is now the one searched
+	index_document(document_id)
+	db.session.commit()
+
+	print('Picked autodoc ', autodoc_id, ' for document ', document_id, file=sys.stderr)
+	return revision.autodoc
@@ -0,0 +1,101 @@
+# incremental token-by-token decoding on the shared head model
+# used where generation has to stop on a wall clock deadline or hand out tokens as they are produced
+import time
+
+import numpy as np
+
+
+# reasons an IncrementalDecoder stopped, stored in stop_reason
+STOP_EOS = 'eos'
+STOP_LENGTH = 'length'
+STOP_DEADLINE = 'deadline'
+
+
+def banned_ngram_tokens(token_ids, ngram_size):
+	"""Tokens which would repeat an n-gram of ngram_size already present in token_ids."""
+	if ngram_size <= 0 or len(token_ids) < ngram_size:
+		return []
+	# the last ngram_size - 1 tokens are the prefix of the n-gram about to be completed
+	prefix = token_ids[len(token_ids) - ngram_size + 1:]
+	banned = []
+	for start in range(len(token_ids) - ngram_size + 1):
+		if token_ids[start:start + ngram_size - 1] == prefix:
+			banned.append(token_ids[start + ngram_size - 1])
+	return banned
+
+
+def max_length_kwargs(generate_kwargs, prompt_length):
+	"""generate kwargs with max_new_tokens turned into the max_length model.generate expects."""
+	generate_kwargs = dict(generate_kwargs)
+	if 'max_new_tokens' in generate_kwargs:
+		generate_kwargs['max_length'] = prompt_length + generate_kwargs.pop('max_new_tokens')
+	return generate_kwargs
+
+
+class IncrementalDecoder(object):
+	"""Iterate over newly generated token ids, one cached forward pass per token.
+
+	Greedy by default, sampled with do_sample. Iteration stops at the eos token, after
+	max_new_tokens or once time.perf_counter() passes deadline, and stop_reason records which.
+	"""
+
+	def __init__(self, handle, token_ids, max_new_tokens, deadline=None, no_repeat_ngram_size=0, do_sample=False, top_k=50, temperature=1.0):
+		self.handle = handle
+		self.token_ids = list(token_ids)
+		self.max_new_tokens = max_new_tokens
+		self.deadline = deadline
+		self.no_repeat_ngram_size = no_repeat_ngram_size
+		self.do_sample = do_sample
+		self.top_k = top_k
+		self.temperature = temperature
+		# filled while iterating
+		self.new_token_ids = []
+		self.stop_reason = None
+
+	def _next_token(self, logits):
+		# never repeat an n-gram, same as no_repeat_ngram_size in model.generate
+		logits = logits.astype(np.float64)
+		for token_id in banned_ngram_tokens(self.token_ids + self.new_token_ids, self.no_repeat_ngram_size):
+			logits[token_id] = -np.inf
+
+		if not self.do_sample:
+			return int(np.argmax(logits))
+
+		# temperature and top-k sampling
+		logits = logits / self.temperature
+		if self.top_k and self.top_k < logits.shape[-1]:
+			cutoff = np.partition(logits, -self.top_k)[-self.top_k]
+			logits[logits < cutoff] = -np.inf
+		probabilities = np.exp(logits - np.max(logits))
+		probabilities = probabilities / probabilities.sum()
+		return int(np.random.choice(probabilities.shape[-1], p=probabilities))
+
+	def __iter__(self):
+		eos_token_id = self.handle.tokenizer.eos_token_id
+		past = None
+		# the whole prompt goes through the first pass, every later pass only feeds the newest token
+		step_ids = self.token_ids
+		while True:
+			if len(self.new_token_ids) >= self.max_new_tokens:
+				self.stop_reason = STOP_LENGTH
+				return
+			if self.deadline is not None and time.perf_counter() >= self.deadline:
+				self.stop_reason = STOP_DEADLINE
+				return
+
+			logits, past = self.handle.forward(step_ids, past)
+			next_token_id = self._next_token(logits)
+
+			if next_token_id == eos_token_id:
+				self.stop_reason = STOP_EOS
+				return
+
+			self.new_token_ids.append(next_token_id)
+			yield next_token_id
+			step_ids = [next_token_id]
+
+	def run(self):
+		"""Decode to completion and return the prompt plus generated token ids."""
+		for token_id in self:
+			pass
+		return self.token_ids + self.new_token_ids
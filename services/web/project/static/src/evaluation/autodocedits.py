@@ -0,0 +1,69 @@
+# change-aware, debounced autodoc regeneration for document edits
+# a save only regenerates when the body changed by more than a token-level diff ratio,
+# and rapid saves of the same document fold into one regeneration after a quiet period
+import sys
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+
+from flask import current_app
+
+# import the database
+from project import db
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import AutodocJob
+# packed token ids stored with each document
+from project.static.src.features.doctokenization import tokenize_document, unpack_token_ids
+# background queue that writes the new autodoc
+from project.static.src.evaluation.autodocqueue import enqueue_autodoc, JOB_PENDING
+
+
+def token_change_ratio(previous_token_ids, token_ids):
+	"""Fraction of the token sequence that changed, 0.0 identical to 1.0 completely different."""
+	if not previous_token_ids and not token_ids:
+		return 0.0
+	# autojunk off, document bodies are short and every token counts
+	return 1.0 - SequenceMatcher(None, previous_token_ids, token_ids, autojunk=False).ratio()
+
+
+def edit_document_body(document, document_body):
+	"""Set a new body, re-tokenize it and return True if the autodoc should be regenerated."""
+	if document.document_body == document_body:
+		return False
+
+	# token ids of the body as it was before this save
+	previous_token_ids = unpack_token_ids(document.document_token_ids) if document.document_token_ids is not None else []
+
+	# stored token ids are only valid for the body they were computed from
+	document.document_body = document_body
+	token_ids = tokenize_document(document)
+
+	change_ratio = token_change_ratio(previous_token_ids, token_ids)
+	print('Document ', document.id, ' body changed by %.2f' % change_ratio, file=sys.stderr)
+	return change_ratio >= current_app.config['AUTODOC_REGENERATE_THRESHOLD']
+
+
+def schedule_regeneration(document_id):
+	"""Queue a regeneration after the quiet period, folding into one already waiting for this document."""
+	config = current_app.config
+	now = datetime.utcnow()
+	# the local stand-in runs jobs immediately, so there is nothing to debounce
+	run_after = None if config['AUTODOC_QUEUE_MODE'] == 'inline' else now + timedelta(seconds=config['AUTODOC_REGENERATE_QUIET_SECONDS'])
+
+	if run_after is not None:
+		# push back a regeneration that is still waiting, instead of queueing another one
+		deferred = AutodocJob.query.filter(
+			AutodocJob.document_id == document_id,
+			AutodocJob.job_status == JOB_PENDING,
+			AutodocJob.run_after.isnot(None),
+			AutodocJob.run_after > now
+		).update({
+			'run_after': run_after,
+			'updated_on': now
+		}, synchronize_session=False)
+		db.session.commit()
+		if deferred:
+			print('Folded regeneration of document ', document_id, ' into a waiting job', file=sys.stderr)
+			return None
+
+	# a new revision is appended when the job runs, earlier autodocs are kept
+	return enqueue_autodoc(document_id, profile_name=config['AUTODOC_REGENERATE_PROFILE'], run_after=run_after)
@@ -0,0 +1,249 @@
+# background queue for autodoc generation
+# requests only record an AutodocJob row, generation runs on a worker pool or a separate worker process
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+# import the database
+from project import db
+# import models
+from project.models import Document
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import AutodocJob
+# stored token ids of each document
+from project.static.src.features.doctokenization import gpt2tokenize
+# per-stage timings of each job
+from project.static.src.evaluation.autodoctiming import stage, timed_generation
+
+
+# job status values stored in AutodocJob.job_status
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_FAILED = 'failed'
+JOB_DONE = 'done'
+
+# worker pool, created lazily so every gunicorn worker gets its own after fork
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(
+				max_workers=app.config['AUTODOC_QUEUE_WORKERS'],
+				thread_name_prefix='autodoc'
+			)
+	return _executor
+
+
+def _job_context(app):
+	# reuse the caller's context in inline mode, popping a second one would remove its session
+	if has_app_context():
+		return nullcontext()
+	return app.app_context()
+
+
+def add_autodoc_job(document_id, profile_name=None, run_after=None):
+	"""Add a pending generation job for document_id to the session, without committing or dispatching it."""
+	now = datetime.utcnow()
+	job = AutodocJob(
+		document_id=document_id,
+		job_profile=profile_name,
+		job_status=JOB_PENDING,
+		attempts=0,
+		created_on=now,
+		run_after=run_after,
+		updated_on=now
+	)
+	db.session.add(job)
+	# flush assigns the job id inside the caller's transaction
+	db.session.flush()
+	return job
+
+
+def enqueue_autodoc(document_id, profile_name=None, run_after=None):
+	"""Record a generation job for document_id and hand it to the configured worker."""
+	job = add_autodoc_job(document_id, profile_name, run_after)
+	# commit so the job survives even if this worker dies before running it
+	db.session.commit()
+
+	dispatch(job.id)
+
+	return job
+
+
+def _submit(app, job_id, delay_seconds=0):
+	# hand the job to the worker pool, after delay_seconds if it is deferred
+	if delay_seconds > 0:
+		timer = threading.Timer(delay_seconds, _submit, (app, job_id))
+		timer.daemon = True
+		timer.start()
+	else:
+		_get_executor(app).submit(_run_when_due, app, job_id)
+
+
+def _deferred_seconds(app, job_id):
+	# seconds until a pending job's run_after, which later edits may have pushed back
+	with _job_context(app):
+		job = AutodocJob.query.get(job_id)
+		if job is None or job.job_status != JOB_PENDING or job.run_after is None:
+			return 0
+		return (job.run_after - datetime.utcnow()).total_seconds()
+
+
+def _run_when_due(app, job_id):
+	# wait out the job's run_after again if it moved while we were waiting
+	delay_seconds = _deferred_seconds(app, job_id)
+	if delay_seconds > 0:
+		_submit(app, job_id, delay_seconds)
+		return
+	run_job_with_retries(app, job_id)
+
+
+def dispatch(job_id):
+	"""Run job_id according to AUTODOC_QUEUE_MODE."""
+	app = current_app._get_current_object()
+	mode = app.config['AUTODOC_QUEUE_MODE']
+
+	if mode == 'inline':
+		# local stand-in for tests, run the job before returning
+		run_job_with_retries(app, job_id)
+	elif mode == 'thread':
+		# in-process worker pool, the request returns immediately
+		_submit(app, job_id, _deferred_seconds(app, job_id))
+	else:
+		# 'external' leaves the job pending for manage.py autodoc_worker
+		print('Queued autodoc job ', job_id, ' for external worker', file=sys.stderr)
+
+
+def run_job(app, job_id):
+	"""Claim and run one job, returns True if the job failed and may be retried."""
+	with _job_context(app):
+		# claim the job atomically so two workers never run it twice
+		# pending jobs only once their run_after has passed, running jobs only once they have gone stale,
+		# failed and stale jobs only while they have attempts left
+		# the claim counts the attempt, so a run whose worker dies still uses one up
+		now = datetime.utcnow()
+		stale_before = now - timedelta(seconds=app.config['AUTODOC_JOB_STALE_SECONDS'])
+		max_attempts = app.config['AUTODOC_JOB_MAX_ATTEMPTS']
+		claimed = AutodocJob.query.filter(
+			AutodocJob.id == job_id,
+			db.or_(
+				db.and_(
+					AutodocJob.job_status == JOB_PENDING,
+					db.or_(AutodocJob.run_after.is_(None), AutodocJob.run_after <= now)
+				),
+				db.and_(
+					AutodocJob.job_status == JOB_FAILED,
+					AutodocJob.attempts < max_attempts
+				),
+				db.and_(
+					AutodocJob.job_status == JOB_RUNNING,
+					AutodocJob.updated_on < stale_before,
+					AutodocJob.attempts < max_attempts
+				)
+			)
+		).update({
+			'job_status': JOB_RUNNING,
+			'attempts': AutodocJob.attempts + 1,
+			'updated_on': datetime.utcnow()
+		}, synchronize_session=False)
+		db.session.commit()
+		if not claimed:
+			return False
+
+		job = AutodocJob.query.get(job_id)
+		print('Running autodoc job ', job_id, ' for document ', job.document_id, file=sys.stderr)
+
+		# the generation stack is only imported once a job actually runs
+		from project.static.src.evaluation.autodocwriter import autodocwrite
+
+		# document lookup and tokenizing are timed together with the generation
+		with timed_generation(job.document_id, job.job_profile) as timing:
+			try:
+				# read the stored token ids, then write new autodoc
+				with stage('load_document'):
+					document = Document.query.get(job.document_id)
+				with stage('tokenize'):
+					input_ids = gpt2tokenize(document)
+				autodocwrite(job.document_id, input_ids, job.job_profile)
+			except Exception as error:
+				# throw away whatever the failed generation left in the session
+				db.session.rollback()
+				timing.succeeded = False
+				job = AutodocJob.query.get(job_id)
+				job.job_status = JOB_FAILED
+				job.last_error = repr(error)[:1000]
+				job.updated_on = datetime.utcnow()
+				db.session.commit()
+				print('Autodoc job ', job_id, ' failed (attempt ', job.attempts, '): ', repr(error), file=sys.stderr)
+				return job.attempts < app.config['AUTODOC_JOB_MAX_ATTEMPTS']
+
+		job.job_status = JOB_DONE
+		job.last_error = None
+		job.updated_on = datetime.utcnow()
+		db.session.commit()
+		return False
+
+
+def run_job_with_retries(app, job_id):
+	"""Run job_id, retrying failures with a linear backoff up to AUTODOC_JOB_MAX_ATTEMPTS."""
+	attempt = 0
+	while run_job(app, job_id):
+		attempt += 1
+		time.sleep(app.config['AUTODOC_JOB_RETRY_SECONDS'] * attempt)
+
+
+def runnable_jobs(app, limit=None):
+	"""Ids of due pending jobs, and of failed jobs and running jobs whose worker went away with attempts left."""
+	now = datetime.utcnow()
+	stale_before = now - timedelta(seconds=app.config['AUTODOC_JOB_STALE_SECONDS'])
+	query = db.session.query(AutodocJob.id).filter(
+		db.or_(
+			db.and_(
+				AutodocJob.job_status == JOB_PENDING,
+				db.or_(AutodocJob.run_after.is_(None), AutodocJob.run_after <= now)
+			),
+			db.and_(
+				AutodocJob.job_status == JOB_FAILED,
+				AutodocJob.attempts < app.config['AUTODOC_JOB_MAX_ATTEMPTS']
+			),
+			db.and_(
+				AutodocJob.job_status == JOB_RUNNING,
+				AutodocJob.updated_on < stale_before,
+				AutodocJob.attempts < app.config['AUTODOC_JOB_MAX_ATTEMPTS']
+			)
+		)
+	).order_by(AutodocJob.id)
+	if limit is not None:
+		query = query.limit(limit)
+	return [row.id for row in query]
+
+
+def drain_jobs(app, limit=None):
+	"""Run every runnable job once in this process, returns the number of jobs run."""
+	job_ids = runnable_jobs(app, limit)
+	for job_id in job_ids:
+		run_job(app, job_id)
+	return len(job_ids)
+
+
+def latest_job_statuses(document_ids):
+	"""Map each document_id to the status of its most recent job."""
+	statuses = {}
+	if not document_ids:
+		return statuses
+	# ordered by id so later jobs overwrite earlier ones
+	job_rows = db.session.query(AutodocJob.document_id, AutodocJob.job_status).\
+	filter(AutodocJob.document_id.in_(document_ids)).\
+	order_by(AutodocJob.id)
+	for row in job_rows:
+		statuses[row.document_id] = row.job_status
+	return statuses
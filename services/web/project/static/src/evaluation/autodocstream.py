@@ -0,0 +1,88 @@
+# server-sent events stream of an autodoc as its tokens are generated
+# decodes token by token on the shared model, or on the model server, and saves the finished text as a new Autodoc
+import json
+import sys
+import time
+
+from flask import current_app
+
+
+def sse_event(data, event=None):
+	"""Format one server-sent event carrying data as JSON."""
+	message = ''
+	if event is not None:
+		message += 'event: %s\n' % event
+	message += 'data: %s\n\n' % json.dumps(data)
+	return message
+
+
+def stream_autodoc(document, profile_name=None):
+	"""Yield server-sent events for each decoded piece of text, then save the autodoc."""
+	# the generation stack is only imported once a stream actually starts
+	# shared model handle, or just the tokenizer when a model server generates
+	from project.static.src.models.modelregistry import get_configured_handle, get_tokenizer, model_identity
+	from project.static.src.models.modelclient import get_client
+	# token by token decoding
+	from project.static.src.evaluation.autodocdecoding import STOP_DEADLINE
+	# stored token ids of the document, cut down to the prompt window
+	from project.static.src.features.doctokenization import gpt2tokenize
+	from project.static.src.features.promptwindow import prompt_window
+	# profile handling and persistence shared with the regular writer
+	from project.static.src.evaluation.autodocwriter import AutodocResult, autodocsave, profile_decoder
+	# per-stage timings
+	from project.static.src.evaluation.autodoctiming import note, stage, timed_generation
+
+	config = current_app.config
+	# streaming needs a token by token profile, 'fast' (greedy) unless configured otherwise
+	profile_name = profile_name or config['AUTODOC_STREAM_PROFILE']
+	profile = config['AUTODOC_DECODING_PROFILES'][profile_name]
+
+	# the whole stream is timed as one generation, the stream stage includes sending to the browser
+	with timed_generation(document.id, profile_name):
+
+		# read the stored token ids, no re-tokenizing, and keep the prompt within the token budget
+		with stage('tokenize'):
+			window = prompt_window(gpt2tokenize(document)[0], profile, config)
+		token_ids = window.token_ids
+		note(model=model_identity(config), prompt_tokens=len(token_ids))
+
+		stream_start = time.perf_counter()
+		with stage('model_load'):
+			if config['AUTODOC_INFERENCE_MODE'] == 'remote':
+				# the model server decodes, this worker only turns token ids back into text
+				tokenizer = get_tokenizer(config)
+				decode = lambda output_ids: tokenizer.decode(output_ids, skip_special_tokens=True)
+				decoder = get_client(config).stream(token_ids, profile_name)
+			else:
+				handle = get_configured_handle(config)
+				decode = handle.decode
+				decoder = profile_decoder(handle, token_ids, profile, stream_start + profile['deadline_seconds'])
+
+		# the prompt is part of the autodoc body, send it first so the client shows something immediately
+		yield sse_event({'text': decode(token_ids)}, event='prompt')
+
+		with stage('stream'):
+			sent_text = ''
+			for token_id in decoder:
+				# decode everything generated so far and send only the new text,
+				# a byte-level token can end mid character, so hold back until the character is complete
+				text = decode(decoder.new_token_ids)
+				if text.endswith('\ufffd'):
+					continue
+				if len(decoder.new_token_ids) == 1:
+					print('Autodoc stream first token after %.3fs' % (time.perf_counter() - stream_start), file=sys.stderr)
+				yield sse_event({'text': text[len(sent_text):]})
+				sent_text = text
+
+			# flush anything held back at the end of the stream
+			text = decode(decoder.new_token_ids)
+			if text != sent_text:
+				yield sse_event({'text': text[len(sent_text):]})
+		note(new_tokens=len(decoder.new_token_ids))
+
+		# persist the final text as a new autodoc linked to the document
+		fallback = 'partial' if decoder.stop_reason == STOP_DEADLINE else None
+		with stage('save'):
+			autodoc = autodocsave(document.id, AutodocResult(decode(token_ids + decoder.new_token_ids), profile_name, fallback, window))
+
+	yield sse_event({'autodoc_id': autodoc.id, 'stop_reason': decoder.stop_reason}, event='done')
@@ -0,0 +1,163 @@
+# per-stage timing of autodoc generation
+# a generation opens a GenerationTiming for its thread, the pipeline wraps each stage in stage(),
+# and the finished record goes to the autodoctimings table and/or one json line on stderr
+import json
+import math
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+# import the database
+from project import db
+# import the autodocs models class
+from project.static.data.processeddata.autodocsmodels import AutodocTiming
+
+
+# stage reported for the whole generation
+STAGE_TOTAL = 'total'
+
+# the generation being timed on this thread, if any
+_local = threading.local()
+
+
+class GenerationTiming(object):
+	"""Stage durations, token counts, model and profile of one generation."""
+
+	def __init__(self, document_id=None, profile=None):
+		self.timing_run = uuid.uuid4().hex
+		self.document_id = document_id
+		self.profile = profile
+		self.model = None
+		self.prompt_tokens = None
+		self.new_tokens = None
+		self.succeeded = True
+		# (stage, seconds) in the order the stages ran
+		self.stages = []
+
+	def as_dict(self):
+		return {
+			'timing_run': self.timing_run,
+			'document_id': self.document_id,
+			'model': self.model,
+			'profile': self.profile,
+			'prompt_tokens': self.prompt_tokens,
+			'new_tokens': self.new_tokens,
+			'succeeded': self.succeeded,
+			'stages': dict(self.stages),
+		}
+
+
+def current_timing():
+	"""The GenerationTiming open on this thread, or None."""
+	return getattr(_local, 'timing', None)
+
+
+@contextmanager
+def stage(name):
+	"""Time the block as stage name of the current generation, a no-op when nothing is being timed."""
+	timing = current_timing()
+	if timing is None:
+		yield
+		return
+	stage_start = time.perf_counter()
+	try:
+		yield
+	finally:
+		timing.stages.append((name, time.perf_counter() - stage_start))
+
+
+def note(**fields):
+	"""Set model, profile or token counts on the current generation, if one is being timed."""
+	timing = current_timing()
+	if timing is None:
+		return
+	for name, value in fields.items():
+		setattr(timing, name, value)
+
+
+@contextmanager
+def timed_generation(document_id=None, profile=None):
+	"""Open a GenerationTiming for this thread and record it at the end, nested calls share the outer one."""
+	timing = current_timing()
+	if timing is not None:
+		yield timing
+		return
+	if current_app.config['AUTODOC_TIMINGS'] == 'off':
+		yield GenerationTiming(document_id, profile)
+		return
+
+	timing = _local.timing = GenerationTiming(document_id, profile)
+	total_start = time.perf_counter()
+	try:
+		yield timing
+	except Exception:
+		timing.succeeded = False
+		raise
+	finally:
+		timing.stages.append((STAGE_TOTAL, time.perf_counter() - total_start))
+		_local.timing = None
+		record_timing(timing)
+
+
+def record_timing(timing):
+	"""Write timing to the configured sinks, never failing the generation it describes."""
+	sinks = current_app.config['AUTODOC_TIMINGS']
+	if sinks in ('log', 'both'):
+		print('autodoc_timing ' + json.dumps(timing.as_dict()), file=sys.stderr)
+	if sinks in ('db', 'both'):
+		try:
+			now = datetime.utcnow()
+			for stage_name, seconds in timing.stages:
+				db.session.add(AutodocTiming(
+					timing_run=timing.timing_run,
+					document_id=timing.document_id,
+					stage=stage_name,
+					seconds=seconds,
+					autodoc_model=timing.model,
+					autodoc_profile=timing.profile,
+					prompt_tokens=timing.prompt_tokens,
+					new_tokens=timing.new_tokens,
+					succeeded=timing.succeeded,
+					created_on=now
+				))
+			db.session.commit()
+		except Exception as error:
+			db.session.rollback()
+			print('Could not record autodoc timing: ', repr(error), file=sys.stderr)
+
+
+def percentile(sorted_values, fraction):
+	# nearest-rank percentile of an already sorted list
+	rank = math.ceil(fraction * len(sorted_values))
+	return sorted_values[max(rank, 1) - 1]
+
+
+def stage_percentiles(since_hours=24, profile=None):
+	"""Count, p50, p95, p99 and max seconds per stage over the last since_hours, slowest p95 first."""
+	query = db.session.query(AutodocTiming.stage, AutodocTiming.seconds).\
+	filter(AutodocTiming.created_on >= datetime.utcnow() - timedelta(hours=since_hours))
+	if profile:
+		query = query.filter(AutodocTiming.autodoc_profile == profile)
+
+	seconds_by_stage = {}
+	for stage_name, seconds in query:
+		seconds_by_stage.setdefault(stage_name, []).append(seconds)
+
+	report = []
+	for stage_name, values in seconds_by_stage.items():
+		values.sort()
+		report.append({
+			'stage': stage_name,
+			'count': len(values),
+			'p50': percentile(values, 0.50),
+			'p95': percentile(values, 0.95),
+			'p99': percentile(values, 0.99),
+			'max': values[-1],
+		})
+	report.sort(key=lambda row: row['p95'], reverse=True)
+	return report
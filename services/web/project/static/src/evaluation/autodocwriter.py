@@ -1,65 +1,302 @@
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 # import the database
 from project import db
-# import the transformers GPT2 head model
-from transformers import TFGPT2LMHeadModel
-# import tokenizer
-from transformers import GPT2Tokenizer
+from flask import current_app
+# shared model handle from the process-wide model registry
+from project.static.src.models.modelregistry import get_configured_handle, model_identity
+# micro-batcher shared by concurrent generations
+from project.static.src.evaluation.autodocbatcher import get_batcher
+# content-addressed cache of generated autodocs
+from project.static.src.evaluation import autodoccache
+# token by token decoding for greedy/sampled profiles and deadline fallbacks
+from project.static.src.evaluation.autodocdecoding import IncrementalDecoder, STOP_DEADLINE, max_length_kwargs
+# token budget for long documents
+from project.static.src.features.promptwindow import prompt_window
+# per-stage timings of each generation
+from project.static.src.evaluation.autodoctiming import note, stage, timed_generation
 
 
 # import the autodocs models class
 # import autodocsmodels.py
 from project.static.data.processeddata import autodocsmodels
 from project.static.data.processeddata.autodocsmodels import Autodoc, Revision
+# search text of each document includes its latest autodoc
+from project.search import index_document
+
+# keys of a decoding profile which are not model.generate arguments
+PROFILE_CONTROL_KEYS = ('strategy', 'deadline_seconds', 'fallback')
+
+# generated text plus the profile requested, the fallback actually used, if any,
+# the PromptWindow of the document the text was generated from,
+# and every (autodoc_body, score) candidate of the generate pass, best first, when more than one was asked for
+AutodocResult = namedtuple('AutodocResult', ['autodoc_body', 'profile', 'fallback', 'window', 'candidates'], defaults=[None, None])
+
+# helper threads for beam searches that run against a deadline
+# backends which stop at the deadline end a late search themselves, on the others
+# a beam search which misses its deadline cannot be interrupted and finishes here in the background
+_deadline_executor = None
+_deadline_executor_lock = threading.Lock()
+# searches which missed their deadline on a backend that cannot stop them, per model handle, until they finish
+_abandoned_searches = {}
+
+def _get_deadline_executor():
+	global _deadline_executor
+	with _deadline_executor_lock:
+		if _deadline_executor is None:
+			_deadline_executor = ThreadPoolExecutor(
+				max_workers=current_app.config['AUTODOC_DEADLINE_THREADS'],
+				thread_name_prefix='autodoc-deadline'
+			)
+	return _deadline_executor
+
+def _abandon_search(handle, future):
 
-def autodocwrite(document_id,input_ids):
+	# the search keeps the handle's generate lock until it ends, remember it until then
+	with _deadline_executor_lock:
+		_abandoned_searches.setdefault(handle, set()).add(future)
+	future.add_done_callback(lambda done: _search_finished(handle, done))
 
-	# set GPT2 tokenizer
-	tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+def _search_finished(handle, future):
 
-	# set model
-	model = TFGPT2LMHeadModel.from_pretrained("gpt2", pad_token_id=tokenizer.eos_token_id)
+	with _deadline_executor_lock:
+		searches = _abandoned_searches.get(handle, set())
+		searches.discard(future)
+		if not searches:
+			_abandoned_searches.pop(handle, None)
 
-	# autogenerate based upon input_ids
-	# set no_repeat_ngram_size to 4
-	# generate model
-	beam_output = model.generate(
-	    input_ids, 
-	    max_length=100, 
-	    num_beams=5, 
-	    no_repeat_ngram_size=4, 
-	    early_stopping=True
+def search_abandoned(handle):
+	"""Whether a beam search which missed its deadline still holds handle's generate lock."""
+	with _deadline_executor_lock:
+		return bool(_abandoned_searches.get(handle))
+
+def profile_generate_kwargs(profile):
+
+	# everything in a profile except its control keys is passed to generate
+	return {key: value for key, value in profile.items() if key not in PROFILE_CONTROL_KEYS}
+
+def profile_decoder(handle, token_ids, profile, deadline):
+
+	# token by token decoder for a greedy or sampled profile
+	generate_kwargs = profile_generate_kwargs(profile)
+	return IncrementalDecoder(
+		handle,
+		token_ids,
+		max_new_tokens=generate_kwargs.get('max_new_tokens', 64),
+		deadline=deadline,
+		no_repeat_ngram_size=generate_kwargs.get('no_repeat_ngram_size', 0),
+		do_sample=profile['strategy'] == 'sample',
+		top_k=generate_kwargs.get('top_k', 50),
+		temperature=generate_kwargs.get('temperature', 1.0)
 	)
 
-	# decode and write text with tokenizer
-	autodoc_body = tokenizer.decode(beam_output[0], skip_special_tokens=True)
+def candidate_count(profile, config):
 
-	# create a new autodoc entry
-	autodoc = Autodoc(
-		autodoc_body=autodoc_body
+	# beam search keeps num_beams sequences anyway, return up to AUTODOC_CANDIDATES of them
+	if profile['strategy'] != 'beam':
+		return 1
+	return max(1, min(config['AUTODOC_CANDIDATES'], profile.get('num_beams', 1)))
+
+def autodocgenerate(input_ids, profile_name=None):
+
+	config = current_app.config
+	# pick the named decoding profile, default from Config
+	profile_name = profile_name or config['AUTODOC_DECODING_PROFILE']
+	profile = config['AUTODOC_DECODING_PROFILES'][profile_name]
+	# bound the prompt to the token budget, leaving room for the profile's new tokens
+	with stage('prompt_window'):
+		window = prompt_window(list(input_ids[0]), profile, config)
+	token_ids = window.token_ids
+	note(model=model_identity(config), profile=profile_name, prompt_tokens=len(token_ids))
+
+	# look the prompt up in the generation cache before touching the model
+	# the cache holds one text per prompt, so candidate generation always runs the model
+	if config['AUTODOC_CACHE_ENABLED'] and candidate_count(profile, config) == 1:
+		key = autodoccache.cache_key(token_ids, '%s:%s' % (config['AUTODOC_BACKEND'], model_identity(config)), dict(profile_generate_kwargs(profile), strategy=profile['strategy']))
+		with stage('cache_lookup'):
+			autodoc_body = autodoccache.lookup(key, config['AUTODOC_CACHE_SIZE'], config['AUTODOC_CACHE_DB'])
+		if autodoc_body is not None:
+			return AutodocResult(autodoc_body, profile_name, None, window)
+		result = _dispatchgenerate(token_ids, profile_name)
+		# fallback and partial results are not what this profile asked for, keep them out of the cache
+		if result.fallback is None:
+			with stage('cache_store'):
+				autodoccache.store(key, result.autodoc_body, config['AUTODOC_CACHE_SIZE'], config['AUTODOC_CACHE_DB'])
+		return result._replace(window=window)
+
+	return _dispatchgenerate(token_ids, profile_name)._replace(window=window)
+
+def _dispatchgenerate(token_ids, profile_name):
+
+	# generate on the model server, which runs _autodocgenerate with the same profiles
+	if current_app.config['AUTODOC_INFERENCE_MODE'] == 'remote':
+		from project.static.src.models.modelclient import get_client
+		with stage('remote_generate'):
+			result = get_client(current_app.config).generate(token_ids, profile_name)
+		return AutodocResult(result['autodoc_body'], result['profile'], result['fallback'], None, result.get('candidates'))
+
+	return _autodocgenerate(token_ids, profile_name, profile_name)
+
+def _autodocgenerate(token_ids, requested_profile, profile_name):
+
+	profile = current_app.config['AUTODOC_DECODING_PROFILES'][profile_name]
+	generate_kwargs = profile_generate_kwargs(profile)
+	# wall clock deadline for this profile
+	deadline = time.perf_counter() + profile['deadline_seconds']
+	# name of the profile used instead of the requested one, if any
+	fallback = profile_name if profile_name != requested_profile else None
+
+	# shared tokenizer and model, loaded once per worker process
+	with stage('model_load'):
+		handle = get_configured_handle(current_app.config)
+
+	if profile['strategy'] in ('greedy', 'sample'):
+		# token by token decoding stops at the deadline and keeps the best partial sequence
+		decoder = profile_decoder(handle, token_ids, profile, deadline)
+		with stage('generate'):
+			output_ids = decoder.run()
+		with stage('decode'):
+			autodoc_body = handle.decode(output_ids)
+		note(new_tokens=len(decoder.new_token_ids))
+		if decoder.stop_reason == STOP_DEADLINE:
+			print('Autodoc profile ', profile_name, ' hit its deadline, keeping partial output', file=sys.stderr)
+			fallback = (fallback + ':partial') if fallback else 'partial'
+		return AutodocResult(autodoc_body, requested_profile, fallback)
+
+	# a new search would only queue behind a missed one still holding the generate lock, and miss its deadline too
+	if profile['fallback'] and search_abandoned(handle):
+		print('Autodoc profile ', profile_name, ' waits on a search that missed its deadline, falling back to ', profile['fallback'], file=sys.stderr)
+		return _autodocgenerate(token_ids, requested_profile, profile['fallback'])
+
+	# top-k sequences of the same beam search, decoded and scored, outside the micro-batcher
+	num_candidates = candidate_count(profile, current_app.config)
+	if num_candidates > 1:
+		future = _get_deadline_executor().submit(
+			lambda: handle.generate_candidates(token_ids, num_candidates, deadline=deadline, **max_length_kwargs(generate_kwargs, len(token_ids)))
+		)
+	# hand the prompt to the micro-batcher so concurrent documents share one generate call
+	elif current_app.config['AUTODOC_BATCH_ENABLED']:
+		batcher = get_batcher(
+			handle,
+			current_app.config['AUTODOC_BATCH_WINDOW_SECONDS'],
+			current_app.config['AUTODOC_BATCH_MAX_SIZE'],
+			**generate_kwargs
+		)
+		future = batcher.submit(token_ids, deadline)
+	else:
+		# autogenerate based upon input_ids
+		# generate model, the text is decoded with the tokenizer below
+		future = _get_deadline_executor().submit(
+			lambda: handle.generate([token_ids], deadline=deadline, **max_length_kwargs(generate_kwargs, len(token_ids)))[0]
 		)
-        
-    # add retention to session and commit to database
-	db.session.add(autodoc)
+
+	try:
+		with stage('generate'):
+			output = future.result(timeout=max(deadline - time.perf_counter(), 0))
+		# a backend which stops at the deadline hands back a search cut short there, the fallback does better
+		missed = handle.stops_at_deadline and time.perf_counter() >= deadline and bool(profile['fallback'])
+	except FutureTimeoutError:
+		if not handle.stops_at_deadline:
+			_abandon_search(handle, future)
+		if not profile['fallback']:
+			raise
+		missed = True
+	if missed:
+		# fall back to the cheaper profile, which gets its own deadline
+		print('Autodoc profile ', profile_name, ' missed its deadline, falling back to ', profile['fallback'], file=sys.stderr)
+		return _autodocgenerate(token_ids, requested_profile, profile['fallback'])
+
+	if num_candidates > 1:
+		with stage('decode'):
+			candidates = [(handle.decode(output_ids), score) for output_ids, score in output]
+		note(new_tokens=_new_token_count(handle, token_ids, output[0][0]))
+		return AutodocResult(candidates[0][0], requested_profile, fallback, None, candidates)
+
+	with stage('decode'):
+		autodoc_body = handle.decode(output)
+	note(new_tokens=_new_token_count(handle, token_ids, output))
+	return AutodocResult(autodoc_body, requested_profile, fallback)
+
+def _new_token_count(handle, token_ids, output_ids):
+
+	# tokens generated after the prompt, up to the eos padding of a finished beam
+	new_token_ids = list(output_ids[len(token_ids):])
+	if handle.tokenizer.eos_token_id in new_token_ids:
+		new_token_ids = new_token_ids[:new_token_ids.index(handle.tokenizer.eos_token_id)]
+	return len(new_token_ids)
+
+def autodocwrite(document_id,input_ids,profile_name=None):
+
+	# joins the timing of a job already being timed, or times this call on its own
+	with timed_generation(document_id, profile_name):
+
+		# generate the autodoc text
+		result = autodocgenerate(input_ids, profile_name)
+
+		# write the new autodoc and its revision to the database
+		with stage('save'):
+			return autodocsave(document_id, result)
+
+def autodocsave(document_id,result):
+
+	# add the new autodoc (or every candidate) and its revision, with ids from the flushed inserts,
+	# and commit them together
+	autodoc = autodocadd(document_id, result)
 	db.session.commit()
 
-    # find new autodoc id number
-    # after this autodoc has just been added to the database, add revision
-    # query all autodocs in order, put into a python object
-	all_autodocs_ordered = Autodoc.query.order_by(Autodoc.id)
-    # query count of all autodocs, subtract 1 because python index starts at 0
-	autodoc_index = Autodoc.query.count() - 1
-    # last autodoc object is autodoc index, or count-1
-	last_autodoc = all_autodocs_ordered[autodoc_index]
-    # new autodoc id for retentions database is indexed last autodocid integer
-	autodoc_id = last_autodoc.id
-
-
-	# create a new retention entry
-	newrevision = Revision(
-		document_id=document_id,
-		autodoc_id=autodoc_id
+	return autodoc
+
+def _windowed_autodoc(result, autodoc_body):
+
+	# new autodoc carrying the model, profile, fallback and prompt window of result
+	autodoc = Autodoc(
+		autodoc_body=autodoc_body,
+		autodoc_model=model_identity(current_app.config),
+		autodoc_profile=result.profile,
+		autodoc_fallback=result.fallback
 		)
-        
-    # add retention to session and commit to database
-	db.session.add(newrevision)
-	db.session.commit()
\ No newline at end of file
+	if result.window is not None:
+		autodoc.autodoc_prompt_window = result.window.strategy
+		autodoc.autodoc_prompt_lead_tokens = result.window.lead_tokens
+		autodoc.autodoc_prompt_tail_start = result.window.tail_start
+		autodoc.autodoc_prompt_document_tokens = result.window.document_tokens
+	return autodoc
+
+def autodocadd(document_id,result):
+
+	# add the autodoc (or all candidates) and revisions of result to the session, without committing
+	# returns the best autodoc, ids are assigned by flushing
+	candidates = result.candidates if result.candidates and len(result.candidates) > 1 else [(result.autodoc_body, None)]
+
+	# one autodoc per candidate, ranked best first and grouped under the best one's id
+	autodocs = []
+	for rank, (autodoc_body, score) in enumerate(candidates):
+		autodoc = _windowed_autodoc(result, autodoc_body)
+		if len(candidates) > 1:
+			autodoc.autodoc_rank = rank
+			autodoc.autodoc_score = score
+		db.session.add(autodoc)
+		autodocs.append(autodoc)
+	# flush assigns the ids without a second round of queries
+	db.session.flush()
+	if len(candidates) > 1:
+		for autodoc in autodocs:
+			autodoc.autodoc_candidate_group = autodocs[0].id
+
+	# revisions for the worst candidate first, so the best one is the document's latest revision
+	for autodoc in reversed(autodocs):
+		db.session.add(Revision(
+			document_id=document_id,
+			autodoc_id=autodoc.id
+			))
+		db.session.flush()
+
+	# the latest autodoc's text is searched with its document
+	index_document(document_id)
+
+	return autodocs[0]
@@ -1,20 +1,54 @@
-from transformers import GPT2Tokenizer
+import sys
+from array import array
 
-# import documents model
-# import models
-from project.models import db, Document
+from flask import current_app
+# shared tokenizer from the process-wide model registry
+from project.static.src.models.modelregistry import get_tokenizer
 
-def gpt2tokenize(document_id):
+# first byte of a packed token id blob is the width of each id in bytes
+_TOKEN_ID_TYPECODES = {2: 'H', 4: 'I'}
 
-	# define GPT2 as tokenzier
-	tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+def pack_token_ids(token_ids):
 
-	# look up the document text
-	document_body = db.session.query(Document).filter_by(id = document_id)[0].document_body
+	# GPT2's vocabulary fits in two bytes per id, fall back to four for larger vocabularies
+	width = 2 if max(token_ids, default=0) < 2 ** 16 else 4
+	packed = array(_TOKEN_ID_TYPECODES[width], token_ids)
+	# always store little endian so blobs are portable between hosts
+	if sys.byteorder != 'little':
+		packed.byteswap()
+	return bytes([width]) + packed.tobytes()
 
-	# encode context the generation is conditioned on
-	# tokenize document_body
-	input_ids = tokenizer.encode(document_body, return_tensors='tf')
+def unpack_token_ids(packed):
+
+	# read the width byte, then the little endian ids that follow
+	token_ids = array(_TOKEN_ID_TYPECODES[packed[0]])
+	token_ids.frombytes(packed[1:])
+	if sys.byteorder != 'little':
+		token_ids.byteswap()
+	return token_ids.tolist()
+
+def tokenize_document(document):
+
+	# shared GPT2 tokenizer, loaded once per worker process
+	tokenizer = get_tokenizer(current_app.config)
+
+	# tokenize document_body once, at write time, and keep the packed ids on the row
+	token_ids = tokenizer.encode(document.document_body or '')
+	document.document_token_ids = pack_token_ids(token_ids)
+
+	return token_ids
+
+def gpt2tokenize(document):
+
+	# read the token ids stored with the document, no extra query and no re-encoding
+	if document.document_token_ids is not None:
+		token_ids = unpack_token_ids(document.document_token_ids)
+	else:
+		# rows written before token ids were stored are tokenized once and kept
+		token_ids = tokenize_document(document)
+
+	# encode context the generation is conditioned on, a batch of one prompt
+	input_ids = [token_ids]
 
 	# call the text autocodewriter function
 	return(input_ids)
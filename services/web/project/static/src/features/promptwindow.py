@@ -0,0 +1,63 @@
+# bounded prompt windows for long documents
+# generation only ever sees a token budget's worth of the document, so its cost does not grow with the body
+from collections import namedtuple
+
+# shared tokenizer from the process-wide model registry
+from project.static.src.models.modelregistry import get_tokenizer
+
+# prompt token ids and where they came from: the first lead_tokens of the document
+# followed by everything from tail_start on, out of document_tokens in total
+# strategy is 'full' when the whole document fit, otherwise 'tail' or 'lead_tail'
+PromptWindow = namedtuple('PromptWindow', ['token_ids', 'strategy', 'lead_tokens', 'tail_start', 'document_tokens'])
+
+# text which ends a sentence, for finding the lead sentence
+SENTENCE_ENDS = ('.', '!', '?')
+
+def sentence_end_ids(tokenizer):
+
+	# token ids of the sentence-ending punctuation on its own
+	return set(tokenizer.encode(text)[-1] for text in SENTENCE_ENDS)
+
+def lead_sentence_length(token_ids, end_ids, max_tokens):
+
+	# tokens up to and including the first sentence end, 0 if the first sentence is longer than max_tokens
+	for index, token_id in enumerate(token_ids[:max_tokens]):
+		if token_id in end_ids:
+			return index + 1
+	return 0
+
+def build_window(token_ids, max_tokens, strategy='lead_tail', end_ids=(), lead_max_tokens=64):
+
+	document_tokens = len(token_ids)
+	# short documents are used whole
+	if document_tokens <= max_tokens:
+		return PromptWindow(list(token_ids), 'full', document_tokens, document_tokens, document_tokens)
+
+	# the lead sentence never takes more than half the budget, the tail keeps the rest
+	lead_tokens = 0
+	if strategy == 'lead_tail':
+		lead_tokens = lead_sentence_length(token_ids, end_ids, min(lead_max_tokens, max_tokens // 2))
+	tail_start = document_tokens - (max_tokens - lead_tokens)
+
+	return PromptWindow(
+		list(token_ids[:lead_tokens]) + list(token_ids[tail_start:]),
+		strategy if lead_tokens else 'tail',
+		lead_tokens,
+		tail_start,
+		document_tokens
+	)
+
+def prompt_window(token_ids, profile, config):
+
+	# the prompt budget leaves the profile's max_new_tokens free in the model's context
+	max_tokens = min(
+		config['AUTODOC_PROMPT_MAX_TOKENS'],
+		config['AUTODOC_MODEL_CONTEXT_TOKENS'] - profile.get('max_new_tokens', 64)
+	)
+	strategy = config['AUTODOC_PROMPT_WINDOW']
+	# the tokenizer is only needed to find the lead sentence of a long document
+	end_ids = ()
+	if strategy == 'lead_tail' and len(token_ids) > max_tokens:
+		end_ids = sentence_end_ids(get_tokenizer(config))
+
+	return build_window(token_ids, max_tokens, strategy, end_ids, config['AUTODOC_PROMPT_LEAD_MAX_TOKENS'])
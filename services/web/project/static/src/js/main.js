@@ -0,0 +1,32 @@
+// Stream machine generated text into the page as server-sent events.
+// Any element with data-autodoc-stream holds the stream url, a start button and a text area.
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('[data-autodoc-stream]').forEach(function (container) {
+    var button = container.querySelector('.autodoc-stream-start');
+    var output = container.querySelector('.autodoc-stream-text');
+
+    button.addEventListener('click', function () {
+      button.disabled = true;
+      output.textContent = '';
+
+      var source = new EventSource(container.getAttribute('data-autodoc-stream'));
+
+      // the prompt arrives first, then one message per decoded piece of text
+      source.addEventListener('prompt', function (event) {
+        output.textContent = JSON.parse(event.data).text;
+      });
+      source.onmessage = function (event) {
+        output.textContent += JSON.parse(event.data).text;
+      };
+      // the autodoc has been saved, stop the browser from reconnecting
+      source.addEventListener('done', function () {
+        source.close();
+        button.disabled = false;
+      });
+      source.onerror = function () {
+        source.close();
+        button.disabled = false;
+      };
+    });
+  });
+});
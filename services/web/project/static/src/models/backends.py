@@ -0,0 +1,365 @@
+# inference backends behind the model registry
+# every backend exposes the same handle: tokenizer, generate, forward and decode on plain lists of token ids,
+# so the autodoc code never touches framework tensors and the framework is imported only when its backend loads
+import importlib.util
+import sys
+import threading
+import time
+
+
+class ModelHandle(object):
+	"""Shared tokenizer and head model for one model name on one backend."""
+
+	# name used in Config['AUTODOC_BACKEND']
+	backend_name = None
+	# whether a left-padded prompt in a batch generates the same text as the prompt alone
+	left_padding_safe = False
+	# framework module the backend imports when it loads, checked at startup
+	framework_module = None
+	# whether generate stops by itself at a deadline, otherwise a late generate holds the lock until it ends
+	stops_at_deadline = False
+	# whether a model loaded from an artifact uses the memory-mapped weights in place, shared by every process
+	shares_artifact_weights = False
+
+	def __init__(self, model_name, options=None):
+		self.model_name = model_name
+		self.options = options or {}
+		self.tokenizer = None
+		self.model = None
+		# load statistics, reported through registry_stats()
+		self.load_seconds = None
+		self.rss_before_mb = None
+		self.rss_after_mb = None
+		self.warmup_seconds = None
+		# generate is serialized per model so concurrent requests never interleave on one graph
+		self.lock = threading.Lock()
+
+	def load_tokenizer(self):
+		"""Load only the tokenizer, which needs transformers but no deep learning framework."""
+		# a pinned artifact from the local model store, no hub access
+		if self.options.get('artifact_dir'):
+			from project.static.mlmodels.seedmlmodels import headmodel
+			return headmodel.load_tokenizer(self.options['artifact_dir'])
+		from transformers import GPT2Tokenizer
+		return GPT2Tokenizer.from_pretrained(self.model_name)
+
+	def load(self):
+		"""Load tokenizer and model, importing the framework on first use."""
+		raise NotImplementedError
+
+	def generate(self, batch_ids, attention_mask=None, deadline=None, **kwargs):
+		"""Run generate on a batch (list of token id lists), returns a list of output token id lists.
+
+		Backends which stop at a deadline return what they generated by time.perf_counter() deadline.
+		"""
+		# run generate while holding the per model lock
+		with self.lock:
+			return self._generate(batch_ids, attention_mask, **self._deadline_kwargs(deadline, kwargs))
+
+	def _deadline_kwargs(self, deadline, kwargs):
+		# the time left once the lock is held, as the max_time generate stops at
+		if deadline is not None and self.stops_at_deadline:
+			kwargs = dict(kwargs, max_time=max(deadline - time.perf_counter(), 0.0))
+		return kwargs
+
+	def _generate(self, batch_ids, attention_mask=None, **kwargs):
+		raise NotImplementedError
+
+	def generate_candidates(self, token_ids, num_return_sequences, deadline=None, **kwargs):
+		"""Top num_return_sequences outputs of one generate on a single prompt, as (token ids, score) best first."""
+		with self.lock:
+			sequences = self._generate([token_ids], num_return_sequences=num_return_sequences, **self._deadline_kwargs(deadline, kwargs))
+			return list(zip(sequences, self.sequence_scores(len(token_ids), sequences)))
+
+	def sequence_scores(self, prompt_length, sequences):
+		"""Mean log-probability of each sequence's generated tokens, from one forward pass over the batch."""
+		import numpy as np
+		eos_token_id = self.tokenizer.eos_token_id
+		logits = self._sequence_logits(sequences)
+		scores = []
+		for row, sequence in enumerate(sequences):
+			# generated tokens up to the first eos, finished beams are padded with eos after it
+			generated = list(sequence[prompt_length:])
+			if eos_token_id in generated:
+				generated = generated[:generated.index(eos_token_id) + 1]
+			if not generated:
+				scores.append(0.0)
+				continue
+			# logits at position i predict token i + 1, log-softmax only the rows that are needed
+			row_logits = np.asarray(logits[row][prompt_length - 1:prompt_length - 1 + len(generated)], dtype=np.float64)
+			row_logits = row_logits - row_logits.max(axis=-1, keepdims=True)
+			log_probs = row_logits - np.log(np.exp(row_logits).sum(axis=-1, keepdims=True))
+			scores.append(float(np.mean([log_probs[i, token_id] for i, token_id in enumerate(generated)])))
+		return scores
+
+	def _sequence_logits(self, sequences):
+		# logits at every position of equal length sequences, [batch, length, vocab]
+		# generic version on top of forward, for backends without a full-sequence pass
+		import numpy as np
+		batch_logits = []
+		for sequence in sequences:
+			past = None
+			row_logits = []
+			for token_id in sequence:
+				logits, past = self.forward([token_id], past)
+				row_logits.append(logits)
+			batch_logits.append(np.stack(row_logits))
+		return np.stack(batch_logits)
+
+	def forward(self, token_ids, past=None):
+		"""One cached forward pass, returns the last position's logits (numpy) and the new past."""
+		raise NotImplementedError
+
+	def encode(self, text):
+		return self.tokenizer.encode(text)
+
+	def decode(self, output_ids):
+		# decode and skip special tokens, same as the autodoc writer always did
+		return self.tokenizer.decode(output_ids, skip_special_tokens=True)
+
+	def _greedy_generate(self, batch_ids, attention_mask=None, max_length=20, no_repeat_ngram_size=0, num_beams=1, max_time=None, **kwargs):
+		# generate for backends without a native generate, one greedy incremental decode per row
+		from project.static.src.evaluation.autodocdecoding import IncrementalDecoder
+		if num_beams > 1:
+			print('Backend ', self.backend_name, ' decodes greedily, ignoring num_beams=', num_beams, file=sys.stderr)
+		# every row stops at the same wall clock deadline, like max_time in model.generate
+		deadline = time.perf_counter() + max_time if max_time is not None else None
+		outputs = []
+		for row, token_ids in enumerate(batch_ids):
+			# drop left padding, the model only sees the real prompt
+			if attention_mask is not None:
+				token_ids = [token_id for token_id, mask in zip(token_ids, attention_mask[row]) if mask]
+			decoder = IncrementalDecoder(
+				self,
+				token_ids,
+				max_new_tokens=max(max_length - len(batch_ids[row]), 0),
+				deadline=deadline,
+				no_repeat_ngram_size=no_repeat_ngram_size
+			)
+			# the output row starts with the padded prompt, like model.generate's
+			padding = batch_ids[row][:len(batch_ids[row]) - len(token_ids)]
+			outputs.append(list(padding) + decoder.run())
+		return outputs
+
+
+class TFModelHandle(ModelHandle):
+	"""TFGPT2LMHeadModel, the original backend."""
+
+	backend_name = 'tensorflow'
+	framework_module = 'tensorflow'
+	# TF GPT2 numbers positions from the start of the padded row, whatever the attention mask says
+	left_padding_safe = False
+	# transformers 4.5's TF generate has no max_time, a beam search always runs to max_length
+	stops_at_deadline = False
+
+	def load(self):
+		import tensorflow as tf
+		# import the transformers GPT2 head model
+		from transformers import TFGPT2LMHeadModel
+		self._tf = tf
+		# set GPT2 tokenizer
+		self.tokenizer = self.load_tokenizer()
+		# set model, from the pinned artifact when there is one
+		if self.options.get('artifact_dir'):
+			from project.static.mlmodels.seedmlmodels import headmodel
+			self.model = headmodel.load_tf_model(self.options['artifact_dir'], self.tokenizer.eos_token_id)
+		else:
+			self.model = TFGPT2LMHeadModel.from_pretrained(self.model_name, pad_token_id=self.tokenizer.eos_token_id)
+
+	def _generate(self, batch_ids, attention_mask=None, **kwargs):
+		tf = self._tf
+		if attention_mask is not None:
+			kwargs['attention_mask'] = tf.constant(attention_mask, dtype=tf.int32)
+		output = self.model.generate(tf.constant(batch_ids, dtype=tf.int32), **kwargs)
+		return output.numpy().tolist()
+
+	def forward(self, token_ids, past=None):
+		# a single eager forward pass keeps no state on the model, so it runs outside the generate lock
+		outputs = self.model(self._tf.constant([token_ids], dtype=self._tf.int32), past=past, use_cache=True)
+		return outputs.logits[0, -1, :].numpy(), outputs.past_key_values
+
+	def _sequence_logits(self, sequences):
+		return self.model(self._tf.constant(sequences, dtype=self._tf.int32)).logits.numpy()
+
+
+class TorchModelHandle(ModelHandle):
+	"""GPT2LMHeadModel on PyTorch, CPU inference with gradients off."""
+
+	backend_name = 'pytorch'
+	framework_module = 'torch'
+	# GPT2LMHeadModel derives position ids from the attention mask while generating
+	left_padding_safe = True
+	# generate takes max_time and ends the search with what it has
+	stops_at_deadline = True
+	# parameters point straight at the mapped weights
+	shares_artifact_weights = True
+
+	def load(self):
+		import torch
+		from transformers import GPT2LMHeadModel
+		self._torch = torch
+		self.tokenizer = self.load_tokenizer()
+		# memory-mapped weights from the pinned artifact when there is one
+		if self.options.get('artifact_dir'):
+			from project.static.mlmodels.seedmlmodels import headmodel
+			self.model = headmodel.load_torch_model(self.options['artifact_dir'], self.tokenizer.eos_token_id)
+		else:
+			self.model = GPT2LMHeadModel.from_pretrained(self.model_name, pad_token_id=self.tokenizer.eos_token_id)
+		# inference only, no dropout
+		self.model.eval()
+
+	def _generate(self, batch_ids, attention_mask=None, **kwargs):
+		torch = self._torch
+		if attention_mask is not None:
+			kwargs['attention_mask'] = torch.tensor(attention_mask, dtype=torch.long)
+		with torch.no_grad():
+			output = self.model.generate(torch.tensor(batch_ids, dtype=torch.long), **kwargs)
+		return output.tolist()
+
+	def forward(self, token_ids, past=None):
+		torch = self._torch
+		with torch.no_grad():
+			outputs = self.model(torch.tensor([token_ids], dtype=torch.long), past_key_values=past, use_cache=True)
+		return outputs.logits[0, -1, :].numpy(), outputs.past_key_values
+
+	def _sequence_logits(self, sequences):
+		torch = self._torch
+		with torch.no_grad():
+			return self.model(torch.tensor(sequences, dtype=torch.long)).logits.numpy()
+
+
+class OnnxModelHandle(ModelHandle):
+	"""GPT2 graph exported with manage.py export_onnx, run on ONNX Runtime.
+
+	The exported graph has no key/value cache, so each forward pass runs the whole sequence
+	and generate decodes greedily.
+	"""
+
+	backend_name = 'onnx'
+	framework_module = 'onnxruntime'
+	# greedy generate drops the padding before decoding
+	left_padding_safe = True
+	# greedy generate checks the deadline before every token
+	stops_at_deadline = True
+
+	def load(self):
+		import onnxruntime
+		self.tokenizer = self.load_tokenizer()
+		self.model = onnxruntime.InferenceSession(self.options['onnx_path'])
+
+	def _generate(self, batch_ids, attention_mask=None, **kwargs):
+		return self._greedy_generate(batch_ids, attention_mask, **kwargs)
+
+	def forward(self, token_ids, past=None):
+		import numpy as np
+		# past is simply the sequence so far
+		sequence = (past or []) + list(token_ids)
+		logits = self.model.run(['logits'], {'input_ids': np.array([sequence], dtype=np.int64)})[0]
+		return logits[0, -1, :], sequence
+
+	def _sequence_logits(self, sequences):
+		import numpy as np
+		return self.model.run(['logits'], {'input_ids': np.array(sequences, dtype=np.int64)})[0]
+
+
+class StubTokenizer(object):
+	"""Byte-level tokenizer for the stub backend, ids 0-255 are utf-8 bytes and 256 is eos."""
+
+	eos_token_id = 256
+	vocab_size = 257
+
+	def encode(self, text, **kwargs):
+		return list(text.encode('utf-8'))
+
+	def decode(self, token_ids, skip_special_tokens=True, **kwargs):
+		byte_ids = [token_id for token_id in token_ids if token_id < self.eos_token_id]
+		return bytes(byte_ids).decode('utf-8', errors='replace')
+
+
+class StubModelHandle(ModelHandle):
+	"""Tiny deterministic model for tests, no download and no framework.
+
+	The next token is a fixed function of the last token and the sequence length,
+	so the same prompt always produces the same lowercase text.
+	"""
+
+	backend_name = 'stub'
+	left_padding_safe = True
+	stops_at_deadline = True
+
+	def load_tokenizer(self):
+		return StubTokenizer()
+
+	def load(self):
+		self.tokenizer = self.load_tokenizer()
+		self.model = None
+
+	def _generate(self, batch_ids, attention_mask=None, **kwargs):
+		return self._greedy_generate(batch_ids, attention_mask, **kwargs)
+
+	def forward(self, token_ids, past=None):
+		import numpy as np
+		# past is the length of the sequence seen so far
+		length = (past or 0) + len(token_ids)
+		last_token_id = token_ids[-1] if token_ids else 0
+		# a space every sixth position, otherwise a letter picked from the last token
+		if length % 6 == 0:
+			next_token_id = ord(' ')
+		else:
+			next_token_id = ord('a') + (last_token_id * 31 + length * 7) % 26
+		logits = np.full(self.tokenizer.vocab_size, -1e4, dtype=np.float32)
+		logits[next_token_id] = 0.0
+		return logits, length
+
+
+# backends selectable with Config['AUTODOC_BACKEND']
+BACKENDS = {
+	TFModelHandle.backend_name: TFModelHandle,
+	TorchModelHandle.backend_name: TorchModelHandle,
+	OnnxModelHandle.backend_name: OnnxModelHandle,
+	StubModelHandle.backend_name: StubModelHandle,
+}
+
+
+def check_backend(backend_name):
+	"""Raise ValueError when backend_name is unknown or its framework is not installed, without importing it."""
+	if backend_name not in BACKENDS:
+		raise ValueError('AUTODOC_BACKEND %r is not one of %s' % (backend_name, ', '.join(sorted(BACKENDS))))
+	framework_module = BACKENDS[backend_name].framework_module
+	if framework_module and importlib.util.find_spec(framework_module) is None:
+		raise ValueError(
+			'AUTODOC_BACKEND %r needs the %s package, which is not installed: pip install -r requirements-backends.txt, '
+			'or build the image with --build-arg INSTALL_AUTODOC_BACKENDS=true' % (backend_name, framework_module)
+		)
+
+
+def export_onnx(model_name, onnx_path):
+	"""Export model_name's PyTorch head model to an ONNX graph mapping input_ids to logits."""
+	import torch
+	from transformers import GPT2LMHeadModel
+
+	model = GPT2LMHeadModel.from_pretrained(model_name)
+	model.eval()
+	# plain logits output, no cache, so the graph has one input and one output
+	model.config.use_cache = False
+	model.config.return_dict = False
+
+	class LogitsOnly(torch.nn.Module):
+		def __init__(self, model):
+			super(LogitsOnly, self).__init__()
+			self.model = model
+
+		def forward(self, input_ids):
+			return self.model(input_ids)[0]
+
+	example_ids = torch.tensor([[464, 2068, 7586, 21831]], dtype=torch.long)
+	torch.onnx.export(
+		LogitsOnly(model),
+		(example_ids,),
+		onnx_path,
+		input_names=['input_ids'],
+		output_names=['logits'],
+		dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'}, 'logits': {0: 'batch', 1: 'sequence'}},
+		opset_version=12
+	)
+	return onnx_path
@@ -0,0 +1,159 @@
+# thin client of the model server, used by web workers when AUTODOC_INFERENCE_MODE is 'remote'
+# one keep-alive connection per thread, socket timeouts on every call and a cached health check
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+
+class ModelServerError(Exception):
+	"""The model server is unreachable, unhealthy or returned an error."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+	"""HTTPConnection over a unix socket path."""
+
+	def __init__(self, socket_path, timeout=None):
+		http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+		self.socket_path = socket_path
+
+	def connect(self):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.settimeout(self.timeout)
+		self.sock.connect(self.socket_path)
+
+
+class RemoteTokenStream(object):
+	"""Token ids streamed from the model server, iterated like an IncrementalDecoder."""
+
+	def __init__(self, response, connection):
+		self._response = response
+		self._connection = connection
+		# filled while iterating
+		self.new_token_ids = []
+		self.stop_reason = None
+
+	def __iter__(self):
+		try:
+			for line in self._response:
+				message = json.loads(line)
+				if 'stop_reason' in message:
+					self.stop_reason = message['stop_reason']
+					break
+				self.new_token_ids.append(message['token_id'])
+				yield message['token_id']
+			# read the terminating chunk, so the connection can be reused
+			self._response.read()
+		except (OSError, http.client.HTTPException, ValueError) as error:
+			self._connection.close()
+			raise ModelServerError('model server stream failed: %r' % error)
+
+
+class ModelServerClient(object):
+	"""Calls to one model server url, safe to share between threads."""
+
+	def __init__(self, url, timeout=60, health_seconds=10):
+		self.url = url
+		self.timeout = timeout
+		self.health_seconds = health_seconds
+		# connections are per thread and per process, a forked worker opens its own
+		self._local = threading.local()
+		self._pid = os.getpid()
+		self._healthy_until = 0
+
+	def _new_connection(self):
+		if self.url.startswith('unix://'):
+			return UnixHTTPConnection(self.url[len('unix://'):], timeout=self.timeout)
+		host, port = self.url.split('://', 1)[-1].rstrip('/').rsplit(':', 1)
+		return http.client.HTTPConnection(host, int(port), timeout=self.timeout)
+
+	def _connection(self):
+		if self._pid != os.getpid():
+			self._local = threading.local()
+			self._pid = os.getpid()
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = self._local.connection = self._new_connection()
+		return connection
+
+	def _request(self, method, path, data=None):
+		body = json.dumps(data).encode('utf-8') if data is not None else None
+		headers = {'Content-Type': 'application/json'} if body is not None else {}
+		# a kept-alive connection may have been closed by the server, retry once on a fresh one
+		for attempt in range(2):
+			connection = self._connection()
+			try:
+				connection.request(method, path, body=body, headers=headers)
+				return connection, connection.getresponse()
+			except (ConnectionError, http.client.RemoteDisconnected, http.client.CannotSendRequest) as error:
+				connection.close()
+				self._local.connection = None
+				if attempt:
+					raise ModelServerError('model server %s unreachable: %r' % (self.url, error))
+			except (OSError, http.client.HTTPException) as error:
+				# timeouts are not retried, the server may still be working on the request
+				connection.close()
+				self._local.connection = None
+				raise ModelServerError('model server %s %s failed: %r' % (self.url, path, error))
+
+	def _json(self, method, path, data=None):
+		connection, response = self._request(method, path, data)
+		try:
+			result = json.loads(response.read())
+		except (OSError, http.client.HTTPException, ValueError) as error:
+			connection.close()
+			raise ModelServerError('model server %s %s failed: %r' % (self.url, path, error))
+		if response.status != 200:
+			raise ModelServerError('model server %s %s returned %s: %s' % (self.url, path, response.status, result.get('error')))
+		return result
+
+	def health(self):
+		"""Server pid, memory and loaded models; raises ModelServerError if it does not answer."""
+		return self._json('GET', '/health')
+
+	def check_health(self):
+		"""Raise ModelServerError unless the server passed a health check within health_seconds."""
+		now = time.monotonic()
+		if now < self._healthy_until:
+			return
+		self.health()
+		self._healthy_until = now + self.health_seconds
+
+	def generate(self, token_ids, profile_name):
+		"""Generate an autodoc on the server, returns a dict of AutodocResult fields."""
+		self.check_health()
+		try:
+			return self._json('POST', '/generate', {'token_ids': list(token_ids), 'profile_name': profile_name})
+		except ModelServerError:
+			# check again next time instead of trusting the last health check
+			self._healthy_until = 0
+			raise
+
+	def stream(self, token_ids, profile_name):
+		"""Stream an autodoc's new token ids from the server."""
+		self.check_health()
+		connection, response = self._request('POST', '/stream', {'token_ids': list(token_ids), 'profile_name': profile_name})
+		if response.status != 200:
+			self._healthy_until = 0
+			raise ModelServerError('model server %s /stream returned %s: %s' % (self.url, response.status, response.read()))
+		return RemoteTokenStream(response, connection)
+
+
+# client per url, shared by every thread of a worker process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(config):
+	"""Return the shared client for Config['AUTODOC_MODEL_SERVER_URL']."""
+	url = config['AUTODOC_MODEL_SERVER_URL']
+	with _clients_lock:
+		client = _clients.get(url)
+		if client is None:
+			print('Using autodoc model server ', url, file=sys.stderr)
+			client = ModelServerClient(url, config['AUTODOC_MODEL_SERVER_TIMEOUT'], config['AUTODOC_MODEL_SERVER_HEALTH_SECONDS'])
+			_clients[url] = client
+	return client
@@ -0,0 +1,139 @@
+# process-wide registry of tokenizers and head models
+# each worker process loads a given backend and model name once and shares the handle between requests
+import os
+import resource
+import sys
+import threading
+import time
+
+# backend implementations, frameworks are imported when a backend loads
+from project.static.src.models.backends import BACKENDS
+
+
+# lock guarding the registry dictionaries while a model is being loaded
+_registry_lock = threading.Lock()
+
+# loaded handles, keyed by backend, model name and pinned version
+_handles = {}
+
+# tokenizers loaded on their own, for processes which tokenize but never generate
+_tokenizers = {}
+
+
+def resident_memory_mb():
+	"""Current resident set size of this process in megabytes."""
+	# /proc is accurate on linux, which is what the containers run
+	try:
+		with open('/proc/self/statm') as statm:
+			resident_pages = int(statm.read().split()[1])
+		return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+	except (OSError, ValueError, IndexError):
+		# fall back to peak rss, reported in kilobytes on linux
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_handle(model_name="gpt2", backend="tensorflow", options=None, version=None):
+	"""Return the shared handle for model_name (pinned to version, if given) on backend, loading it on first use."""
+	key = (backend, model_name, version)
+	# fast path, no locking once the model is loaded
+	handle = _handles.get(key)
+	if handle is not None:
+		return handle
+
+	with _registry_lock:
+		# another thread may have loaded it while we waited on the lock
+		handle = _handles.get(key)
+		if handle is not None:
+			return handle
+
+		print('Loading model into registry: ', backend, model_name, version or 'hub', file=sys.stderr)
+		handle = BACKENDS[backend](model_name, options)
+		handle.rss_before_mb = resident_memory_mb()
+		load_start = time.perf_counter()
+
+		# set tokenizer and model
+		handle.load()
+
+		handle.load_seconds = time.perf_counter() - load_start
+		handle.rss_after_mb = resident_memory_mb()
+		_handles[key] = handle
+
+		print('Loaded model ', backend, model_name, ' in %.2fs, rss %.0fMB -> %.0fMB' % (handle.load_seconds, handle.rss_before_mb, handle.rss_after_mb), file=sys.stderr)
+
+	return handle
+
+
+def model_identity(config):
+	"""Model name and pinned version named in config, recorded with every autodoc."""
+	return '%s@%s' % (config['AUTODOC_MODEL_NAME'], config['AUTODOC_MODEL_VERSION'] or 'hub')
+
+
+def configured_options(config):
+	"""Backend options named in config, including the pinned artifact directory if a version is set."""
+	options = {'onnx_path': config['AUTODOC_ONNX_PATH']}
+	if config['AUTODOC_MODEL_VERSION']:
+		from project.static.mlmodels.seedmlmodels.headmodel import artifact_dir
+		options['artifact_dir'] = artifact_dir(config['AUTODOC_MODEL_STORE'], config['AUTODOC_MODEL_NAME'], config['AUTODOC_MODEL_VERSION'])
+	return options
+
+
+def get_configured_handle(config):
+	"""Return the shared handle for the model, version and backend named in config."""
+	return get_handle(
+		config['AUTODOC_MODEL_NAME'],
+		config['AUTODOC_BACKEND'],
+		configured_options(config),
+		config['AUTODOC_MODEL_VERSION']
+	)
+
+
+def get_tokenizer(config):
+	"""Return the shared tokenizer for the model and backend named in config, without loading the model."""
+	key = (config['AUTODOC_BACKEND'], config['AUTODOC_MODEL_NAME'], config['AUTODOC_MODEL_VERSION'])
+	# reuse the tokenizer of a model that is already loaded
+	handle = _handles.get(key)
+	if handle is not None:
+		return handle.tokenizer
+
+	with _registry_lock:
+		tokenizer = _tokenizers.get(key)
+		if tokenizer is None:
+			tokenizer = BACKENDS[key[0]](key[1], configured_options(config)).load_tokenizer()
+			_tokenizers[key] = tokenizer
+	return tokenizer
+
+
+def warmup(handle, prompt="Hello, world."):
+	"""Run one short generate on handle so the first real request does not build the graph."""
+	warmup_start = time.perf_counter()
+	# encode a tiny prompt and generate a few tokens with the same decoding path as autodocs
+	token_ids = handle.encode(prompt)
+	handle.generate(
+		[token_ids],
+		max_length=len(token_ids) + 4,
+		num_beams=2,
+		no_repeat_ngram_size=4,
+		early_stopping=True
+	)
+	handle.warmup_seconds = time.perf_counter() - warmup_start
+
+	print('Warmed up model ', handle.backend_name, handle.model_name, ' in %.2fs' % handle.warmup_seconds, file=sys.stderr)
+
+	return handle
+
+
+def registry_stats():
+	"""Load time, warmup time and resident memory for every loaded model."""
+	stats = {
+		'pid': os.getpid(),
+		'rss_mb': resident_memory_mb(),
+		'models': {}
+	}
+	for (backend, model_name, version), handle in _handles.items():
+		stats['models']['%s:%s@%s' % (backend, model_name, version or 'hub')] = {
+			'load_seconds': handle.load_seconds,
+			'warmup_seconds': handle.warmup_seconds,
+			'rss_before_mb': handle.rss_before_mb,
+			'rss_after_mb': handle.rss_after_mb,
+		}
+	return stats
@@ -0,0 +1,168 @@
+# inference server owning the only copy of the autodoc model
+# run with manage.py model_server, web workers reach it through modelclient over loopback http or a unix socket
+# requests are json: /generate returns the finished autodoc, /stream returns one json line per generated token
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+	"""Health, generate and stream endpoints, every request runs inside the flask app context."""
+
+	# keep-alive, so each web worker thread reuses one connection
+	protocol_version = 'HTTP/1.1'
+
+	def _read_json(self):
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+		except ValueError:
+			# without a length the body cannot be skipped, so the connection cannot be reused
+			self.close_connection = True
+			raise ValueError('bad Content-Length')
+		return json.loads(self.rfile.read(length) or b'{}')
+
+	def _check_request(self, request):
+		# ValueError saying what is wrong with the body of a generate or stream request
+		if not isinstance(request, dict):
+			raise ValueError('body must be a json object')
+		token_ids = request.get('token_ids')
+		if not isinstance(token_ids, list) or not token_ids or \
+			not all(isinstance(token_id, int) and not isinstance(token_id, bool) and token_id >= 0 for token_id in token_ids):
+			raise ValueError('token_ids must be a non-empty list of token ids')
+		profile_name = request.get('profile_name')
+		if profile_name is not None and not isinstance(profile_name, str):
+			raise ValueError('profile_name must be a string')
+
+	def _send_json(self, data, status=200):
+		body = json.dumps(data).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_chunk(self, data):
+		# one json line per chunk, chunked encoding keeps the connection reusable after the stream
+		line = (json.dumps(data) + '\n').encode('utf-8')
+		self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+		self.wfile.flush()
+
+	def do_GET(self):
+		if self.path != '/health':
+			return self._send_json({'error': 'not found'}, status=404)
+		from project.static.src.models.modelregistry import registry_stats
+		self._send_json(dict(registry_stats(), status='ok'))
+
+	def do_POST(self):
+		# a malformed body gets a 400, never a dropped connection the client would retry
+		try:
+			request = self._read_json()
+		except ValueError as error:
+			return self._send_json({'error': 'bad request: %s' % error}, status=400)
+		# the body is read before any answer, so the kept-alive connection stays in sync
+		if self.path not in ('/generate', '/stream'):
+			return self._send_json({'error': 'not found'}, status=404)
+		try:
+			self._check_request(request)
+		except ValueError as error:
+			return self._send_json({'error': 'bad request: %s' % error}, status=400)
+
+		with self.server.app.app_context():
+			config = self.server.app.config
+			profile_name = request.get('profile_name') or config['AUTODOC_DECODING_PROFILE']
+			if profile_name not in config['AUTODOC_DECODING_PROFILES']:
+				return self._send_json({'error': 'unknown profile %s' % profile_name}, status=400)
+			if self.path == '/generate':
+				return self._generate(request['token_ids'], profile_name)
+			return self._stream(request['token_ids'], profile_name)
+
+	def _generate(self, token_ids, profile_name):
+		from project.static.src.evaluation.autodocwriter import _autodocgenerate
+		request_start = time.perf_counter()
+		try:
+			# deadlines, fallbacks and batching happen here, shared by every web worker
+			result = _autodocgenerate(token_ids, profile_name, profile_name)
+		except Exception as error:
+			print('Model server generate failed: ', repr(error), file=sys.stderr)
+			return self._send_json({'error': repr(error)}, status=500)
+		self._send_json(result._asdict())
+		print('Model server generated %s tokens of prompt in %.2fs' % (len(token_ids), time.perf_counter() - request_start), file=sys.stderr)
+
+	def _stream(self, token_ids, profile_name):
+		from project.static.src.models.modelregistry import get_configured_handle
+		from project.static.src.evaluation.autodocwriter import profile_decoder
+		config = self.server.app.config
+		profile = config['AUTODOC_DECODING_PROFILES'][profile_name]
+		decoder = profile_decoder(get_configured_handle(config), token_ids, profile, time.perf_counter() + profile['deadline_seconds'])
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/x-ndjson')
+		self.send_header('Transfer-Encoding', 'chunked')
+		self.end_headers()
+		for token_id in decoder:
+			self._send_chunk({'token_id': token_id})
+		self._send_chunk({'stop_reason': decoder.stop_reason})
+		# zero length chunk ends the response
+		self.wfile.write(b'0\r\n\r\n')
+		self.wfile.flush()
+
+	def address_string(self):
+		# unix socket clients have no address
+		return self.client_address[0] if self.client_address else 'unix'
+
+	def log_message(self, format, *args):
+		print('Model server ', self.address_string(), ' ', format % args, file=sys.stderr)
+
+
+class ModelServer(ThreadingHTTPServer):
+	"""Threaded http server holding the flask app the handlers run in."""
+
+	daemon_threads = True
+
+	def __init__(self, server_address, app):
+		self.app = app
+		ThreadingHTTPServer.__init__(self, server_address, ModelRequestHandler)
+
+
+class UnixModelServer(ModelServer):
+	"""ModelServer listening on a unix socket path instead of a tcp port."""
+
+	address_family = socket.AF_UNIX
+
+	def server_bind(self):
+		# a socket left over from a previous run would make bind fail
+		if os.path.exists(self.server_address):
+			os.unlink(self.server_address)
+		socketserver.TCPServer.server_bind(self)
+		self.server_name = 'localhost'
+		self.server_port = 0
+
+
+def create_server(app, url):
+	"""Server for app listening on url, http://host:port or unix:///path."""
+	if url.startswith('unix://'):
+		return UnixModelServer(url[len('unix://'):], app)
+	host, port = url.split('://', 1)[-1].rstrip('/').rsplit(':', 1)
+	return ModelServer((host, int(port)), app)
+
+
+def serve(app, url, warmup=True):
+	"""Load the configured model, optionally warm it up, and serve until interrupted."""
+	from project.static.src.models import modelregistry
+	# this process is the model server, it must never forward generation to itself
+	app.config['AUTODOC_INFERENCE_MODE'] = 'local'
+	with app.app_context():
+		handle = modelregistry.get_configured_handle(app.config)
+		if warmup:
+			modelregistry.warmup(handle)
+
+	server = create_server(app, url)
+	print('Model server listening on ', url, ' pid ', os.getpid(), file=sys.stderr)
+	try:
+		server.serve_forever()
+	finally:
+		server.server_close()
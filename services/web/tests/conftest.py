@@ -0,0 +1,71 @@
+"""Test setup: the app on a throwaway sqlite database."""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+
+
+# the app reads its config from the environment when project is first imported
+_database_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'test.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+# deterministic model without a deep learning framework
+os.environ.setdefault('AUTODOC_BACKEND', 'stub')
+
+
+@compiles(CreateColumn, 'sqlite')
+def _composite_key_id(element, compiler, **kw):
+    # sqlite only autoincrements a lone INTEGER PRIMARY KEY, so the autoincrementing id of the
+    # composite keys of retentions and revisions is a plain column here and tests assign it
+    column = element.element
+    if column.primary_key and column.autoincrement is True and len(column.table.primary_key.columns) > 1:
+        return '%s %s NOT NULL' % (
+            compiler.preparer.format_column(column),
+            compiler.dialect.type_compiler.process(column.type)
+        )
+    return compiler.visit_create_column(element, **kw)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from project import app
+    app.config['TESTING'] = True
+    # templates link the asset bundles without rebuilding them into the source tree
+    app.config['ASSETS_AUTO_BUILD'] = False
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from project import db
+    from project import identitycache
+    with app.app_context():
+        db.drop_all(bind=None)
+        db.create_all(bind=None)
+        # user ids are reused by every test, cached identities of earlier tests are stale
+        identitycache._memory.clear()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(db):
+    """Add an approved user of user_type to the session, without committing."""
+    from project.models import User
+
+    def make_user(name, user_type):
+        user = User(name=name, email='%s@test.com' % name, organization='TestCo', user_type=user_type, user_status='approved')
+        user.set_password('123456')
+        db.session.add(user)
+        return user
+    return make_user
+
+
+@pytest.fixture
+def handle(app):
+    # the configured stub model handle, inside an app context for the code reading current_app.config
+    from project.static.src.models.modelregistry import get_configured_handle
+    with app.app_context():
+        yield get_configured_handle(app.config)
@@ -0,0 +1,40 @@
+"""Micro-batched generations, on the stub backend."""
+from project.static.src.evaluation import autodocwriter
+from project.static.src.evaluation.autodoctiming import timed_generation
+
+
+PROMPT = list(b'The quarterly report covers')
+
+
+def test_batched_generation_is_decoded_and_counted_by_the_writer(app, handle, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTODOC_BATCH_ENABLED', True)
+    monkeypatch.setitem(app.config, 'AUTODOC_TIMINGS', 'log')
+    with timed_generation() as timing:
+        result = autodocwriter._autodocgenerate(PROMPT, 'quality', 'quality')
+    assert result.fallback is None
+    assert result.autodoc_body.startswith('The quarterly report covers')
+    assert 'decode' in dict(timing.stages)
+    assert timing.new_tokens == len(result.autodoc_body) - len(PROMPT)
+
+
+def test_prompts_of_different_lengths_are_not_padded_together_without_left_padding_support(handle, monkeypatch):
+    from project.static.src.evaluation.autodocbatcher import GenerationBatcher
+
+    batcher = GenerationBatcher(handle, max_new_tokens=8)
+    prompts = [PROMPT, list(b'Minutes of'), list(b'Minutes to')]
+    alone = [batcher.generate_batch([token_ids])[0] for token_ids in prompts]
+
+    calls = []
+    generate = handle.generate
+
+    def counted_generate(batch_ids, attention_mask=None, **kwargs):
+        calls.append((len(batch_ids), attention_mask))
+        return generate(batch_ids, attention_mask=attention_mask, **kwargs)
+
+    monkeypatch.setattr(handle, 'left_padding_safe', False)
+    monkeypatch.setattr(handle, 'generate', counted_generate)
+    outputs = batcher.generate_batch(prompts)
+
+    # one generate per prompt length, none of them padded
+    assert sorted(calls, key=lambda call: call[0]) == [(1, None), (2, None)]
+    assert outputs == alone
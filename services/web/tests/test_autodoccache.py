@@ -0,0 +1,40 @@
+"""Autodoc cache keys and the persistent tier."""
+from project.models import User
+from project.static.src.evaluation import autodoccache
+from project.static.data.processeddata.autodocsmodels import AutodocCacheEntry
+
+
+TOKEN_IDS = [464, 2068, 7586]
+MODEL = 'gpt2@hub'
+PARAMS = {'max_new_tokens': 64, 'num_beams': 5, 'strategy': 'beam'}
+
+
+def test_cache_key_ignores_parameter_order_and_sequence_type():
+    key = autodoccache.cache_key(TOKEN_IDS, MODEL, PARAMS)
+    assert autodoccache.cache_key(tuple(TOKEN_IDS), MODEL, dict(reversed(list(PARAMS.items())))) == key
+    # stored keys of earlier runs stay valid
+    assert autodoccache.cache_key(TOKEN_IDS, MODEL, PARAMS) == key
+    assert len(key) == 64
+
+
+def test_cache_key_changes_with_prompt_model_and_parameters():
+    key = autodoccache.cache_key(TOKEN_IDS, MODEL, PARAMS)
+    assert autodoccache.cache_key(TOKEN_IDS + [13], MODEL, PARAMS) != key
+    assert autodoccache.cache_key(TOKEN_IDS, 'distilgpt2@hub', PARAMS) != key
+    assert autodoccache.cache_key(TOKEN_IDS, MODEL, dict(PARAMS, num_beams=4)) != key
+
+
+def test_duplicate_insert_keeps_the_callers_pending_work(db, make_user):
+    key = autodoccache.cache_key(TOKEN_IDS, MODEL, PARAMS)
+    autodoccache.store(key, 'first body', 16, True)
+    db.session.commit()
+
+    # another process stored the key meanwhile, the memory tier of this one does not know it
+    autodoccache.clear_memory()
+    make_user('pending', 'seller')
+    autodoccache.store(key, 'second body', 16, True)
+    db.session.commit()
+
+    assert User.query.filter_by(name='pending').count() == 1
+    assert [entry.autodoc_body for entry in AutodocCacheEntry.query.all()] == ['first body']
+    autodoccache.clear_memory()
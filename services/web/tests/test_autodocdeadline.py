@@ -0,0 +1,53 @@
+"""Beam searches that miss their deadline fall back without leaving the model locked."""
+import time
+
+import pytest
+
+from project.static.src.evaluation import autodocwriter
+
+
+PROMPT = list(b'The quarterly report covers')
+
+
+@pytest.fixture
+def late_quality(app, monkeypatch):
+    # a beam profile whose deadline has always passed by the time anyone waits on it
+    profiles = app.config['AUTODOC_DECODING_PROFILES']
+    monkeypatch.setitem(profiles, 'quality', dict(profiles['quality'], deadline_seconds=0.0))
+
+
+def wait_for(condition, seconds=5):
+    stop = time.perf_counter() + seconds
+    while not condition() and time.perf_counter() < stop:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_generate_stops_at_a_passed_deadline(handle):
+    output = handle.generate([PROMPT], deadline=time.perf_counter(), max_length=len(PROMPT) + 64)
+    assert output == [PROMPT]
+
+
+def test_missed_beam_search_falls_back_and_releases_the_model(handle, late_quality):
+    result = autodocwriter._autodocgenerate(PROMPT, 'quality', 'quality')
+    assert result.fallback == 'fast'
+    assert result.autodoc_body
+    # the stub stops the late search itself, nothing is left holding the generate lock
+    assert not autodocwriter.search_abandoned(handle)
+    assert wait_for(lambda: not handle.lock.locked())
+
+
+def test_search_that_cannot_stop_sends_later_requests_to_the_fallback(handle, late_quality, monkeypatch):
+    monkeypatch.setattr(handle, 'stops_at_deadline', False)
+    # a search that cannot stop, still running on the model
+    handle.lock.acquire()
+    try:
+        assert autodocwriter._autodocgenerate(PROMPT, 'quality', 'quality').fallback == 'fast'
+        assert autodocwriter.search_abandoned(handle)
+        abandoned = set(autodocwriter._abandoned_searches[handle])
+        # the second request goes straight to the fallback instead of queueing another search
+        assert autodocwriter._autodocgenerate(PROMPT, 'quality', 'quality').fallback == 'fast'
+        assert autodocwriter._abandoned_searches[handle] == abandoned
+    finally:
+        handle.lock.release()
+    assert wait_for(lambda: not autodocwriter.search_abandoned(handle))
@@ -0,0 +1,28 @@
+"""Debounced regeneration after document edits."""
+from datetime import datetime, timedelta
+
+from project.static.src.evaluation.autodocedits import schedule_regeneration
+from project.static.data.processeddata.autodocsmodels import AutodocJob
+
+
+def test_regeneration_folds_into_the_waiting_job(app, db, monkeypatch):
+    # jobs stay queued for an external worker
+    monkeypatch.setitem(app.config, 'AUTODOC_QUEUE_MODE', 'external')
+    job_id = schedule_regeneration(7).id
+    first_run_after = AutodocJob.query.get(job_id).run_after
+    assert first_run_after > datetime.utcnow()
+
+    assert schedule_regeneration(7) is None
+    jobs = AutodocJob.query.filter_by(document_id=7).all()
+    assert [job.id for job in jobs] == [job_id]
+    assert jobs[0].run_after >= first_run_after
+
+
+def test_due_regeneration_is_not_pushed_back(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTODOC_QUEUE_MODE', 'external')
+    job_id = schedule_regeneration(7).id
+    AutodocJob.query.get(job_id).run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert schedule_regeneration(7).id != job_id
+    assert AutodocJob.query.filter_by(document_id=7).count() == 2
@@ -0,0 +1,48 @@
+"""Claiming autodoc jobs counts every attempt and stops at AUTODOC_JOB_MAX_ATTEMPTS."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from project.static.src.evaluation import autodocqueue
+from project.static.data.processeddata.autodocsmodels import AutodocJob
+
+
+def add_job(db, job_status, attempts, updated_on=None):
+    job = AutodocJob(
+        # no such document, so a claimed job fails while generating
+        document_id=999,
+        job_status=job_status,
+        attempts=attempts,
+        created_on=datetime.utcnow(),
+        updated_on=updated_on or datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def stale(app):
+    return datetime.utcnow() - timedelta(seconds=app.config['AUTODOC_JOB_STALE_SECONDS'] + 60)
+
+
+def test_failed_run_is_counted_once(app, db):
+    job_id = add_job(db, autodocqueue.JOB_PENDING, 0)
+    assert autodocqueue.run_job(app, job_id)
+    job = AutodocJob.query.get(job_id)
+    assert (job.job_status, job.attempts) == (autodocqueue.JOB_FAILED, 1)
+
+
+def test_stale_running_job_is_reclaimed_as_a_new_attempt(app, db):
+    job_id = add_job(db, autodocqueue.JOB_RUNNING, 1, stale(app))
+    assert job_id in autodocqueue.runnable_jobs(app)
+    autodocqueue.run_job(app, job_id)
+    assert AutodocJob.query.get(job_id).attempts == 2
+
+
+@pytest.mark.parametrize('job_status', [autodocqueue.JOB_FAILED, autodocqueue.JOB_RUNNING])
+def test_job_out_of_attempts_is_never_claimed(app, db, job_status):
+    job_id = add_job(db, job_status, app.config['AUTODOC_JOB_MAX_ATTEMPTS'], stale(app))
+    assert job_id not in autodocqueue.runnable_jobs(app)
+    assert not autodocqueue.run_job(app, job_id)
+    job = AutodocJob.query.get(job_id)
+    assert (job.job_status, job.attempts) == (job_status, app.config['AUTODOC_JOB_MAX_ATTEMPTS'])
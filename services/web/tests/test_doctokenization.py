@@ -0,0 +1,23 @@
+"""Packed document token ids."""
+from project.static.src.features.doctokenization import pack_token_ids, unpack_token_ids
+
+
+def test_gpt2_token_ids_pack_two_bytes_each():
+    token_ids = [0, 464, 50256]
+    packed = pack_token_ids(token_ids)
+    assert packed[0] == 2
+    assert len(packed) == 1 + 2 * len(token_ids)
+    assert unpack_token_ids(packed) == token_ids
+
+
+def test_token_ids_beyond_two_bytes_pack_four_bytes_each():
+    token_ids = [464, 65535, 65536, 250000]
+    packed = pack_token_ids(token_ids)
+    assert packed[0] == 4
+    assert len(packed) == 1 + 4 * len(token_ids)
+    assert unpack_token_ids(packed) == token_ids
+
+
+def test_packing_is_little_endian_and_handles_empty_documents():
+    assert pack_token_ids([1, 256]) == b'\x02\x01\x00\x00\x01'
+    assert unpack_token_ids(pack_token_ids([])) == []
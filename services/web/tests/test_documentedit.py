@@ -0,0 +1,88 @@
+"""Queries issued by the document edit pages."""
+from datetime import datetime
+
+import pytest
+from flask_login import login_user
+from flask_principal import Identity, identity_changed
+from sqlalchemy import event
+from werkzeug.exceptions import Forbidden
+
+
+# queries a GET of an edit page may issue once the user is logged in and the identity is loaded
+MAX_EDIT_PAGE_QUERIES = 2
+
+
+@pytest.fixture
+def edit_data(db, make_user):
+    """A sponsor and an editor sharing two documents, one with an autodoc and one whose autodoc job is still pending."""
+    from project.models import Document, Retention
+    from project.static.data.processeddata.autodocsmodels import Autodoc, Revision, AutodocJob
+    sponsor = make_user('sponsor', 'sponsor')
+    editor = make_user('editor', 'editor')
+    other_sponsor = make_user('othersponsor', 'sponsor')
+    written = Document(document_name='Minutes', document_body='The meeting started on time.', created_on=datetime.utcnow())
+    pending = Document(document_name='Agenda', document_body='Items for the next meeting.', created_on=datetime.utcnow())
+    autodoc = Autodoc(autodoc_body='The meeting started on time and ended early.', created_on=datetime.utcnow())
+    db.session.add_all([written, pending, autodoc])
+    db.session.flush()
+    # composite key ids are assigned here, see conftest
+    db.session.add_all([
+        Retention(id=1, sponsor_id=sponsor.id, editor_id=editor.id, document_id=written.id),
+        Retention(id=2, sponsor_id=sponsor.id, editor_id=editor.id, document_id=pending.id),
+        Revision(id=1, document_id=written.id, autodoc_id=autodoc.id),
+        AutodocJob(document_id=pending.id, job_status='running', attempts=1, created_on=datetime.utcnow()),
+    ])
+    db.session.commit()
+    return {'sponsor': sponsor, 'editor': editor, 'other_sponsor': other_sponsor, 'written': written, 'pending': pending}
+
+
+def get_edit_page(app, db, endpoint, user, document_id):
+    """Render a GET of endpoint as user, returns the page and the SQL statements the view issued."""
+    statements = []
+
+    def count_statement(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.test_request_context('/'):
+        # logging in and loading the identity happen before the view, they are not counted
+        login_user(user)
+        identity_changed.send(app, identity=Identity(user.id, user.user_type))
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            page = app.view_functions[endpoint](document_id=str(document_id))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return page, statements
+
+
+@pytest.mark.parametrize('permission_mode', ['lookup', 'needs'])
+@pytest.mark.parametrize('document_key', ['written', 'pending'])
+def test_sponsor_edit_page_queries(app, db, edit_data, monkeypatch, permission_mode, document_key):
+    monkeypatch.setitem(app.config, 'DOCUMENT_PERMISSION_MODE', permission_mode)
+    document = edit_data[document_key]
+    page, statements = get_edit_page(app, db, 'sponsor_bp.documentedit_sponsor', edit_data['sponsor'], document.id)
+    assert document.document_name in page
+    assert 'editor' in page
+    assert len(statements) <= MAX_EDIT_PAGE_QUERIES, statements
+
+
+@pytest.mark.parametrize('permission_mode', ['lookup', 'needs'])
+@pytest.mark.parametrize('document_key', ['written', 'pending'])
+def test_editor_edit_page_queries(app, db, edit_data, monkeypatch, permission_mode, document_key):
+    monkeypatch.setitem(app.config, 'DOCUMENT_PERMISSION_MODE', permission_mode)
+    document = edit_data[document_key]
+    page, statements = get_edit_page(app, db, 'editor_bp.documentedit_editor', edit_data['editor'], document.id)
+    assert document.document_name in page
+    assert len(statements) <= MAX_EDIT_PAGE_QUERIES, statements
+
+
+def test_edit_page_shows_pending_job_status(app, db, edit_data):
+    page, statements = get_edit_page(app, db, 'sponsor_bp.documentedit_sponsor', edit_data['sponsor'], edit_data['pending'].id)
+    assert 'Machine generated text running' in page
+
+
+@pytest.mark.parametrize('permission_mode', ['lookup', 'needs'])
+def test_edit_page_forbidden_to_other_sponsor(app, db, edit_data, monkeypatch, permission_mode):
+    monkeypatch.setitem(app.config, 'DOCUMENT_PERMISSION_MODE', permission_mode)
+    with pytest.raises(Forbidden):
+        get_edit_page(app, db, 'sponsor_bp.documentedit_sponsor', edit_data['other_sponsor'], edit_data['written'].id)
@@ -0,0 +1,48 @@
+"""Shared identity cache rows are written without committing the request's session."""
+import pytest
+from sqlalchemy import event
+
+from project.identitycache import cached_identity, invalidate_identity
+from project.models import IdentityCacheEntry
+
+
+@pytest.fixture
+def sponsor(app, db, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'IDENTITY_CACHE_DB', True)
+    user = make_user('sponsor', 'sponsor')
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def session_commits(db):
+    commits = []
+
+    def count_commit(session):
+        commits.append(session)
+
+    event.listen(db.session, 'after_commit', count_commit)
+    yield commits
+    event.remove(db.session, 'after_commit', count_commit)
+
+
+def shared_user_ids(db):
+    with db.engine.connect() as connection:
+        return [row.user_id for row in connection.execute(IdentityCacheEntry.__table__.select())]
+
+
+def test_miss_stores_the_shared_row_on_its_own_connection(db, sponsor, session_commits):
+    assert cached_identity(sponsor.id).user_type == 'sponsor'
+    assert shared_user_ids(db) == [sponsor.id]
+    assert session_commits == []
+
+
+def test_invalidate_leaves_the_session_uncommitted(db, sponsor, session_commits):
+    cached_identity(sponsor.id)
+    sponsor.name = 'renamed'
+    invalidate_identity(sponsor.id)
+    assert shared_user_ids(db) == []
+    assert session_commits == []
+    # the change made before invalidating was never committed
+    db.session.rollback()
+    assert sponsor.name == 'sponsor'
@@ -0,0 +1,53 @@
+"""Answers of the model server to well formed and malformed requests."""
+import http.client
+import json
+import threading
+
+import pytest
+
+from project.static.src.models.modelserver import create_server
+
+
+@pytest.fixture
+def connection(app):
+    server = create_server(app, 'http://127.0.0.1:0')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # one kept-alive connection for every request of a test, like a web worker thread
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    yield connection
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def post(connection, path, body):
+    connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.mark.parametrize('body', [
+    '{}',
+    '[1, 2]',
+    'not json',
+    '{"token_ids": "72 105"}',
+    '{"token_ids": []}',
+    '{"token_ids": [72, true]}',
+    '{"token_ids": [72], "profile_name": 3}',
+])
+def test_malformed_request_is_bad_request(connection, body):
+    status, result = post(connection, '/generate', body)
+    assert status == 400
+    assert result['error'].startswith('bad request')
+    # the connection stays usable after the error
+    status, result = post(connection, '/generate', '{"token_ids": [72, 105]}')
+    assert status == 200
+    assert result['autodoc_body'].startswith('Hi')
+
+
+def test_unknown_path_is_not_found(connection):
+    status, result = post(connection, '/nope', '{"token_ids": [72, 105]}')
+    assert status == 404
+    status, result = post(connection, '/generate', '{"token_ids": [72, 105]}')
+    assert status == 200
@@ -0,0 +1,28 @@
+"""Prompt windows of long documents."""
+from project.static.src.features.promptwindow import build_window
+
+
+DOCUMENT = list(range(100))
+
+
+def test_document_within_the_budget_is_used_whole():
+    window = build_window(DOCUMENT[:20], 20)
+    assert (window.strategy, window.token_ids) == ('full', DOCUMENT[:20])
+
+
+def test_lead_tail_splits_the_budget_between_lead_sentence_and_tail():
+    window = build_window(DOCUMENT, 20, end_ids={4})
+    assert (window.strategy, window.lead_tokens, window.tail_start) == ('lead_tail', 5, 85)
+    assert window.token_ids == DOCUMENT[:5] + DOCUMENT[85:]
+
+
+def test_lead_sentence_longer_than_half_the_budget_leaves_only_the_tail():
+    window = build_window(DOCUMENT, 20, end_ids={12})
+    assert (window.strategy, window.lead_tokens, window.tail_start) == ('tail', 0, 80)
+    assert window.token_ids == DOCUMENT[80:]
+
+
+def test_lead_is_capped_by_lead_max_tokens():
+    window = build_window(DOCUMENT, 40, end_ids={12}, lead_max_tokens=8)
+    assert window.strategy == 'tail'
+    assert len(window.token_ids) == 40